@@ -6,22 +6,26 @@ def add_word_count_requirement():
     conn = psycopg2.connect(DATABASE_URL)
     cursor = conn.cursor()
     
-    # Add column for essay word count requirement
+    # Add the column, backfill per reading level (anything else gets 50), then
+    # set the default for new rows - sent as a single batch so it costs one
+    # round-trip. Only rows that are still NULL are touched, so re-running
+    # the script is a no-op.
     cursor.execute("""
         ALTER TABLE users 
-        ADD COLUMN IF NOT EXISTS essay_word_count_requirement INTEGER DEFAULT 50
-    """)
-    
-    # Set initial values based on current reading level
-    cursor.execute("""
+        ADD COLUMN IF NOT EXISTS essay_word_count_requirement INTEGER;
+        
         UPDATE users 
-        SET essay_word_count_requirement = CASE 
-            WHEN reading_level = 'beginner' THEN 50
-            WHEN reading_level = 'intermediate' THEN 150
-            WHEN reading_level = 'advanced' THEN 250
-            ELSE 50
-        END
-        WHERE essay_word_count_requirement IS NULL OR essay_word_count_requirement = 50
+        SET essay_word_count_requirement = v.requirement
+        FROM (VALUES ('beginner', 50), ('intermediate', 150), ('advanced', 250))
+            AS v(lvl, requirement)
+        WHERE users.reading_level = v.lvl AND users.essay_word_count_requirement IS NULL;
+        
+        UPDATE users 
+        SET essay_word_count_requirement = 50
+        WHERE essay_word_count_requirement IS NULL;
+        
+        ALTER TABLE users 
+        ALTER COLUMN essay_word_count_requirement SET DEFAULT 50;
     """)
     
     conn.commit()
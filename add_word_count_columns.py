@@ -3,10 +3,20 @@ Add word_count_min and word_count_max columns to users table
 """
 
 import psycopg2
+import psycopg2.extras
 import sys
 
 DATABASE_URL = ""
 
+# (word_count_min, word_count_max) per reading level
+LEVEL_WORD_COUNTS = {
+    'beginner': (150, 200),
+    'intermediate': (200, 250),
+    'advanced': (250, 300),
+}
+DEFAULT_WORD_COUNTS = (150, 200)
+UPDATE_BATCH_SIZE = 5000
+
 def add_word_count_columns():
     print("=" * 70)
     print("ADD WORD COUNT COLUMNS TO USERS TABLE")
@@ -51,33 +61,42 @@ def add_word_count_columns():
         else:
             print("\n[3] word_count_max column already exists")
         
-        conn.commit()
+        # DDL is transactional in Postgres, so the ALTERs and the backfill
+        # below share one transaction and a single commit
         
         # Set initial values based on reading level
         print("\n[4] Setting initial word count values based on reading level...")
         cursor.execute("""
-            UPDATE users 
-            SET word_count_min = CASE 
-                    WHEN reading_level = 'beginner' THEN 150
-                    WHEN reading_level = 'intermediate' THEN 200
-                    WHEN reading_level = 'advanced' THEN 250
-                    ELSE 150
-                END,
-                word_count_max = CASE 
-                    WHEN reading_level = 'beginner' THEN 200
-                    WHEN reading_level = 'intermediate' THEN 250
-                    WHEN reading_level = 'advanced' THEN 300
-                    ELSE 200
-                END
+            SELECT id, reading_level FROM users
             WHERE word_count_min IS NULL OR word_count_max IS NULL
         """)
+        rows = [
+            (user_id,) + LEVEL_WORD_COUNTS.get(reading_level, DEFAULT_WORD_COUNTS)
+            for user_id, reading_level in cursor.fetchall()
+        ]
+        
+        # Batched UPDATE ... FROM (VALUES ...) keyed on the primary key
+        psycopg2.extras.execute_values(
+            cursor,
+            """UPDATE users 
+               SET word_count_min = v.min_words, word_count_max = v.max_words
+               FROM (VALUES %s) AS v(id, min_words, max_words)
+               WHERE users.id = v.id""",
+            rows,
+            template="(%s, %s, %s)",
+            page_size=UPDATE_BATCH_SIZE
+        )
         
-        rows_updated = cursor.rowcount
+        rows_updated = len(rows)
         conn.commit()
         print(f"✓ Updated {rows_updated} users with initial word counts")
         
         # Verify
         print("\n[5] Verifying results...")
+        # Server-side cursor so large users tables are streamed in batches
+        # instead of being loaded into memory all at once
+        cursor = conn.cursor(name='verify_word_counts')
+        cursor.itersize = 1000
         cursor.execute("""
             SELECT id, full_name, reading_level, word_count_min, word_count_max
             FROM users
@@ -87,7 +106,7 @@ def add_word_count_columns():
         print("\n{:<5} {:<20} {:<15} {:<8} {:<8}".format("ID", "Name", "Level", "Min", "Max"))
         print("-" * 65)
         
-        for row in cursor.fetchall():
+        for row in cursor:
             print("{:<5} {:<20} {:<15} {:<8} {:<8}".format(
                 row[0] or 0,
                 (row[1] or 'Unknown')[:20],
@@ -96,6 +115,7 @@ def add_word_count_columns():
                 row[4] or 0
             ))
         
+        cursor.close()
         conn.close()
         
         print("\n" + "=" * 70)
@@ -3,23 +3,40 @@
 
 from fastapi import FastAPI, HTTPException, Depends, Request, BackgroundTasks
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import sqlite3
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 import bcrypt
 import jwt
 from datetime import datetime, timedelta
 import openai
 import os
 import json
+import re
+import asyncio
 from pathlib import Path
 import random
+import threading
+import time
 import traceback
-from openai import OpenAI
+import logging
+import logging.handlers
+import queue
+import sys
+import atexit
+import functools
+import hashlib
+import orjson
+from decimal import Decimal
+from contextlib import contextmanager
+from openai import AsyncOpenAI
 
 # Import our new utilities
 from readability import analyze_readability, get_difficulty_for_user
@@ -29,8 +46,34 @@ from content_generator import ContentGenerator
 import random
 
 
+# Logging goes through a queue so request handlers never block on stdout;
+# a listener thread does the actual writes. LOG_LEVEL=DEBUG for request traces.
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler(sys.stdout))
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    handlers=[logging.handlers.QueueHandler(_log_queue)],
+)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+log = logging.getLogger(__name__)
+
+def _orjson_default(obj):
+    """Fallback for types orjson doesn't handle natively (NUMERIC/AVG results)"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson instead of the stdlib encoder"""
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
 # Initialize FastAPI
-app = FastAPI(title="Achieve 365 - Phase 2")
+app = FastAPI(title="Achieve 365 - Phase 2", default_response_class=ORJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -41,11 +84,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Server-sent event routes; gzip would hold their events back in the compressor
+UNCOMPRESSED_PATHS = {"/api/read/sample/stream"}
+
+class JSONGZipMiddleware(GZipMiddleware):
+    """GZip large responses (admin student lists, histories), except event streams"""
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in UNCOMPRESSED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+app.add_middleware(JSONGZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "achieve-365-reading-secret-key-change-in-production")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 openai.api_key = OPENAI_API_KEY
 
+# bcrypt cost factors - student accounts use a cheaper cost so logins don't
+# queue behind hashing; admin accounts keep the library default
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "10"))
+BCRYPT_ADMIN_ROUNDS = int(os.getenv("BCRYPT_ADMIN_ROUNDS", "12"))
+
+# Local dev admin account (admin@mfs.org / admin123). The hash is precomputed
+# so startup doesn't spend a bcrypt round on a constant; set SEED_ADMIN=0 to skip it.
+SEED_ADMIN = os.getenv("SEED_ADMIN", "1") != "0"
+ADMIN_PASSWORD_HASH = "$2b$12$/pJajS6F05cstUtSDxIVhOiZgMmNvCVzM3QqqUty.y7eg.9qSgIo2"
+
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
@@ -54,9 +120,34 @@ if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
 USE_POSTGRES = DATABASE_URL is not None
 DATABASE = DATABASE_URL if USE_POSTGRES else "mfs_literacy.db"
 
+# Worker processes; Procfile/railway.json pass the same value (default 2) to
+# the uvicorn CLI, so the pool split below matches the real worker count
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "2")))
+
+# Connection pool sizing (PostgreSQL only). DB_POOL_TOTAL is the budget for
+# the whole deployment and is split across the workers, each of which has
+# its own pool; DB_POOL_MAX overrides the per-worker share directly.
+DB_POOL_TOTAL = int(os.getenv("DB_POOL_TOTAL", "20"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", max(1, DB_POOL_TOTAL // WEB_CONCURRENCY)))
+DB_POOL_MIN = min(int(os.getenv("DB_POOL_MIN", "1")), DB_POOL_MAX)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connections idle longer than this are pinged before reuse (server/proxy may have dropped them)
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+
+# Per-connection SQLite caches: parsed statements and page cache size in KiB
+SQLITE_STATEMENT_CACHE_SIZE = int(os.getenv("SQLITE_STATEMENT_CACHE_SIZE", "256"))
+SQLITE_CACHE_KIB = int(os.getenv("SQLITE_CACHE_KIB", "20000"))
+
 # Initialize content generator
 content_generator = ContentGenerator(OPENAI_API_KEY) if OPENAI_API_KEY else None
 
+# Shared async OpenAI client so requests reuse its HTTP connection pool
+# and don't hold a worker thread while waiting on the API
+# Per-call timeout (seconds) - the SDK default is 10 minutes
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT) if OPENAI_API_KEY else None
+INTEREST_QUESTIONS_MODEL = "gpt-4o-mini"
+
 print(f"Using {'PostgreSQL' if USE_POSTGRES else 'SQLite'} database")
 print(f"OpenAI API {'configured' if OPENAI_API_KEY else 'NOT configured'}")
 
@@ -103,6 +194,252 @@ class WritingRevision(BaseModel):
     revised_response: str
 
 # Database initialization
+
+# Bump whenever init_db() gains new schema changes so existing databases pick them up
+SCHEMA_VERSION = 13
+
+# How long init_db's ALTER TABLEs may wait for their lock
+SCHEMA_LOCK_TIMEOUT = os.getenv("SCHEMA_LOCK_TIMEOUT", "2s")
+
+# Phase 2 columns added to the original users table
+USERS_PHASE2_COLUMNS = [
+    ("age_band", "VARCHAR(20)"),
+    ("grade_band", "VARCHAR(20)"),
+    ("interest_tags", "JSONB"),
+    ("level_estimate", "VARCHAR(20)"),
+    ("words_per_session", "INTEGER DEFAULT 0"),
+    ("total_passages_read", "INTEGER DEFAULT 0"),
+    ("comprehension_score", "REAL DEFAULT 0"),
+    ("last_active", "TIMESTAMP"),
+    # Per-user lesson length range, raised by update_user_difficulty after essay level-ups
+    ("word_count_min", "INTEGER"),
+    ("word_count_max", "INTEGER"),
+]
+
+# Phase 2 tables, each with the indexes to build while it is still empty.
+# init_db and /api/admin/migrate create only the tables that are missing;
+# indexes added later on existing tables go through the CONCURRENTLY path
+# in init_db instead, so an upgrade never locks a populated table.
+PHASE2_TABLE_DDL = {
+    "passages": """
+    CREATE TABLE IF NOT EXISTS passages (
+        id SERIAL PRIMARY KEY,
+        title VARCHAR(255) NOT NULL,
+        content TEXT NOT NULL,
+        source VARCHAR(50) NOT NULL,
+        topic_tags JSONB,
+        word_count INTEGER NOT NULL,
+        readability_score REAL,
+        flesch_ease REAL,
+        difficulty_level VARCHAR(20),
+        estimated_minutes INTEGER,
+        approved BOOLEAN DEFAULT FALSE,
+        created_by INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        metadata TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_passages_difficulty ON passages(difficulty_level);
+    CREATE INDEX IF NOT EXISTS idx_passages_word_count ON passages(word_count);
+    CREATE INDEX IF NOT EXISTS idx_passages_approved ON passages(approved);
+    -- Reuse lookup for generated passages in /api/read/sample
+    CREATE INDEX IF NOT EXISTS idx_passages_cache_lookup
+        ON passages (difficulty_level, word_count) WHERE approved;
+    CREATE INDEX IF NOT EXISTS idx_passages_topic_tags_gin ON passages USING GIN (topic_tags);
+""",
+    "passage_questions": """
+    CREATE TABLE IF NOT EXISTS passage_questions (
+        id SERIAL PRIMARY KEY,
+        passage_id INTEGER NOT NULL,
+        question_text TEXT NOT NULL,
+        question_type VARCHAR(50),
+        correct_answer TEXT NOT NULL,
+        options TEXT,
+        explanation TEXT,
+        difficulty INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (passage_id) REFERENCES passages(id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_questions_passage ON passage_questions(passage_id);
+    CREATE INDEX IF NOT EXISTS idx_questions_passage_type ON passage_questions(passage_id, question_type);
+""",
+    "session_logs": """
+    CREATE TABLE IF NOT EXISTS session_logs (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        passage_id INTEGER NOT NULL,
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        completed_at TIMESTAMP,
+        completion_status VARCHAR(20),
+        time_spent_seconds INTEGER,
+        feedback VARCHAR(20),
+        comprehension_score REAL,
+        answers TEXT,
+        notes TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (passage_id) REFERENCES passages(id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_session_user ON session_logs(user_id);
+    CREATE INDEX IF NOT EXISTS idx_session_passage ON session_logs(passage_id);
+    -- Completed sessions by date for the admin analytics
+    CREATE INDEX IF NOT EXISTS idx_session_completed_started
+        ON session_logs (started_at) INCLUDE (user_id, passage_id)
+        WHERE completion_status = 'completed';
+    -- A student's recent sessions, and who was active in the last 7 days
+    CREATE INDEX IF NOT EXISTS idx_session_user_started ON session_logs(user_id, started_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_session_started ON session_logs(started_at) INCLUDE (user_id);
+""",
+    "writing_exercises": """
+    CREATE TABLE IF NOT EXISTS writing_exercises (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        passage_id INTEGER,
+        prompt TEXT NOT NULL,
+        user_response TEXT NOT NULL,
+        ai_feedback TEXT,
+        score REAL,
+        revised_response TEXT,
+        submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        revision_submitted_at TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (passage_id) REFERENCES passages(id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_writing_user_submitted ON writing_exercises(user_id, submitted_at DESC);
+""",
+    "vocabulary_tracker": """
+    CREATE TABLE IF NOT EXISTS vocabulary_tracker (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        word VARCHAR(100) NOT NULL,
+        definition TEXT,
+        encountered_count INTEGER DEFAULT 1,
+        mastered BOOLEAN DEFAULT FALSE,
+        context_passage_id INTEGER,
+        first_encountered TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_reviewed TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (context_passage_id) REFERENCES passages(id)
+    );
+""",
+    "discussions": """
+    CREATE TABLE IF NOT EXISTS discussions (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        passage_id INTEGER NOT NULL,
+        message_role VARCHAR(20) NOT NULL,
+        message_content TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (passage_id) REFERENCES passages(id)
+    );
+    -- Paged history for one user and passage
+    CREATE INDEX IF NOT EXISTS idx_discussion_user_passage_id
+        ON discussions (user_id, passage_id, id);
+""",
+    "assessment_answers": """
+    -- Raw interest-assessment answers, one row per answer
+    CREATE TABLE IF NOT EXISTS assessment_answers (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        question_id INTEGER,
+        category VARCHAR(50),
+        answer TEXT,
+        submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_assessment_answers_user ON assessment_answers(user_id, submitted_at DESC);
+""",
+}
+PHASE2_TABLES = tuple(PHASE2_TABLE_DDL)
+
+def missing_tables_ddl(conn) -> str:
+    """PHASE2_TABLE_DDL for just the tables that don't exist yet (empty string when none)"""
+    # Plain cursor, whatever cursor_factory conn was opened with
+    cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+    cursor.execute(
+        "SELECT t FROM unnest(%s::text[]) AS t WHERE to_regclass(t) IS NULL",
+        (list(PHASE2_TABLES),)
+    )
+    missing = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    # Dict order is creation order, so foreign keys resolve
+    return "".join(ddl for table, ddl in PHASE2_TABLE_DDL.items() if table in missing)
+
+# Admin analytics rollups (Postgres only), created by init_db and kept
+# fresh by refresh_analytics_views.
+# name -> (defining query, unique index columns needed for REFRESH ... CONCURRENTLY)
+ANALYTICS_VIEWS = {
+    "mv_daily_stats": (
+        """SELECT DATE(sl.started_at) AS day, sl.user_id,
+                  COUNT(*) AS passages,
+                  COUNT(p.id) AS read_sessions,
+                  SUM(p.word_count) AS words
+           FROM session_logs sl
+           LEFT JOIN passages p ON sl.passage_id = p.id
+           WHERE sl.completion_status = 'completed'
+           GROUP BY DATE(sl.started_at), sl.user_id""",
+        "day, user_id"
+    ),
+    "mv_comprehension_by_type": (
+        """SELECT pq.question_type,
+                  COUNT(*) AS total_questions,
+                  AVG(sl.comprehension_score) AS avg_score
+           FROM session_logs sl
+           JOIN passage_questions pq ON sl.passage_id = pq.passage_id
+           WHERE sl.comprehension_score IS NOT NULL
+           GROUP BY pq.question_type""",
+        "question_type"
+    ),
+    # Single row; the constant column only exists to carry the unique index
+    "mv_basic_stats": (
+        """SELECT 1 AS singleton,
+                  (SELECT COUNT(*) FROM users WHERE role = 'student') AS total_students,
+                  (SELECT COUNT(*) FROM session_logs WHERE completion_status = 'completed') AS total_completed,
+                  (SELECT AVG(comprehension_score) FROM session_logs
+                   WHERE comprehension_score IS NOT NULL) AS avg_score,
+                  (SELECT COUNT(DISTINCT user_id) FROM session_logs
+                   WHERE started_at >= NOW() - INTERVAL '7 days') AS active_students""",
+        "singleton"
+    ),
+}
+
+def create_missing_analytics_views(conn) -> list:
+    """Create and populate whichever ANALYTICS_VIEWS don't exist yet, returning their names"""
+    # Plain cursor, whatever cursor_factory conn was opened with
+    cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+    cursor.execute(
+        "SELECT v FROM unnest(%s::text[]) AS v WHERE to_regclass(v) IS NULL",
+        (list(ANALYTICS_VIEWS),)
+    )
+    created = [row[0] for row in cursor.fetchall()]
+    for name in created:
+        query, key = ANALYTICS_VIEWS[name]
+        cursor.execute(f"CREATE MATERIALIZED VIEW {name} AS {query} WITH NO DATA")
+        cursor.execute(f"CREATE UNIQUE INDEX {name}_key ON {name} ({key})")
+        # REFRESH ... CONCURRENTLY needs a populated view to start from
+        cursor.execute(f"REFRESH MATERIALIZED VIEW {name}")
+    cursor.close()
+    return created
+
+def analytics_source(cursor, name: str) -> str:
+    """FROM-clause for an analytics rollup: the view, or its defining query run live if the view is missing"""
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL AS present", (name,))
+    if cursor.fetchone()['present']:
+        return name
+    return f"({ANALYTICS_VIEWS[name][0]}) AS {name}"
+
+def create_index_concurrently(cursor, name: str, definition: str, unique: bool = False):
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS name definition, on an autocommit cursor.
+    
+    A concurrent build that fails (lock timeout, cancel) leaves an INVALID index
+    behind that IF NOT EXISTS would skip forever, so drop and rebuild that first.
+    """
+    cursor.execute("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,))
+    row = cursor.fetchone()
+    if row and row[0]:
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    cursor.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+
 def init_db():
     if USE_POSTGRES:
         conn = psycopg2.connect(DATABASE)
@@ -111,18 +448,122 @@ def init_db():
         # Original tables (simplified - assume migration ran)
         # Users, assessments, lessons, progress tables exist
         
-        # Ensure new columns exist in users table
+        # Skip the schema work entirely once this version has been applied
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS schema_migrations (
+                   version INTEGER PRIMARY KEY,
+                   applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+               )"""
+        )
+        cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (SCHEMA_VERSION,))
+        if cursor.fetchone():
+            conn.commit()
+            conn.close()
+            return
+        
+        # Ensure new columns exist in users table - one catalog lookup,
+        # then a single multi-action ALTER for whatever is actually missing
         try:
-            cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS age_band VARCHAR(20)")
-            cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS grade_band VARCHAR(20)")
-            cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS interest_tags TEXT")
-            cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS level_estimate VARCHAR(20)")
-            cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS words_per_session INTEGER DEFAULT 0")
-            cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS total_passages_read INTEGER DEFAULT 0")
-            cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS comprehension_score REAL DEFAULT 0")
-            cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS last_active TIMESTAMP")
+            # The ALTERs need ACCESS EXCLUSIVE; give up (and retry next start)
+            # rather than hang startup behind a long-running query. LOCAL, so
+            # it doesn't apply to the CONCURRENTLY builds below.
+            cursor.execute(f"SET LOCAL lock_timeout = '{SCHEMA_LOCK_TIMEOUT}'")
+            cursor.execute(
+                """SELECT column_name, data_type FROM information_schema.columns
+                   WHERE table_name = 'users' AND column_name = ANY(%s)""",
+                (['interests'] + [name for name, _ in USERS_PHASE2_COLUMNS],)
+            )
+            existing_columns = dict(cursor.fetchall())
+            
+            alterations = [
+                f"ADD COLUMN IF NOT EXISTS {name} {definition}"
+                for name, definition in USERS_PHASE2_COLUMNS
+                if name not in existing_columns
+            ]
+            # interests and interest_tags started out as JSON-in-TEXT; convert in place
+            for column in ('interests', 'interest_tags'):
+                if existing_columns.get(column) == 'text':
+                    alterations.append(
+                        f"ALTER COLUMN {column} TYPE JSONB USING NULLIF({column}, '')::jsonb"
+                    )
+            if alterations:
+                cursor.execute(f"ALTER TABLE users {', '.join(alterations)}")
+            
+            # Build whichever Phase 2 tables are missing (and their indexes,
+            # while they are still empty) in this same transaction. Tables
+            # that already hold data are left to the CONCURRENTLY builds below.
+            missing_ddl = missing_tables_ddl(conn)
+            if missing_ddl:
+                cursor.execute(missing_ddl)
+            
+            # Same for passages.topic_tags (when the passages table exists yet)
+            cursor.execute(
+                """SELECT data_type FROM information_schema.columns
+                   WHERE table_name = 'passages' AND column_name = 'topic_tags'"""
+            )
+            topic_tags_type = cursor.fetchone()
+            if topic_tags_type and topic_tags_type[0] == 'text':
+                cursor.execute(
+                    "ALTER TABLE passages ALTER COLUMN topic_tags TYPE JSONB USING NULLIF(topic_tags, '')::jsonb"
+                )
+            
+            # The admin analytics endpoints read these from the first request on;
+            # the background loop only keeps them fresh
+            create_missing_analytics_views(conn)
             conn.commit()
-        except:
+            
+            # Explicit unique index for the login lookup by email, so it doesn't
+            # depend on how the original UNIQUE constraint was (or wasn't) created.
+            # CONCURRENTLY keeps users writable while it builds, but it can't
+            # run inside a transaction.
+            conn.autocommit = True
+            try:
+                create_index_concurrently(cursor, "users_email_uidx", "ON users (email)", unique=True)
+                # Containment lookups on interest tags (interest_tags @> '["science"]')
+                create_index_concurrently(cursor, "users_interest_tags_gin", "ON users USING GIN (interest_tags jsonb_path_ops)")
+                # Admin student list (role = 'student' ORDER BY created_at DESC)
+                create_index_concurrently(cursor, "idx_users_role_created", "ON users (role, created_at DESC)")
+                # Reuse lookup for generated passages; PHASE2_TABLE_DDL builds the
+                # same indexes when it creates the tables, this covers older ones
+                cursor.execute("SELECT to_regclass('passages') IS NOT NULL")
+                if cursor.fetchone()[0]:
+                    create_index_concurrently(cursor, "idx_passages_cache_lookup", "ON passages (difficulty_level, word_count) WHERE approved")
+                    # Any-of-these-topics lookups (topic_tags ?| ARRAY[...])
+                    create_index_concurrently(cursor, "idx_passages_topic_tags_gin", "ON passages USING GIN (topic_tags)")
+                # Admin analytics: completed sessions by date, and questions by type
+                cursor.execute("SELECT to_regclass('session_logs') IS NOT NULL")
+                if cursor.fetchone()[0]:
+                    create_index_concurrently(
+                        cursor, "idx_session_completed_started",
+                        """ON session_logs (started_at) INCLUDE (user_id, passage_id)
+                           WHERE completion_status = 'completed'"""
+                    )
+                    # A student's recent sessions, and who was active in the last 7 days
+                    create_index_concurrently(cursor, "idx_session_user_started", "ON session_logs (user_id, started_at DESC)")
+                    create_index_concurrently(cursor, "idx_session_started", "ON session_logs (started_at) INCLUDE (user_id)")
+                # A student's recent writing
+                cursor.execute("SELECT to_regclass('writing_exercises') IS NOT NULL")
+                if cursor.fetchone()[0]:
+                    create_index_concurrently(
+                        cursor, "idx_writing_user_submitted", "ON writing_exercises (user_id, submitted_at DESC)"
+                    )
+                cursor.execute("SELECT to_regclass('passage_questions') IS NOT NULL")
+                if cursor.fetchone()[0]:
+                    create_index_concurrently(cursor, "idx_questions_passage_type", "ON passage_questions (passage_id, question_type)")
+                # Paged discussion history
+                cursor.execute("SELECT to_regclass('discussions') IS NOT NULL")
+                if cursor.fetchone()[0]:
+                    create_index_concurrently(cursor, "idx_discussion_user_passage_id", "ON discussions (user_id, passage_id, id)")
+            finally:
+                conn.autocommit = False
+            
+            cursor.execute(
+                "INSERT INTO schema_migrations (version) VALUES (%s) ON CONFLICT DO NOTHING",
+                (SCHEMA_VERSION,)
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"Schema update failed, will retry on next start: {e}")
             conn.rollback()
         
     else:
@@ -148,19 +589,42 @@ def init_db():
                 total_passages_read INTEGER DEFAULT 0,
                 comprehension_score REAL DEFAULT 0,
                 last_active TIMESTAMP,
+                word_count_min INTEGER,
+                word_count_max INTEGER,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        # Older local databases predate some of the users columns
+        existing_columns = {row[1] for row in cursor.execute("PRAGMA table_info(users)")}
+        for name, definition in USERS_PHASE2_COLUMNS:
+            if name not in existing_columns:
+                cursor.execute(f"ALTER TABLE users ADD COLUMN {name} {definition}")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS users_email_uidx ON users (email)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_role_created ON users (role, created_at DESC)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS assessment_answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                question_id INTEGER,
+                category TEXT,
+                answer TEXT,
+                submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        ''')
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_assessment_answers_user ON assessment_answers (user_id, submitted_at DESC)"
+        )
         
         # Create admin
-        admin_hash = bcrypt.hashpw("admin123".encode('utf-8'), bcrypt.gensalt())
-        try:
-            cursor.execute(
-                "INSERT INTO users (email, password_hash, full_name, role) VALUES (?, ?, ?, ?)",
-                ("admin@mfs.org", admin_hash.decode('utf-8'), "Achieve 365 Administrator", "admin")
-            )
-        except sqlite3.IntegrityError:
-            pass
+        if SEED_ADMIN:
+            try:
+                cursor.execute(
+                    "INSERT INTO users (email, password_hash, full_name, role) VALUES (?, ?, ?, ?)",
+                    ("admin@mfs.org", ADMIN_PASSWORD_HASH, "Achieve 365 Administrator", "admin")
+                )
+            except sqlite3.IntegrityError:
+                pass
     
     conn.commit()
     conn.close()
@@ -168,16 +632,366 @@ def init_db():
 init_db()
 
 # Helper functions
+
+# Hot auth/profile queries, written once in the Postgres dialect. On Postgres
+# they run as server-side prepared statements so parse/plan is skipped after
+# the first call on each connection; the SQLite versions are derived below.
+PREPARED_STATEMENTS = {
+    "login_sel": """SELECT id, email, password_hash, full_name, role, reading_level, interests, level_estimate
+                    FROM users WHERE email = $1""",
+    "register_ins": """INSERT INTO users (email, password_hash, full_name, role, age_band)
+                       VALUES ($1, $2, $3, $4, $5)
+                       RETURNING id, email, full_name, role, created_at""",
+    # Only replaces the hash that was just verified, so a concurrent password change wins
+    "password_rehash_upd": """UPDATE users SET password_hash = $1 WHERE id = $2 AND password_hash = $3""",
+    "assessment_upd": """UPDATE users
+                         SET reading_level = $1, interests = $2::jsonb, interest_tags = $2::jsonb, level_estimate = $1
+                         WHERE id = $3""",
+    "onboard_upd": """UPDATE users
+                      SET interest_tags = $1, age_band = $2, level_estimate = $3, grade_band = $4, last_active = NOW()
+                      WHERE id = $5""",
+    # Assessment and onboarding in one write; a NULL leaves the column as it was
+    "profile_upd": """UPDATE users
+                      SET reading_level = COALESCE($1, reading_level), interests = COALESCE($2::jsonb, interests),
+                          interest_tags = COALESCE($2::jsonb, interest_tags), level_estimate = COALESCE($3, level_estimate),
+                          age_band = COALESCE($4, age_band), grade_band = COALESCE($5, grade_band), last_active = NOW()
+                      WHERE id = $6
+                      RETURNING reading_level, interest_tags, level_estimate, grade_band""",
+    # Reading / discussion / writing
+    "reader_sel": """SELECT level_estimate, interest_tags, total_passages_read
+                     FROM users WHERE id = $1""",
+    "feedback_session_upd": """UPDATE session_logs
+                               SET completed_at = NOW(), completion_status = $1, time_spent_seconds = $2, feedback = $3
+                               WHERE id = $4""",
+    # Stats and level adjustment in one statement; the passage length is
+    # read inline, and words_per_session is left alone if it's missing
+    "feedback_user_upd": """UPDATE users
+                            SET total_passages_read = total_passages_read + 1,
+                                words_per_session = COALESCE(
+                                    (words_per_session + (SELECT p.word_count FROM session_logs sl
+                                                          JOIN passages p ON sl.passage_id = p.id
+                                                          WHERE sl.id = $1)) / 2,
+                                    words_per_session),
+                                last_active = NOW(),
+                                level_estimate = CASE $2::text
+                                    WHEN 'too_easy' THEN CASE level_estimate
+                                        WHEN 'beginner' THEN 'intermediate'
+                                        WHEN 'intermediate' THEN 'advanced'
+                                        ELSE level_estimate
+                                    END
+                                    WHEN 'too_hard' THEN CASE level_estimate
+                                        WHEN 'advanced' THEN 'intermediate'
+                                        WHEN 'intermediate' THEN 'beginner'
+                                        ELSE level_estimate
+                                    END
+                                    ELSE level_estimate
+                                END
+                            WHERE id = $3""",
+    "comprehension_session_upd": """UPDATE session_logs SET answers = $1, comprehension_score = $2 WHERE id = $3""",
+    # Rolling average
+    "comprehension_user_upd": """UPDATE users SET comprehension_score = (comprehension_score + $1) / 2 WHERE id = $2""",
+    "passage_content_sel": """SELECT content FROM passages WHERE id = $1""",
+    "discussion_ins": """INSERT INTO discussions (user_id, passage_id, message_role, message_content)
+                         VALUES ($1, $2, 'user', $3), ($1, $2, 'assistant', $4)""",
+    "writing_ins": """INSERT INTO writing_exercises (user_id, passage_id, prompt, user_response, ai_feedback, score)
+                      VALUES ($1, $2, $3, $4, $5, $6)
+                      RETURNING id""",
+    "writing_feedback_upd": """UPDATE writing_exercises SET ai_feedback = $1, score = $2
+                               WHERE id = $3 AND user_id = $4
+                               RETURNING id""",
+    "revision_upd": """UPDATE writing_exercises
+                       SET revised_response = $1, revision_submitted_at = NOW()
+                       WHERE id = $2 AND user_id = $3""",
+    "session_ins": """INSERT INTO session_logs (user_id, passage_id, started_at)
+                      VALUES ($1, $2, NOW())
+                      RETURNING id""",
+    "passage_questions_sel": """SELECT question_text, question_type, correct_answer, options, explanation, difficulty
+                                FROM passage_questions WHERE passage_id = $1 ORDER BY id""",
+    # Postgres only: an unread approved passage on any of $2 topics (GIN on topic_tags)
+    "cached_passage_sel": """SELECT p.id, p.title, p.content, p.word_count, p.estimated_minutes, p.difficulty_level
+                             FROM passages p
+                             WHERE p.approved AND p.difficulty_level = $1 AND p.topic_tags ?| $2::text[]
+                               AND p.word_count BETWEEN $3 AND $4
+                               AND NOT EXISTS (SELECT 1 FROM session_logs s WHERE s.passage_id = p.id AND s.user_id = $5)
+                               AND EXISTS (SELECT 1 FROM passage_questions q WHERE q.passage_id = p.id)
+                             ORDER BY RANDOM() LIMIT 1""",
+    # Postgres only: a generated passage and its session log in a single round-trip
+    "generated_passage_ins": """WITH p AS (
+                                    INSERT INTO passages
+                                    (title, content, source, topic_tags, word_count, readability_score, flesch_ease,
+                                     difficulty_level, estimated_minutes, approved, created_by)
+                                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11) RETURNING id
+                                ), s AS (
+                                    INSERT INTO session_logs (user_id, passage_id, started_at)
+                                    SELECT $12, id, NOW() FROM p RETURNING id
+                                )
+                                SELECT (SELECT id FROM p) AS passage_id, (SELECT id FROM s) AS session_id""",
+    # Admin student details (everything but the password hash)
+    "student_profile_sel": """SELECT id, email, full_name, role, reading_level, interests, age_band, grade_band,
+                                     interest_tags, level_estimate, words_per_session, total_passages_read,
+                                     comprehension_score, last_active, created_at
+                              FROM users WHERE id = $1""",
+    "student_sessions_sel": """SELECT sl.*, p.title, p.word_count, p.difficulty_level
+                               FROM session_logs sl
+                               JOIN passages p ON sl.passage_id = p.id
+                               WHERE sl.user_id = $1
+                               ORDER BY sl.started_at DESC
+                               LIMIT 20""",
+    "student_writing_sel": """SELECT prompt, score, submitted_at, revised_response IS NOT NULL AS has_revision
+                              FROM writing_exercises
+                              WHERE user_id = $1
+                              ORDER BY submitted_at DESC
+                              LIMIT 10""",
+    # Postgres only: the three queries above as one finished JSON document
+    "student_details_json": """SELECT json_build_object(
+                                   'student', row_to_json(u),
+                                   'sessions', COALESCE((SELECT json_agg(s ORDER BY s.started_at DESC)
+                                                         FROM (SELECT sl.*, p.title, p.word_count, p.difficulty_level
+                                                               FROM session_logs sl
+                                                               JOIN passages p ON sl.passage_id = p.id
+                                                               WHERE sl.user_id = u.id
+                                                               ORDER BY sl.started_at DESC
+                                                               LIMIT 20) s), '[]'::json),
+                                   'writing', COALESCE((SELECT json_agg(w ORDER BY w.submitted_at DESC)
+                                                        FROM (SELECT prompt, score, submitted_at,
+                                                                     revised_response IS NOT NULL AS has_revision
+                                                              FROM writing_exercises
+                                                              WHERE user_id = u.id
+                                                              ORDER BY submitted_at DESC
+                                                              LIMIT 10) w), '[]'::json)
+                               )::text AS payload
+                               FROM (SELECT id, email, full_name, role, reading_level, interests, age_band, grade_band,
+                                            interest_tags, level_estimate, words_per_session, total_passages_read,
+                                            comprehension_score, last_active, created_at
+                                     FROM users WHERE id = $1) u""",
+}
+
+def _sqlite_dialect(sql: str) -> str:
+    """Translate a PREPARED_STATEMENTS entry to SQLite ($n -> ?n numbered params, no ::casts)"""
+    sql = re.sub(r"\$(\d+)", r"?\1", sql)
+    sql = re.sub(r"::\w+", "", sql)
+    return sql.replace("NOW()", "CURRENT_TIMESTAMP")
+
+# RETURNING (register_ins, profile_upd, writing_ins, writing_feedback_upd, session_ins) needs SQLite 3.35+
+SQLITE_STATEMENTS = {name: _sqlite_dialect(sql) for name, sql in PREPARED_STATEMENTS.items()}
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which statements it has PREPAREd"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+        self.last_used = time.monotonic()
+
+def _connection_alive(conn) -> bool:
+    """Cheap pre-ping for a connection that has been sitting idle in the pool"""
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def execute_prepared(cursor, name: str, params: tuple):
+    """EXECUTE one of PREPARED_STATEMENTS, preparing it on first use per connection (Postgres only)"""
+    conn = cursor.connection
+    if name not in conn.prepared_statements:
+        cursor.execute(f"PREPARE {name} AS {PREPARED_STATEMENTS[name]}")
+        conn.prepared_statements.add(name)
+    placeholders = ", ".join(["%s"] * len(params))
+    cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+
+def _execute_sqlite_statement(cursor, name: str, params: tuple):
+    cursor.execute(SQLITE_STATEMENTS[name], params)
+
+# Pick the backend once at import instead of branching on every request
+execute_statement = execute_prepared if USE_POSTGRES else _execute_sqlite_statement
+
+@functools.lru_cache(maxsize=None)
+def _sqlite_params(query: str) -> str:
+    return query.replace("%s", "?").replace("NOW()", "CURRENT_TIMESTAMP")
+
+def execute_sql(cursor, query: str, params: tuple = ()):
+    """Run an ad-hoc query written once in the Postgres spelling (%s placeholders,
+    NOW()) on either backend - the SQLite spelling is derived on first use and cached"""
+    cursor.execute(query if USE_POSTGRES else _sqlite_params(query), params)
+
+# Reuse PostgreSQL connections across requests instead of paying the
+# TCP + TLS + auth handshake on every call. (SQLite reuse is per thread,
+# see CachedSQLiteConnection.)
+# The pool is opened on first use rather than at import, so each worker
+# process gets its own and a supervisor that merely imports the app (or forks
+# workers from it) doesn't hold connections. DB_POOL_MAX is this worker's share.
+db_pool = None
+_db_pool_lock = threading.Lock()
+
+def _connection_pool():
+    global db_pool
+    if db_pool is None:
+        with _db_pool_lock:
+            if db_pool is None:
+                db_pool = psycopg2.pool.ThreadedConnectionPool(
+                    DB_POOL_MIN, DB_POOL_MAX, DATABASE,
+                    connection_factory=PreparingConnection,
+                    cursor_factory=psycopg2.extras.RealDictCursor
+                )
+    return db_pool
+
+# ThreadedConnectionPool raises instead of waiting when exhausted, so gate
+# checkouts with a semaphore to make callers queue for a free connection
+db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+class PooledConnection:
+    """Pooled psycopg2 connection - close() returns it to the pool"""
+    _conn = None
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            # Discard uncommitted work so it can't leak into the next request
+            if not conn.closed and conn.status != psycopg2.extensions.STATUS_READY:
+                conn.rollback()
+        except psycopg2.Error:
+            pass
+        finally:
+            conn.last_used = time.monotonic()
+            db_pool.putconn(conn, close=bool(conn.closed))
+            db_pool_slots.release()
+
+    # Safety net for code paths that raise before reaching conn.close()
+    __del__ = close
+
+# SQLite connections are kept per thread (sqlite3 objects aren't safe to
+# share across threads) so each request skips the open + PRAGMA round-trip
+_sqlite_local = threading.local()
+
+class CachedSQLiteConnection:
+    """Per-thread sqlite3 connection - close() parks it for the next request on this thread"""
+    _conn = None
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        # Discard uncommitted work so it can't leak into the next request
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        if getattr(_sqlite_local, "conn", None) is None:
+            _sqlite_local.conn = conn
+        else:
+            conn.close()
+
+    __del__ = close
+
+def _on_event_loop() -> bool:
+    """True when called from the thread running the asyncio event loop"""
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
 def get_db():
     if USE_POSTGRES:
-        conn = psycopg2.connect(DATABASE)
-        conn.cursor_factory = psycopg2.extras.RealDictCursor
-        return conn
+        # Threadpool callers queue for a free connection; an async handler
+        # calling straight in would park the whole event loop on the wait,
+        # so it gets an immediate 503 instead when the pool is exhausted
+        if _on_event_loop():
+            acquired = db_pool_slots.acquire(blocking=False)
+        else:
+            acquired = db_pool_slots.acquire(timeout=DB_POOL_TIMEOUT)
+        if not acquired:
+            raise HTTPException(status_code=503, detail="Database busy, please try again")
+        try:
+            pool = _connection_pool()
+            conn = pool.getconn()
+            if conn.closed or (
+                time.monotonic() - conn.last_used > DB_POOL_MAX_IDLE and not _connection_alive(conn)
+            ):
+                # Server dropped this one while it sat idle
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+        except Exception:
+            db_pool_slots.release()
+            raise
+        return PooledConnection(conn)
     else:
-        conn = sqlite3.connect(DATABASE, timeout=30.0, check_same_thread=False)
-        conn.execute('PRAGMA journal_mode=WAL')
-        conn.row_factory = sqlite3.Row
-        return conn
+        # Take this thread's idle connection; a nested borrow gets a fresh one
+        conn = getattr(_sqlite_local, "conn", None)
+        _sqlite_local.conn = None
+        if conn is None:
+            conn = sqlite3.connect(DATABASE, timeout=30.0, check_same_thread=False,
+                                   cached_statements=SQLITE_STATEMENT_CACHE_SIZE)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # In WAL mode NORMAL only fsyncs at checkpoints, not on every commit
+            conn.execute('PRAGMA synchronous=NORMAL')
+            # Connections live on per thread, so a bigger page cache keeps hot pages across requests
+            conn.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_KIB}')
+            conn.row_factory = sqlite3.Row
+        return CachedSQLiteConnection(conn)
+
+@contextmanager
+def db_connection():
+    """Borrow a connection for a with-block: commit on success, rollback on error, always release"""
+    conn = get_db()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def json_param(value):
+    """Bind a Python value for a JSON column - JSONB on Postgres, JSON text on SQLite"""
+    return psycopg2.extras.Json(value) if USE_POSTGRES else json.dumps(value)
+
+def load_json_list(value) -> list:
+    """Read a JSON list column - psycopg2 already decodes JSONB, SQLite returns text"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return json.loads(value)
+    return list(value)
+
+def hash_password(password: str, role: str) -> str:
+    rounds = BCRYPT_ADMIN_ROUNDS if role == "admin" else BCRYPT_ROUNDS
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+def check_password(password: str, password_hash: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def password_needs_rehash(password_hash: str, role: str) -> bool:
+    """True when a stored hash was made at a different cost than its role now uses"""
+    rounds = BCRYPT_ADMIN_ROUNDS if role == "admin" else BCRYPT_ROUNDS
+    # $2b$<cost>$<salt+hash>
+    parts = password_hash.split('$')
+    return len(parts) < 4 or parts[2] != f"{rounds:02d}"
+
+def rehash_password(user_id: int, password: str, role: str, old_hash: str):
+    """Re-store a verified password at the current cost (run as a background task)"""
+    new_hash = hash_password(password, role)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        execute_statement(cursor, "password_rehash_upd", (new_hash, user_id, old_hash))
 
 def create_token(user_id: int, role: str) -> str:
     payload = {
@@ -187,24 +1001,143 @@ def create_token(user_id: int, role: str) -> str:
     }
     return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
 
+# Clients reuse one token for many requests, so verified payloads are kept
+# and repeat calls skip the base64 + HMAC work. Failures aren't cached.
+@functools.lru_cache(maxsize=4096)
+def _decode_token(token: str) -> dict:
+    return jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+
 def verify_token(token: str) -> dict:
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        payload = _decode_token(token)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    # A cached payload can outlive its exp - jwt.decode only checked it the first time
+    if payload.get("exp", float("inf")) <= time.time():
+        raise HTTPException(status_code=401, detail="Token expired")
+    # Copy so callers can't modify the cached payload
+    return dict(payload)
+
+# last_active is only used for "recently active" reporting, so bumps are
+# buffered in memory and written in one batched UPDATE per flush window
+ACTIVITY_FLUSH_SECONDS = 5
+_activity_buffer: Dict[int, datetime] = {}
+_activity_lock = threading.Lock()
 
 def update_user_activity(user_id: int):
-    """Update last_active timestamp"""
-    conn = get_db()
-    cursor = conn.cursor()
+    """Update last_active timestamp (buffered - see flush_user_activity)"""
+    with _activity_lock:
+        _activity_buffer[user_id] = datetime.utcnow()
+
+def flush_user_activity():
+    """Write all buffered last_active timestamps in a single round-trip"""
+    with _activity_lock:
+        if not _activity_buffer:
+            return
+        pending = list(_activity_buffer.items())
+        _activity_buffer.clear()
+    
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            if USE_POSTGRES:
+                psycopg2.extras.execute_values(
+                    cursor,
+                    """UPDATE users SET last_active = data.ts
+                       FROM (VALUES %s) AS data(uid, ts)
+                       WHERE users.id = data.uid""",
+                    pending
+                )
+            else:
+                cursor.executemany(
+                    "UPDATE users SET last_active = ? WHERE id = ?",
+                    [(ts.strftime('%Y-%m-%d %H:%M:%S'), uid) for uid, ts in pending]
+                )
+    except Exception:
+        # Put them back (without clobbering newer bumps) so the next flush retries
+        with _activity_lock:
+            for uid, ts in pending:
+                _activity_buffer.setdefault(uid, ts)
+        raise
+
+async def _activity_flush_loop():
+    while True:
+        await asyncio.sleep(ACTIVITY_FLUSH_SECONDS)
+        try:
+            await run_in_threadpool(flush_user_activity)
+        except Exception as e:
+            log.error("Error flushing user activity: %s", e)
+
+@app.on_event("startup")
+async def start_activity_flusher():
+    app.state.activity_flusher = asyncio.create_task(_activity_flush_loop())
+
+@app.on_event("shutdown")
+async def stop_activity_flusher():
+    app.state.activity_flusher.cancel()
+    await run_in_threadpool(flush_user_activity)
+
+# Admin analytics read from rollups refreshed in the background instead of
+# re-aggregating session_logs on every dashboard load (Postgres only - the
+# SQLite dev database just runs the aggregates directly)
+ANALYTICS_REFRESH_SECONDS = 60
+# Advisory lock key held (per transaction) by whichever worker is refreshing
+ANALYTICS_REFRESH_LOCK_ID = 365_001
+# Held by an admin-triggered schema migration, so workers take turns
+MIGRATION_LOCK_ID = 365_002
+
+def refresh_analytics_views():
+    """Refresh the analytics rollups without blocking readers (creating any that are missing)"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        # Every worker runs this loop; only one needs to do the refresh each round
+        cursor.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (ANALYTICS_REFRESH_LOCK_ID,))
+        if not cursor.fetchone()['locked']:
+            return
+        # ...and the loops drift apart, so skip if another worker refreshed
+        # recently (the slack keeps a loop that is just early from skipping a round)
+        cursor.execute(
+            """CREATE TABLE IF NOT EXISTS analytics_refreshes (
+                   singleton INTEGER PRIMARY KEY,
+                   refreshed_at TIMESTAMPTZ NOT NULL
+               )"""
+        )
+        cursor.execute(
+            """SELECT EXISTS (SELECT 1 FROM analytics_refreshes
+                              WHERE refreshed_at > NOW() - make_interval(secs => %s)) AS fresh""",
+            (ANALYTICS_REFRESH_SECONDS * 0.9,)
+        )
+        if cursor.fetchone()['fresh']:
+            return
+        # init_db normally creates them; this covers a schema step that failed
+        created = create_missing_analytics_views(conn)
+        for name in ANALYTICS_VIEWS:
+            if name not in created:
+                cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}")
+        cursor.execute(
+            """INSERT INTO analytics_refreshes (singleton, refreshed_at) VALUES (1, NOW())
+               ON CONFLICT (singleton) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at"""
+        )
+
+async def _analytics_refresh_loop():
+    while True:
+        try:
+            await run_in_threadpool(refresh_analytics_views)
+        except Exception as e:
+            log.error("Error refreshing analytics views: %s", e)
+        await asyncio.sleep(ANALYTICS_REFRESH_SECONDS)
+
+@app.on_event("startup")
+async def start_analytics_refresher():
     if USE_POSTGRES:
-        cursor.execute("UPDATE users SET last_active = NOW() WHERE id = %s", (user_id,))
-    else:
-        cursor.execute("UPDATE users SET last_active = CURRENT_TIMESTAMP WHERE id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+        app.state.analytics_refresher = asyncio.create_task(_analytics_refresh_loop())
+
+@app.on_event("shutdown")
+async def stop_analytics_refresher():
+    if USE_POSTGRES:
+        app.state.analytics_refresher.cancel()
 
 # ============================================
 # STATIC FILE ROUTES
@@ -234,79 +1167,75 @@ async def serve_writing():
 # AUTHENTICATION (Original)
 # ============================================
 
+def insert_user(user: UserCreate, password_hash: str) -> dict:
+    """Create the account row, returning its public columns (blocking - call via run_in_threadpool)"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        execute_statement(
+            cursor, "register_ins",
+            (user.email, password_hash, user.full_name, user.role, user.age_band)
+        )
+        return dict(cursor.fetchone())
+
 @app.post("/api/register")
 async def register(user: UserCreate):
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    password_hash = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt())
+    # bcrypt is CPU-bound; hash in a worker thread so the event loop keeps serving
+    password_hash = await asyncio.to_thread(hash_password, user.password, user.role)
     
     try:
-        if USE_POSTGRES:
-            cursor.execute(
-                """INSERT INTO users (email, password_hash, full_name, role, age_band) 
-                   VALUES (%s, %s, %s, %s, %s) RETURNING id""",
-                (user.email, password_hash.decode('utf-8'), user.full_name, user.role, user.age_band)
-            )
-            result = cursor.fetchone()
-            user_id = result['id']
-        else:
-            cursor.execute(
-                "INSERT INTO users (email, password_hash, full_name, role, age_band) VALUES (?, ?, ?, ?, ?)",
-                (user.email, password_hash.decode('utf-8'), user.full_name, user.role, user.age_band)
-            )
-            user_id = cursor.lastrowid
-        
-        conn.commit()
-        token = create_token(user_id, user.role)
-        
-        return {
-            "success": True,
-            "token": token,
-            "user": {
-                "id": user_id,
-                "email": user.email,
-                "full_name": user.full_name,
-                "role": user.role
-            }
-        }
+        new_user = await run_in_threadpool(insert_user, user, password_hash)
     except (sqlite3.IntegrityError, psycopg2.errors.UniqueViolation):
-        conn.rollback()
         raise HTTPException(status_code=400, detail="Email already registered")
+    except HTTPException:
+        raise
     except Exception as e:
-        conn.rollback()
         print(f"Registration error: {e}")
         raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
-    finally:
-        conn.close()
-
-@app.post("/api/login")
-async def login(credentials: UserLogin):
-    conn = get_db()
-    cursor = conn.cursor()
     
-    if USE_POSTGRES:
-        cursor.execute("SELECT * FROM users WHERE email = %s", (credentials.email,))
-    else:
-        cursor.execute("SELECT * FROM users WHERE email = ?", (credentials.email,))
+    token = create_token(new_user['id'], new_user['role'])
     
-    user = cursor.fetchone()
-    conn.close()
+    return ORJSONResponse(content={
+        "success": True,
+        "token": token,
+        "user": new_user
+    })
+
+def fetch_login_user(email: str) -> Optional[dict]:
+    """Look up the columns login needs (blocking - call via run_in_threadpool)"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        execute_statement(cursor, "login_sel", (email,))
+        user = cursor.fetchone()
+    
+    return dict(user) if user else None
+
+@app.post("/api/login")
+async def login(credentials: UserLogin, background_tasks: BackgroundTasks):
+    # psycopg2/sqlite3 block, so run the lookup in the threadpool
+    # rather than stalling the event loop
+    user = await run_in_threadpool(fetch_login_user, credentials.email)
     
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     password_hash = user['password_hash']
     
-    if not bcrypt.checkpw(credentials.password.encode('utf-8'), password_hash.encode('utf-8')):
+    if not await asyncio.to_thread(check_password, credentials.password, password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    # Update last active
+    # Accounts created before the cost was lowered (or raised) move to the
+    # current BCRYPT_*ROUNDS on their next login, after the response is sent
+    if password_needs_rehash(password_hash, user['role']):
+        background_tasks.add_task(rehash_password, user['id'], credentials.password, user['role'], password_hash)
+    
+    # Update last active - buffered in memory, so login stays a single
+    # connection / single SELECT. Only bumped after the password checks out,
+    # which is why it isn't folded into the lookup as UPDATE ... RETURNING.
     update_user_activity(user['id'])
     
     token = create_token(user['id'], user['role'])
     
-    return {
+    return ORJSONResponse(content={
         "success": True,
         "token": token,
         "user": {
@@ -315,112 +1244,128 @@ async def login(credentials: UserLogin):
             "full_name": user['full_name'],
             "role": user['role'],
             "reading_level": user.get('reading_level'),
-            "interests": user.get('interests'),
+            "interests": load_json_list(user.get('interests')),
             "level_estimate": user.get('level_estimate')
         }
-    }
+    })
 
 # ============================================
 # ASSESSMENT ENDPOINTS (Phase 1 + Phase 2)
 # ============================================
 
-def generate_interest_assessment():
-    """Generate interest assessment questions with OpenAI API v1.0+"""
-    
-    # Fallback questions (in case OpenAI fails)
-    fallback_questions = [
+# Fallback questions (in case OpenAI fails)
+FALLBACK_INTEREST_QUESTIONS = [
+    {
+        "id": 1,
+        "question": "What type of books or stories do you enjoy most?",
+        "category": "genre",
+        "options": ["Fiction", "Non-fiction", "Mystery", "Science Fiction", "Other"]
+    },
+    {
+        "id": 2,
+        "question": "What topics are you most curious about?",
+        "category": "topic",
+        "options": ["Science", "History", "Technology", "Nature", "Other"]
+    },
+    {
+        "id": 3,
+        "question": "Which activities do you find most interesting?",
+        "category": "activity",
+        "options": ["Sports", "Arts & Crafts", "Music", "Gaming", "Other"]
+    },
+    {
+        "id": 4,
+        "question": "What kind of learning do you prefer?",
+        "category": "learning",
+        "options": ["Hands-on activities", "Reading", "Videos", "Discussions", "Other"]
+    },
+    {
+        "id": 5,
+        "question": "What format of content do you like?",
+        "category": "format",
+        "options": ["Short articles", "Long stories", "Comics/Graphics", "Poems", "Other"]
+    },
+    {
+        "id": 6,
+        "question": "What career or job interests you?",
+        "category": "career",
+        "options": ["Doctor/Nurse", "Teacher", "Engineer", "Artist", "Other"]
+    },
+    {
+        "id": 7,
+        "question": "What do you do in your free time?",
+        "category": "hobby",
+        "options": ["Reading", "Playing outside", "Drawing", "Building things", "Other"]
+    },
+    {
+        "id": 8,
+        "question": "What school subject do you like most?",
+        "category": "subject",
+        "options": ["Math", "English", "Science", "Social Studies", "Other"]
+    },
+    {
+        "id": 9,
+        "question": "What type of content would you like to read about?",
+        "category": "content_type",
+        "options": ["Real-life stories", "Fictional adventures", "Educational facts", "How-to guides", "Other"]
+    },
+    {
+        "id": 10,
+        "question": "What's your favorite thing to learn about?",
+        "category": "interest",
+        "options": ["Animals", "Space", "Computers", "People & cultures", "Other"]
+    }
+]
+
+# Generated questions are reused across requests instead of calling OpenAI each time
+INTEREST_QUESTIONS_TTL = 24 * 60 * 60
+# Retry OpenAI sooner when we had to fall back
+INTEREST_FALLBACK_TTL = 5 * 60
+_interest_questions_cache = {"body": None, "etag": None, "expires": 0.0}
+_interest_questions_lock = asyncio.Lock()
+
+async def interest_assessment_body() -> dict:
+    """Rendered /api/assessment/interest response, cached for INTEREST_QUESTIONS_TTL.
+    
+    The questions are only ever sent to clients, so the cache holds the encoded
+    JSON (with its ETag) and repeat requests skip building and serializing the payload.
+    """
+    if time.monotonic() < _interest_questions_cache["expires"]:
+        return _interest_questions_cache
+    
+    async with _interest_questions_lock:
+        # Another request may have refreshed it while we waited for the lock
+        if time.monotonic() >= _interest_questions_cache["expires"]:
+            questions = await _generate_interest_questions()
+            ttl = INTEREST_FALLBACK_TTL if questions is FALLBACK_INTEREST_QUESTIONS else INTEREST_QUESTIONS_TTL
+            body = orjson.dumps({"success": True, "questions": questions})
+            # Weak, since GZip may re-encode the body on the way out
+            etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            _interest_questions_cache.update(body=body, etag=etag, expires=time.monotonic() + ttl)
+        
+        return _interest_questions_cache
+
+# The request never varies, so the messages are built once
+INTEREST_QUESTIONS_MESSAGES = [
+    {
+        "role": "system",
+        "content": "You are an expert in educational assessment. You MUST respond with valid JSON only, no additional text."
+    },
+    {
+        "role": "user",
+        "content": """Generate 10 multiple-choice questions to assess student interests.
+
+Respond with a JSON object in this format:
+{
+    "questions": [
         {
             "id": 1,
-            "question": "What type of books or stories do you enjoy most?",
+            "question": "Question text here?",
             "category": "genre",
-            "options": ["Fiction", "Non-fiction", "Mystery", "Science Fiction", "Other"]
-        },
-        {
-            "id": 2,
-            "question": "What topics are you most curious about?",
-            "category": "topic",
-            "options": ["Science", "History", "Technology", "Nature", "Other"]
-        },
-        {
-            "id": 3,
-            "question": "Which activities do you find most interesting?",
-            "category": "activity",
-            "options": ["Sports", "Arts & Crafts", "Music", "Gaming", "Other"]
-        },
-        {
-            "id": 4,
-            "question": "What kind of learning do you prefer?",
-            "category": "learning",
-            "options": ["Hands-on activities", "Reading", "Videos", "Discussions", "Other"]
-        },
-        {
-            "id": 5,
-            "question": "What format of content do you like?",
-            "category": "format",
-            "options": ["Short articles", "Long stories", "Comics/Graphics", "Poems", "Other"]
-        },
-        {
-            "id": 6,
-            "question": "What career or job interests you?",
-            "category": "career",
-            "options": ["Doctor/Nurse", "Teacher", "Engineer", "Artist", "Other"]
-        },
-        {
-            "id": 7,
-            "question": "What do you do in your free time?",
-            "category": "hobby",
-            "options": ["Reading", "Playing outside", "Drawing", "Building things", "Other"]
-        },
-        {
-            "id": 8,
-            "question": "What school subject do you like most?",
-            "category": "subject",
-            "options": ["Math", "English", "Science", "Social Studies", "Other"]
-        },
-        {
-            "id": 9,
-            "question": "What type of content would you like to read about?",
-            "category": "content_type",
-            "options": ["Real-life stories", "Fictional adventures", "Educational facts", "How-to guides", "Other"]
-        },
-        {
-            "id": 10,
-            "question": "What's your favorite thing to learn about?",
-            "category": "interest",
-            "options": ["Animals", "Space", "Computers", "People & cultures", "Other"]
+            "options": ["Option 1", "Option 2", "Option 3", "Option 4", "Other"]
         }
     ]
-    
-    # Try OpenAI enhancement (optional)
-    if OPENAI_API_KEY and content_generator:
-        try:
-            print("Calling OpenAI to generate assessment questions...")
-            
-            from openai import OpenAI
-            client = OpenAI(api_key=OPENAI_API_KEY)
-            
-            response = client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert in educational assessment. You MUST respond with valid JSON only, no additional text."
-                    },
-                    {
-                        "role": "user",
-                        "content": """Generate 10 multiple-choice questions to assess student interests.
-
-CRITICAL: Respond with ONLY valid JSON. No markdown, no explanations, just the JSON array.
-
-Required format:
-[
-    {
-        "id": 1,
-        "question": "Question text here?",
-        "category": "genre",
-        "options": ["Option 1", "Option 2", "Option 3", "Option 4", "Other"]
-    }
-]
+}
 
 Requirements:
 - Exactly 10 questions
@@ -428,153 +1373,95 @@ Requirements:
 - Last option is always "Other"
 - Age-appropriate for young adults
 - Friendly, engaging tone"""
-                    }
-                ],
+    }
+]
+
+async def _generate_interest_questions():
+    """Generate interest assessment questions with OpenAI API v1.0+"""
+    
+    # Try OpenAI enhancement (optional)
+    if openai_client:
+        try:
+            log.debug("Calling OpenAI to generate assessment questions")
+            
+            response = await openai_client.chat.completions.create(
+                model=INTEREST_QUESTIONS_MODEL,
+                messages=INTEREST_QUESTIONS_MESSAGES,
                 temperature=0.7,
                 max_tokens=2000,
-                response_format={"type": "json_object"}  # Force JSON response
+                response_format={"type": "json_object"}  # Guarantees a bare JSON object, no fences
             )
             
-            content = response.choices[0].message.content.strip()
-            
-            print(f"Raw OpenAI response length: {len(content)} chars")
-            print(f"First 200 chars: {content[:200]}")
-            
-            # Clean up response
-            content = content.strip()
-            
-            # Remove markdown code blocks if present
-            if content.startswith("```"):
-                # Extract content between ``` markers
-                lines = content.split('\n')
-                # Remove first line (```json or ```)
-                lines = lines[1:]
-                # Remove last line if it's ```
-                if lines and lines[-1].strip() == '```':
-                    lines = lines[:-1]
-                content = '\n'.join(lines).strip()
+            questions = orjson.loads(response.choices[0].message.content).get("questions")
             
-            # Try to find JSON array or object
-            if not content.startswith('[') and not content.startswith('{'):
-                # Look for first [ or {
-                start_bracket = content.find('[')
-                start_brace = content.find('{')
-                
-                if start_bracket != -1:
-                    content = content[start_bracket:]
-                elif start_brace != -1:
-                    content = content[start_brace:]
-            
-            print(f"Cleaned content first 100 chars: {content[:100]}")
+            # Validate structure
+            if not isinstance(questions, list) or len(questions) == 0:
+                raise ValueError("Invalid questions format")
             
-            # Parse JSON
-            try:
-                parsed = json.loads(content)
-                
-                # Handle if it's wrapped in an object
-                if isinstance(parsed, dict):
-                    if 'questions' in parsed:
-                        questions = parsed['questions']
-                    else:
-                        # Try to find the array
-                        for value in parsed.values():
-                            if isinstance(value, list):
-                                questions = value
-                                break
-                        else:
-                            raise ValueError("No questions array found in response")
-                else:
-                    questions = parsed
-                
-                # Validate structure
-                if not isinstance(questions, list) or len(questions) == 0:
-                    raise ValueError("Invalid questions format")
+            # Ensure all questions have required fields and "Other" option
+            for i, q in enumerate(questions):
+                if not all(key in q for key in ['id', 'question', 'options']):
+                    raise ValueError(f"Question {i+1} missing required fields")
                 
-                # Ensure all questions have required fields and "Other" option
-                for i, q in enumerate(questions):
-                    if not all(key in q for key in ['id', 'question', 'options']):
-                        raise ValueError(f"Question {i+1} missing required fields")
-                    
-                    if "Other" not in q["options"]:
-                        q["options"].append("Other")
-                    
-                    # Ensure category exists
-                    if "category" not in q:
-                        q["category"] = "general"
+                if "Other" not in q["options"]:
+                    q["options"].append("Other")
                 
-                print(f"✓ Generated {len(questions)} questions with OpenAI")
-                return questions
-                
-            except json.JSONDecodeError as je:
-                print(f"JSON parsing error: {je}")
-                print(f"Failed content: {content[:500]}")
-                raise
+                # Ensure category exists
+                if "category" not in q:
+                    q["category"] = "general"
             
-        except Exception as e:
-            print(f"OpenAI error: {e}")
-            import traceback
-            traceback.print_exc()
-            print("Falling back to default questions")
+            log.debug("Generated %d questions with OpenAI", len(questions))
+            return questions
+            
+        except Exception:
+            log.exception("OpenAI error, falling back to default questions")
     
     # Return fallback questions
-    print(f"✓ Using {len(fallback_questions)} fallback questions")
-    return fallback_questions
+    log.debug("Using %d fallback questions", len(FALLBACK_INTEREST_QUESTIONS))
+    return FALLBACK_INTEREST_QUESTIONS
 
-async def analyze_assessment_results(answers: List[Dict]) -> Dict:
+def analyze_assessment_results(answers: List[Dict]) -> Dict:
     """Analyze assessment answers to determine interests and reading level"""
     
-    print(f"Analyzing {len(answers)} assessment answers...")
+    log.debug("Analyzing %d assessment answers", len(answers))
     
-    # Extract interests from answers
+    # Extract interests from answers in one pass; topics are the same list
     interests = []
-    topics = []
     categories = {}
     
     for answer in answers:
-        question_id = answer.get('question_id')
         answer_value = answer.get('answer')
-        
-        print(f"Question {question_id}: {answer_value}")
+        interest = tracked = None
         
         # Handle different answer formats
         if isinstance(answer_value, dict):
             # Format: {"option": "Other", "custom_text": "user input"}
-            if answer_value.get('option') == 'Other' or answer_value.get('custom_text'):
-                custom_text = answer_value.get('custom_text', '').strip()
-                if custom_text:
-                    print(f"  → Custom answer: {custom_text}")
-                    interests.append(custom_text.lower())
-                    topics.append(custom_text.lower())
-            elif answer_value.get('option'):
-                option = answer_value.get('option')
-                if option and option != 'Other':
-                    interests.append(option.lower())
-                    topics.append(option.lower())
-        
-        elif isinstance(answer_value, str):
+            option = answer_value.get('option')
+            custom_text = answer_value.get('custom_text')
+            if option == 'Other' or custom_text:
+                interest = (custom_text or '').strip().lower()
+            elif option:
+                interest = option.lower()
+            if custom_text:
+                tracked = custom_text.lower()
+        
+        elif isinstance(answer_value, str) and answer_value != 'Other':
             # Plain string answer
-            if answer_value and answer_value != 'Other':
-                print(f"  → Regular answer: {answer_value}")
-                interests.append(answer_value.lower())
-                topics.append(answer_value.lower())
+            interest = tracked = answer_value.lower()
         
-        # Track by category
-        category = answer.get('category', 'general')
-        if category not in categories:
-            categories[category] = []
+        if interest:
+            interests.append(interest)
         
-        # Add to category
-        if isinstance(answer_value, dict) and answer_value.get('custom_text'):
-            categories[category].append(answer_value['custom_text'].lower())
-        elif isinstance(answer_value, str) and answer_value != 'Other':
-            categories[category].append(answer_value.lower())
+        # Track by category
+        category_answers = categories.setdefault(answer.get('category', 'general'), [])
+        if tracked is not None:
+            category_answers.append(tracked)
     
     # Remove duplicates while preserving order
     interests = list(dict.fromkeys(interests))
-    topics = list(dict.fromkeys(topics))
+    topics = list(interests)
     
-    print(f"Extracted interests: {interests}")
-    print(f"Extracted topics: {topics}")
+    log.debug("Extracted interests: %s", interests)
     
     # If no interests extracted, use default
     if not interests:
@@ -601,30 +1488,65 @@ async def analyze_assessment_results(answers: List[Dict]) -> Dict:
     }
 
 @app.get("/api/assessment/interest")
-def get_interest_assessment():  # ← Remove 'async'
+async def get_interest_assessment(request: Request):
     """Get interest assessment questions"""
     try:
-        print("Assessment endpoint called - generating questions...")
-        questions = generate_interest_assessment()  # ← Remove 'await'
-        
-        if not questions:
-            raise HTTPException(status_code=500, detail="Failed to generate assessment")
+        cached = await interest_assessment_body()
+        # Same for every caller, so browsers and CDNs may keep it until our copy expires
+        max_age = max(int(cached["expires"] - time.monotonic()), 0)
+        headers = {"ETag": cached["etag"], "Cache-Control": f"public, max-age={max_age}"}
         
-        print(f"✓ Returning {len(questions)} questions")
-        
-        return {
-            "success": True,
-            "questions": questions
-        }
+        if_none_match = request.headers.get("if-none-match", "")
+        if cached["etag"] in (tag.strip() for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers=headers)
+        return Response(content=cached["body"], media_type="application/json", headers=headers)
         
     except Exception as e:
-        print(f"Error generating assessment: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error generating assessment")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _answer_text(value) -> Optional[str]:
+    """Plain answers are stored as-is, {"option": ..., "custom_text": ...} ones as JSON text"""
+    if value is None or isinstance(value, str):
+        return value
+    return orjson.dumps(value).decode()
+
+def insert_assessment_answers(cursor, user_id: int, answers: List[Dict]):
+    """Store the raw answers in one statement, however many there are"""
+    records = [
+        (user_id, answer.get('question_id'), answer.get('category'), _answer_text(answer.get('answer')))
+        for answer in answers
+    ]
+    if not records:
+        return
+    if USE_POSTGRES:
+        psycopg2.extras.execute_values(
+            cursor,
+            "INSERT INTO assessment_answers (user_id, question_id, category, answer) VALUES %s",
+            records
+        )
+    else:
+        cursor.executemany(
+            "INSERT INTO assessment_answers (user_id, question_id, category, answer) VALUES (?, ?, ?, ?)",
+            records
+        )
+
+def save_assessment_results(user_id: int, analysis: Dict, answers: List[Dict]):
+    """Write the profile from an assessment analysis and the raw answers in one
+    transaction (run as a background task)"""
+    # Serialize the interests once and bind the same parameter for both
+    # interests and interest_tags
+    interests_json = orjson.dumps(analysis['interests']).decode()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        execute_statement(
+            cursor, "assessment_upd",
+            (analysis['reading_level'], interests_json, user_id)
+        )
+        insert_assessment_answers(cursor, user_id, answers)
+
 @app.post("/api/assessment/submit")
-async def submit_assessment(request: Request):
+async def submit_assessment(request: Request, background_tasks: BackgroundTasks):
     """Submit assessment results (Phase 1 compatibility)"""
     data = await request.json()
     token = data.get("token")
@@ -636,32 +1558,9 @@ async def submit_assessment(request: Request):
     user_data = verify_token(token)
     user_id = user_data["user_id"]
     
-    # Analyze results
-    analysis = await analyze_assessment_results(answers)
-    
-    # Update user profile
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    if USE_POSTGRES:
-        cursor.execute(
-            """UPDATE users 
-               SET reading_level = %s, interests = %s, interest_tags = %s, level_estimate = %s
-               WHERE id = %s""",
-            (analysis['reading_level'], json.dumps(analysis['interests']), 
-             json.dumps(analysis['interests']), analysis['reading_level'], user_id)
-        )
-    else:
-        cursor.execute(
-            """UPDATE users 
-               SET reading_level = ?, interests = ?, interest_tags = ?, level_estimate = ?
-               WHERE id = ?""",
-            (analysis['reading_level'], json.dumps(analysis['interests']),
-             json.dumps(analysis['interests']), analysis['reading_level'], user_id)
-        )
-    
-    conn.commit()
-    conn.close()
+    # The response only needs the analysis; the profile is written after it is sent
+    analysis = analyze_assessment_results(answers)
+    background_tasks.add_task(save_assessment_results, user_id, analysis, answers)
     
     update_user_activity(user_id)
     
@@ -706,6 +1605,7 @@ async def run_gamification_migration(request: Request):
         
         conn.commit()
         conn.close()
+        invalidate_table_names_cache()
         
         return {"success": True, "message": "Gamification tables created"}
         
@@ -717,9 +1617,66 @@ async def run_gamification_migration(request: Request):
 # REPLACE THE OLD /api/admin/migrate ENDPOINT WITH THIS
 # This version is more robust and verifies tables were actually created
 
+def migrate_schema(conn, results: list) -> list:
+    """Create the Phase 2 tables on conn and return the ones that now exist, logging to results"""
+    cursor = conn.cursor()
+    
+    # Verify we're connected to PostgreSQL
+    results.append("Checking database connection...")
+    cursor.execute("SELECT version()")
+    version = cursor.fetchone()
+    results.append(f"Connected to: {version['version']}")
+    
+    # _migration_lock only covers this worker; wait out a migration in another
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+    
+    # One round trip and one commit for everything missing
+    missing_ddl = missing_tables_ddl(conn)
+    if missing_ddl:
+        cursor.execute(missing_ddl)
+        results.append("✓ tables and indexes created")
+    else:
+        results.append("✓ all tables already exist")
+    conn.commit()
+    
+    # Final verification - check all tables exist
+    results.append("\n=== Final Verification ===")
+    cursor.execute(
+        """SELECT table_name 
+           FROM information_schema.tables 
+           WHERE table_schema = 'public' 
+           AND table_name = ANY(%s)
+           ORDER BY table_name""",
+        (list(PHASE2_TABLES),)
+    )
+    
+    created_tables = [row['table_name'] for row in cursor.fetchall()]
+    results.append(f"Tables created: {', '.join(created_tables)}")
+    
+    if len(created_tables) != len(PHASE2_TABLES):
+        raise Exception(f"Only {len(created_tables)} tables created! Expected {len(PHASE2_TABLES)}.")
+    
+    return created_tables
+
+# One admin-triggered migration at a time in this worker (MIGRATION_LOCK_ID across workers)
+_migration_lock = threading.Lock()
+
+def run_schema_migration():
+    """Background body of /api/admin/migrate; releases _migration_lock when done"""
+    results = []
+    try:
+        with db_connection() as conn:
+            migrate_schema(conn, results)
+        log.info("Migration complete: %s", " | ".join(results))
+    except Exception:
+        log.exception("Migration failed: %s", " | ".join(results))
+    finally:
+        invalidate_table_names_cache()
+        _migration_lock.release()
+
 @app.post("/api/admin/migrate")
-async def run_migration(request: Request):
-    """Run database migration - FIXED VERSION"""
+async def run_migration(request: Request, background_tasks: BackgroundTasks):
+    """Schedule the Phase 2 table migration in the background"""
     data = await request.json()
     token = data.get("token")
     
@@ -729,258 +1686,53 @@ async def run_migration(request: Request):
     except:
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    conn = None
-    results = []
+    if not _migration_lock.acquire(blocking=False):
+        return {"status": "running", "message": "A migration is already in progress"}
     
-    try:
-        conn = get_db()
+    # init_db creates the tables at startup; this is only a manual re-run
+    background_tasks.add_task(run_schema_migration)
+    return ORJSONResponse(
+        status_code=202,
+        content={"status": "scheduled", "message": "Migration scheduled - see /api/admin/check-tables"}
+    )
+
+# ADD THIS TO app.py - Simple table checker
+
+# The table list only changes when a migration runs, which clears this
+TABLE_NAMES_CACHE_TTL = 30
+_table_names_cache = {"tables": None, "expires": 0.0}
+
+def invalidate_table_names_cache():
+    _table_names_cache["expires"] = 0.0
+
+def fetch_table_names() -> list:
+    """Names of every table in the public schema"""
+    with db_connection() as conn:
         cursor = conn.cursor()
-        
-        # Verify we're connected to PostgreSQL
-        results.append("Checking database connection...")
-        cursor.execute("SELECT version()")
-        version = cursor.fetchone()
-        results.append(f"Connected to: {version[0] if isinstance(version, tuple) else version['version']}")
-        
-        # Create passages table
-        results.append("\n=== Creating passages table ===")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS passages (
-                id SERIAL PRIMARY KEY,
-                title VARCHAR(255) NOT NULL,
-                content TEXT NOT NULL,
-                source VARCHAR(50) NOT NULL,
-                topic_tags TEXT,
-                word_count INTEGER NOT NULL,
-                readability_score REAL,
-                flesch_ease REAL,
-                difficulty_level VARCHAR(20),
-                estimated_minutes INTEGER,
-                approved BOOLEAN DEFAULT FALSE,
-                created_by INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                metadata TEXT
-            )
-        """)
-        results.append("✓ passages table created")
-        
-        # Commit after each table
-        conn.commit()
-        results.append("✓ passages committed")
-        
-        # Verify table exists
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_name = 'passages'
-            )
-        """)
-        exists = cursor.fetchone()[0] if isinstance(cursor.fetchone(), tuple) else cursor.fetchone()
-        if not exists:
-            raise Exception("passages table was not created!")
-        results.append("✓ passages table verified")
-        
-        # Create indexes for passages
-        results.append("\n=== Creating passages indexes ===")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_passages_difficulty ON passages(difficulty_level)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_passages_word_count ON passages(word_count)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_passages_approved ON passages(approved)")
-        conn.commit()
-        results.append("✓ passages indexes created")
-        
-        # Create passage_questions table
-        results.append("\n=== Creating passage_questions table ===")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS passage_questions (
-                id SERIAL PRIMARY KEY,
-                passage_id INTEGER NOT NULL,
-                question_text TEXT NOT NULL,
-                question_type VARCHAR(50),
-                correct_answer TEXT NOT NULL,
-                options TEXT,
-                explanation TEXT,
-                difficulty INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (passage_id) REFERENCES passages(id) ON DELETE CASCADE
-            )
-        """)
-        conn.commit()
-        results.append("✓ passage_questions table created")
-        
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_questions_passage ON passage_questions(passage_id)")
-        conn.commit()
-        results.append("✓ passage_questions index created")
-        
-        # Create session_logs table
-        results.append("\n=== Creating session_logs table ===")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS session_logs (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                passage_id INTEGER NOT NULL,
-                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                completed_at TIMESTAMP,
-                completion_status VARCHAR(20),
-                time_spent_seconds INTEGER,
-                feedback VARCHAR(20),
-                comprehension_score REAL,
-                answers TEXT,
-                notes TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                FOREIGN KEY (passage_id) REFERENCES passages(id)
-            )
-        """)
-        conn.commit()
-        results.append("✓ session_logs table created")
-        
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_session_user ON session_logs(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_session_passage ON session_logs(passage_id)")
-        conn.commit()
-        results.append("✓ session_logs indexes created")
-        
-        # Create writing_exercises table
-        results.append("\n=== Creating writing_exercises table ===")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS writing_exercises (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                passage_id INTEGER,
-                prompt TEXT NOT NULL,
-                user_response TEXT NOT NULL,
-                ai_feedback TEXT,
-                score REAL,
-                revised_response TEXT,
-                submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                revision_submitted_at TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                FOREIGN KEY (passage_id) REFERENCES passages(id)
-            )
-        """)
-        conn.commit()
-        results.append("✓ writing_exercises table created")
-        
-        # Create vocabulary_tracker table
-        results.append("\n=== Creating vocabulary_tracker table ===")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS vocabulary_tracker (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                word VARCHAR(100) NOT NULL,
-                definition TEXT,
-                encountered_count INTEGER DEFAULT 1,
-                mastered BOOLEAN DEFAULT FALSE,
-                context_passage_id INTEGER,
-                first_encountered TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_reviewed TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                FOREIGN KEY (context_passage_id) REFERENCES passages(id)
-            )
-        """)
-        conn.commit()
-        results.append("✓ vocabulary_tracker table created")
-        
-        # Create discussions table
-        results.append("\n=== Creating discussions table ===")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS discussions (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                passage_id INTEGER NOT NULL,
-                message_role VARCHAR(20) NOT NULL,
-                message_content TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                FOREIGN KEY (passage_id) REFERENCES passages(id)
-            )
-        """)
-        conn.commit()
-        results.append("✓ discussions table created")
-        
-        # Final verification - check all tables exist
-        results.append("\n=== Final Verification ===")
         cursor.execute("""
             SELECT table_name 
             FROM information_schema.tables 
-            WHERE table_schema = 'public' 
-            AND table_name IN ('passages', 'passage_questions', 'session_logs', 
-                               'writing_exercises', 'vocabulary_tracker', 'discussions')
+            WHERE table_schema = 'public'
             ORDER BY table_name
         """)
-        
-        created_tables = [row[0] if isinstance(row, tuple) else row['table_name'] for row in cursor.fetchall()]
-        results.append(f"Tables created: {', '.join(created_tables)}")
-        
-        if len(created_tables) != 6:
-            raise Exception(f"Only {len(created_tables)} tables created! Expected 6.")
-        
-        results.append("\n" + "=" * 50)
-        results.append("✓✓✓ MIGRATION COMPLETE - ALL 6 TABLES VERIFIED ✓✓✓")
-        results.append("=" * 50)
-        
-        return {
-            "success": True,
-            "message": "Migration completed and verified",
-            "tables_created": created_tables,
-            "details": results
-        }
-        
-    except Exception as e:
-        if conn:
-            conn.rollback()
-        
-        results.append(f"\n✗ ERROR: {str(e)}")
-        
-        import traceback
-        error_trace = traceback.format_exc()
-        results.append(error_trace)
-        
-        return {
-            "success": False,
-            "message": "Migration failed",
-            "error": str(e),
-            "details": results,
-            "traceback": error_trace
-        }
-        
-    finally:
-        if conn:
-            conn.close()
-        
-# ADD THIS TO app.py - Simple table checker
+        return [row['table_name'] for row in cursor.fetchall()]
 
 @app.get("/api/admin/check-tables")
 async def check_tables():
     """Check which tables exist in the database"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
     try:
-        # Query to get all table names
-        cursor.execute("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public'
-            ORDER BY table_name
-        """)
-        
-        tables = [row[0] if isinstance(row, tuple) else row['table_name'] for row in cursor.fetchall()]
+        if time.monotonic() < _table_names_cache["expires"]:
+            tables = _table_names_cache["tables"]
+        else:
+            tables = await run_in_threadpool(fetch_table_names)
+            _table_names_cache["tables"] = tables
+            _table_names_cache["expires"] = time.monotonic() + TABLE_NAMES_CACHE_TTL
         
         # Check which Phase 2 tables exist
-        required_tables = [
-            'passages',
-            'passage_questions', 
-            'session_logs',
-            'writing_exercises',
-            'vocabulary_tracker',
-            'discussions'
-        ]
+        required_tables = list(PHASE2_TABLES)
         
         missing_tables = [t for t in required_tables if t not in tables]
         
-        conn.close()
-        
         return {
             "all_tables": tables,
             "required_tables": required_tables,
@@ -990,7 +1742,6 @@ async def check_tables():
         }
         
     except Exception as e:
-        conn.close()
         return {
             "error": str(e),
             "status": "error"
@@ -1000,13 +1751,32 @@ async def check_tables():
 # PHASE 2: ONBOARDING ENDPOINTS
 # ============================================
 
+# Initial (level estimate, grade band) for each onboarding age band
+AGE_BAND_PROFILES = {
+    "under-18": ("beginner", "high"),
+    "18-24": ("intermediate", "adult"),
+    "25-34": ("intermediate", "adult"),
+    "35-44": ("intermediate", "adult"),
+    "45+": ("intermediate", "adult")
+}
+DEFAULT_AGE_BAND_PROFILE = ("intermediate", "adult")
+
+def save_onboarding_profile(user_id: int, interests: list, age_band, level_estimate: str, grade_band: str):
+    """Store the interests and age-based level picked during onboarding"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        execute_statement(
+            cursor, "onboard_upd",
+            (json_param(interests), age_band, level_estimate, grade_band, user_id)
+        )
+
 @app.post("/api/onboard/interests")
 async def onboard_interests(request: Request):
     """Process interest onboarding and update user profile"""
     data = await request.json()
     token = data.get("token")
-    interests = data.get("interests", [])
-    topics = data.get("topics", [])
+    interests = data.get("interests") or []
+    topics = data.get("topics") or []
     age_band = data.get("age_band")
     
     if not token:
@@ -1018,47 +1788,13 @@ async def onboard_interests(request: Request):
     # Combine interests and topics
     all_interests = list(set(interests + topics))
     
-    # Determine initial level estimate based on age
-    level_map = {
-        "18-24": "intermediate",
-        "25-34": "intermediate",
-        "35-44": "intermediate",
-        "45+": "intermediate",
-        "under-18": "beginner"
-    }
-    level_estimate = level_map.get(age_band, "intermediate")
-    
-    # Determine grade band
-    grade_map = {
-        "under-18": "high",
-        "18-24": "adult",
-        "25-34": "adult",
-        "35-44": "adult",
-        "45+": "adult"
-    }
-    grade_band = grade_map.get(age_band, "adult")
+    # Determine initial level estimate and grade band based on age
+    level_estimate, grade_band = AGE_BAND_PROFILES.get(age_band, DEFAULT_AGE_BAND_PROFILE)
     
     # Update user profile
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    if USE_POSTGRES:
-        cursor.execute(
-            """UPDATE users 
-               SET interest_tags = %s, age_band = %s, level_estimate = %s, grade_band = %s, last_active = NOW()
-               WHERE id = %s""",
-            (json.dumps(all_interests), age_band, level_estimate, grade_band, user_id)
-        )
-    else:
-        cursor.execute(
-            """UPDATE users 
-               SET interest_tags = ?, age_band = ?, level_estimate = ?, grade_band = ?, last_active = CURRENT_TIMESTAMP
-               WHERE id = ?""",
-            (json.dumps(all_interests), age_band, level_estimate, grade_band, user_id)
-        )
-    
-    conn.commit()
-    conn.close()
+    await run_in_threadpool(
+        save_onboarding_profile, user_id, all_interests, age_band, level_estimate, grade_band
+    )
     
     update_user_activity(user_id)
     
@@ -1071,85 +1807,175 @@ async def onboard_interests(request: Request):
         }
     }
 
-# ============================================
-# PHASE 2: READING ENDPOINTS
-# ============================================
+def save_profile(user_id: int, reading_level, interests, level_estimate, age_band, grade_band,
+                 answers: Optional[List[Dict]] = None) -> Optional[dict]:
+    """Write assessment and onboarding results in one UPDATE (plus any raw answers),
+    returning the stored profile"""
+    interests_json = orjson.dumps(interests).decode() if interests is not None else None
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        execute_statement(
+            cursor, "profile_upd",
+            (reading_level, interests_json, level_estimate, age_band, grade_band, user_id)
+        )
+        row = cursor.fetchone()
+        if row and answers:
+            insert_assessment_answers(cursor, user_id, answers)
+    if not row:
+        return None
+    profile = dict(row)
+    profile["interest_tags"] = load_json_list(profile["interest_tags"])
+    return profile
 
-@app.get("/api/read/sample")
-async def get_reading_sample(token: str, challenge: str = "appropriate"):
-    """Get a reading passage matched to user's level and interests"""
-    user_data = verify_token(token)
-    user_id = user_data["user_id"]
+@app.post("/api/profile/update")
+async def update_profile(request: Request):
+    """Assessment answers and onboarding interests in one request and one write.
     
-    conn = get_db()
-    cursor = conn.cursor()
+    Accepts any of answers, interests, topics and age_band; fields left out keep
+    their stored values.
+    """
+    data = await request.json()
+    token = data.get("token")
+    answers = data.get("answers")
+    age_band = data.get("age_band")
     
-    # Get user profile
-    if USE_POSTGRES:
-        cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-    else:
-        cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+    if not token:
+        raise HTTPException(status_code=401, detail="Authentication required")
     
-    user = cursor.fetchone()
+    user_data = verify_token(token)
+    user_id = user_data["user_id"]
     
-    if not user:
+    reading_level = level_estimate = grade_band = None
+    interests = None
+    analysis = None
+    
+    if "interests" in data or "topics" in data:
+        interests = list(set((data.get("interests") or []) + (data.get("topics") or [])))
+    if age_band:
+        level_estimate, grade_band = AGE_BAND_PROFILES.get(age_band, DEFAULT_AGE_BAND_PROFILE)
+    if answers:
+        # The assessment is the better measure of level, so it wins over the age estimate
+        analysis = await run_in_threadpool(analyze_assessment_results, answers)
+        reading_level = level_estimate = analysis["reading_level"]
+        interests = list(dict.fromkeys((interests or []) + analysis["interests"]))
+    
+    profile = await run_in_threadpool(
+        save_profile, user_id, reading_level, interests, level_estimate, age_band, grade_band, answers
+    )
+    if profile is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    level_estimate = user.get('level_estimate') or 'intermediate'
-    interest_tags = json.loads(user.get('interest_tags') or '[]')
-    total_read = user.get('total_passages_read') or 0
-    
-    # For first passage, make it easier (quick win strategy)
-    if total_read == 0:
-        challenge = "easier"
-        target_words = 150
-    else:
-        target_words = 200
-    
-    # Try to get a passage from database first
-    # TODO: Implement database passage retrieval with matching
-    # For now, generate a new one
-    
-    if not content_generator:
-        raise HTTPException(status_code=503, detail="Content generation not available. Please configure OpenAI API key.")
-    
-    # Pick a topic from interests or random
-    topic = random.choice(interest_tags) if interest_tags else random.choice(["science", "technology", "history", "nature"])
-    
-    # Adjust difficulty based on challenge parameter
-    difficulty_map = {
-        "easier": "beginner" if level_estimate == "intermediate" else level_estimate,
-        "appropriate": level_estimate,
-        "challenging": "advanced" if level_estimate == "intermediate" else level_estimate
+    return {
+        "success": True,
+        "profile": profile,
+        "analysis": analysis
     }
-    difficulty = difficulty_map.get(challenge, level_estimate)
+
+# ============================================
+# PHASE 2: READING ENDPOINTS
+# ============================================
+
+# Generated passages are shared: a reader gets an approved passage on one of
+# their topics at the same difficulty and length that they haven't seen
+# before the generator is called. Covered by idx_passages_cache_lookup and
+# idx_passages_topic_tags_gin.
+PASSAGE_CACHE_WORD_SLACK = 20
+
+def fetch_reader_profile(user_id: int) -> Optional[dict]:
+    """Level, interests and passage count used to pick the next passage"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        execute_statement(cursor, "reader_sel", (user_id,))
+        row = cursor.fetchone()
+    return dict(row) if row else None
+
+def insert_session_log(cursor, user_id: int, passage_id: int) -> int:
+    """Open a reading session for user_id on passage_id, returning the session id"""
+    execute_statement(cursor, "session_ins", (user_id, passage_id))
+    return cursor.fetchone()['id']
+
+def find_cached_passage(user_id: int, topics: list, difficulty: str, target_words: int):
+    """Pick an unread approved passage (with its questions) on any of topics and open a session on it.
     
-    print(f"Generating passage: topic={topic}, difficulty={difficulty}, words={target_words}")
+    Returns (passage, questions, session_id), or None when nothing new matches for the user.
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        if USE_POSTGRES:
+            execute_statement(
+                cursor,
+                "cached_passage_sel",
+                (difficulty, list(topics),
+                 target_words - PASSAGE_CACHE_WORD_SLACK, target_words + PASSAGE_CACHE_WORD_SLACK, user_id)
+            )
+        else:
+            # JSON-in-TEXT here; overlap of the tag array with the topics, same as ?| on Postgres.
+            # The topics go in as one JSON parameter so the statement text never changes.
+            cursor.execute(
+                """SELECT p.id, p.title, p.content, p.word_count, p.estimated_minutes, p.difficulty_level
+                   FROM passages p
+                   WHERE p.approved AND p.difficulty_level = ?
+                     AND EXISTS (SELECT 1 FROM json_each(p.topic_tags) t
+                                 WHERE t.value IN (SELECT value FROM json_each(?)))
+                     AND p.word_count BETWEEN ? AND ?
+                     AND NOT EXISTS (SELECT 1 FROM session_logs s WHERE s.passage_id = p.id AND s.user_id = ?)
+                     AND EXISTS (SELECT 1 FROM passage_questions q WHERE q.passage_id = p.id)
+                   ORDER BY RANDOM() LIMIT 1""",
+                (difficulty, json.dumps(list(topics)),
+                 target_words - PASSAGE_CACHE_WORD_SLACK, target_words + PASSAGE_CACHE_WORD_SLACK, user_id)
+            )
+        row = cursor.fetchone()
+        if not row:
+            return None
+        passage = dict(row)
+        
+        execute_statement(cursor, "passage_questions_sel", (passage['id'],))
+        # Same shape the generator returns
+        questions = [
+            {
+                "question": q['question_text'],
+                "type": q['question_type'],
+                "correct_answer": q['correct_answer'],
+                "options": load_json_list(q['options']),
+                "explanation": q['explanation'],
+                "difficulty": q['difficulty'],
+            }
+            for q in cursor.fetchall()
+        ]
+        
+        session_id = insert_session_log(cursor, user_id, passage['id'])
     
+    return passage, questions, session_id
+
+async def lookup_cached_passage(user_id: int, plan: dict):
+    """find_cached_passage for a reading plan; a failed lookup counts as a miss so generation can take over"""
     try:
-        # Generate passage
-        passage_data = content_generator.generate_passage(
-            topic=topic,
-            difficulty_level=difficulty,
-            target_words=target_words,
-            user_interests=interest_tags
+        return await run_in_threadpool(
+            find_cached_passage, user_id, plan["topics"], plan["difficulty"], plan["target_words"]
         )
+    except Exception as e:
+        log.error("Passage cache lookup failed: %s", e)
+        return None
+
+def save_generated_passage(user_id: int, passage_data: dict):
+    """Store a generated passage and open a session log for it, returning (passage_id, session_id)"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
         
-        # Save to database
         if USE_POSTGRES:
-            cursor.execute(
-                """INSERT INTO passages 
-                   (title, content, source, topic_tags, word_count, readability_score, flesch_ease, 
-                    difficulty_level, estimated_minutes, approved, created_by)
-                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id""",
+            execute_statement(
+                cursor,
+                "generated_passage_ins",
                 (passage_data['title'], passage_data['content'], passage_data['source'],
-                 json.dumps(passage_data['topic_tags']), passage_data['word_count'],
+                 json_param(passage_data['topic_tags']), passage_data['word_count'],
                  passage_data.get('readability_score'), passage_data.get('flesch_ease'),
                  passage_data['difficulty_level'], passage_data.get('estimated_minutes'),
-                 True, 1)  # Auto-approve AI content for now
+                 True, 1,  # Auto-approve AI content for now
+                 user_id)
             )
             result = cursor.fetchone()
-            passage_id = result['id']
+            passage_id, session_id = result['passage_id'], result['session_id']
         else:
             cursor.execute(
                 """INSERT INTO passages 
@@ -1157,79 +1983,227 @@ async def get_reading_sample(token: str, challenge: str = "appropriate"):
                     difficulty_level, estimated_minutes, approved, created_by)
                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
                 (passage_data['title'], passage_data['content'], passage_data['source'],
-                 json.dumps(passage_data['topic_tags']), passage_data['word_count'],
+                 json_param(passage_data['topic_tags']), passage_data['word_count'],
                  passage_data.get('readability_score'), passage_data.get('flesch_ease'),
                  passage_data['difficulty_level'], passage_data.get('estimated_minutes'),
                  True, 1)
             )
             passage_id = cursor.lastrowid
-        
-        # Generate comprehension questions
-        questions = content_generator.generate_comprehension_questions(
+            
+            session_id = insert_session_log(cursor, user_id, passage_id)
+    
+    return passage_id, session_id
+
+def insert_passage_questions(cursor, passage_id: int, questions: list):
+    """Add a passage's comprehension questions on cursor in one batched INSERT"""
+    question_rows = [
+        (passage_id, q['question'], q.get('type'), q['correct_answer'],
+         json.dumps(q.get('options', [])), q.get('explanation'), q.get('difficulty', 1))
+        for q in questions
+    ]
+    if not question_rows:
+        return
+    if USE_POSTGRES:
+        psycopg2.extras.execute_values(
+            cursor,
+            """INSERT INTO passage_questions 
+               (passage_id, question_text, question_type, correct_answer, options, explanation, difficulty)
+               VALUES %s""",
+            question_rows
+        )
+    else:
+        cursor.executemany(
+            """INSERT INTO passage_questions 
+               (passage_id, question_text, question_type, correct_answer, options, explanation, difficulty)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            question_rows
+        )
+
+def save_passage_questions(passage_id: int, questions: list):
+    """Store a passage's comprehension questions"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        # One batched INSERT instead of a round-trip per question
+        insert_passage_questions(cursor, passage_id, questions)
+
+DEFAULT_READING_TOPICS = ["science", "technology", "history", "nature"]
+
+async def plan_reading_sample(user_id: int, challenge: str) -> dict:
+    """Load the reader's profile and work out what the next passage should look like"""
+    user = await run_in_threadpool(fetch_reader_profile, user_id)
+    
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    level_estimate = user.get('level_estimate') or 'intermediate'
+    interest_tags = load_json_list(user.get('interest_tags'))
+    total_read = user.get('total_passages_read') or 0
+    
+    # For first passage, make it easier (quick win strategy)
+    if total_read == 0:
+        challenge = "easier"
+        target_words = 150
+    else:
+        target_words = 200
+    
+    # Adjust difficulty based on challenge parameter
+    difficulty_map = {
+        "easier": "beginner" if level_estimate == "intermediate" else level_estimate,
+        "appropriate": level_estimate,
+        "challenging": "advanced" if level_estimate == "intermediate" else level_estimate
+    }
+    
+    return {
+        "interest_tags": interest_tags,
+        # Topics to draw from - the user's interests, or a general mix
+        "topics": interest_tags or DEFAULT_READING_TOPICS,
+        "difficulty": difficulty_map.get(challenge, level_estimate),
+        "target_words": target_words,
+        "total_read": total_read,
+    }
+
+async def store_generated_passage(user_id: int, passage_data: dict):
+    """Save a freshly generated passage and its questions, returning (passage_id, session_id, questions)"""
+    # Questions only need the passage text, so generate them while the
+    # passage and session log are being written
+    questions_task = asyncio.create_task(
+        content_generator.generate_comprehension_questions_async(
             passage_text=passage_data['content'],
             passage_title=passage_data['title'],
             num_questions=3  # Start with 3 questions
         )
+    )
+    try:
+        passage_id, session_id = await run_in_threadpool(save_generated_passage, user_id, passage_data)
+    except Exception:
+        questions_task.cancel()
+        raise
+    
+    questions = await questions_task
+    await run_in_threadpool(save_passage_questions, passage_id, questions)
+    return passage_id, session_id, questions
+
+def reading_sample_response(passage_id: int, session_id: int, passage: dict, questions: list, total_read: int) -> dict:
+    return {
+        "passage_id": passage_id,
+        "session_id": session_id,
+        "title": passage['title'],
+        "content": passage['content'],
+        "word_count": passage['word_count'],
+        "estimated_minutes": passage.get('estimated_minutes') or 2,
+        "difficulty_level": passage['difficulty_level'],
+        "vocabulary": passage.get('vocabulary_words', []),
+        "questions": questions,
+        "is_first_passage": total_read == 0
+    }
+
+@app.get("/api/read/sample")
+async def get_reading_sample(token: str, challenge: str = "appropriate"):
+    """Get a reading passage matched to user's level and interests"""
+    user_data = verify_token(token)
+    user_id = user_data["user_id"]
+    
+    plan = await plan_reading_sample(user_id, challenge)
+    difficulty, target_words = plan["difficulty"], plan["target_words"]
+    
+    # Try to get a passage from database first - the random pick across
+    # all of the topics happens in the same query
+    cached = await lookup_cached_passage(user_id, plan)
+    if cached:
+        passage, questions, session_id = cached
+        update_user_activity(user_id)
+        return reading_sample_response(passage['id'], session_id, passage, questions, plan["total_read"])
+    
+    if not content_generator:
+        raise HTTPException(status_code=503, detail="Content generation not available. Please configure OpenAI API key.")
+    
+    topic = random.choice(plan["topics"])
+    log.debug("Generating passage: topic=%s, difficulty=%s, words=%s", topic, difficulty, target_words)
+    
+    try:
+        # Generate passage
+        passage_data = await content_generator.generate_passage_async(
+            topic=topic,
+            difficulty_level=difficulty,
+            word_count_min=target_words,
+            word_count_max=target_words,
+            user_interests=plan["interest_tags"]
+        )
         
-        # Save questions
-        for q in questions:
-            if USE_POSTGRES:
-                cursor.execute(
-                    """INSERT INTO passage_questions 
-                       (passage_id, question_text, question_type, correct_answer, options, explanation, difficulty)
-                       VALUES (%s, %s, %s, %s, %s, %s, %s)""",
-                    (passage_id, q['question'], q.get('type'), q['correct_answer'],
-                     json.dumps(q.get('options', [])), q.get('explanation'), q.get('difficulty', 1))
-                )
-            else:
-                cursor.execute(
-                    """INSERT INTO passage_questions 
-                       (passage_id, question_text, question_type, correct_answer, options, explanation, difficulty)
-                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                    (passage_id, q['question'], q.get('type'), q['correct_answer'],
-                     json.dumps(q.get('options', [])), q.get('explanation'), q.get('difficulty', 1))
-                )
-        
-        # Create session log
-        if USE_POSTGRES:
-            cursor.execute(
-                """INSERT INTO session_logs (user_id, passage_id, started_at)
-                   VALUES (%s, %s, NOW()) RETURNING id""",
-                (user_id, passage_id)
-            )
-            result = cursor.fetchone()
-            session_id = result['id']
-        else:
-            cursor.execute(
-                """INSERT INTO session_logs (user_id, passage_id, started_at)
-                   VALUES (?, ?, CURRENT_TIMESTAMP)""",
-                (user_id, passage_id)
-            )
-            session_id = cursor.lastrowid
-        
-        conn.commit()
-        conn.close()
+        passage_id, session_id, questions = await store_generated_passage(user_id, passage_data)
         
         update_user_activity(user_id)
         
-        return {
-            "passage_id": passage_id,
-            "session_id": session_id,
-            "title": passage_data['title'],
-            "content": passage_data['content'],
-            "word_count": passage_data['word_count'],
-            "estimated_minutes": passage_data.get('estimated_minutes', 2),
-            "difficulty_level": passage_data['difficulty_level'],
-            "vocabulary": passage_data.get('vocabulary_words', []),
-            "questions": questions,
-            "is_first_passage": total_read == 0
-        }
+        return reading_sample_response(passage_id, session_id, passage_data, questions, plan["total_read"])
         
     except Exception as e:
-        conn.close()
-        print(f"Error generating passage: {e}")
+        log.error("Error generating passage: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to generate passage: {str(e)}")
 
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.get("/api/read/sample/stream")
+async def stream_reading_sample(token: str, challenge: str = "appropriate"):
+    """Same as /api/read/sample, as server-sent events.
+    
+    A freshly generated passage body arrives as "text" events while the model is
+    still writing; every request ends with a "passage" event carrying the full
+    /api/read/sample payload, or an "error" event.
+    """
+    user_data = verify_token(token)
+    user_id = user_data["user_id"]
+    
+    plan = await plan_reading_sample(user_id, challenge)
+    difficulty, target_words = plan["difficulty"], plan["target_words"]
+    
+    cached = await lookup_cached_passage(user_id, plan)
+    if not cached and not content_generator:
+        raise HTTPException(status_code=503, detail="Content generation not available. Please configure OpenAI API key.")
+    
+    async def event_stream():
+        if cached:
+            passage, questions, session_id = cached
+            update_user_activity(user_id)
+            yield sse_event("passage", reading_sample_response(passage['id'], session_id, passage, questions, plan["total_read"]))
+            return
+        
+        topic = random.choice(plan["topics"])
+        log.debug("Streaming passage: topic=%s, difficulty=%s, words=%s", topic, difficulty, target_words)
+        
+        try:
+            async for kind, value in content_generator.stream_passage(
+                topic=topic,
+                difficulty_level=difficulty,
+                word_count_min=target_words,
+                word_count_max=target_words,
+                user_interests=plan["interest_tags"]
+            ):
+                if kind == "text":
+                    yield sse_event("text", {"text": value})
+                else:
+                    passage_data = value
+            
+            # Saved once the client has the whole text; a client that
+            # disconnects mid-stream leaves nothing behind
+            passage_id, session_id, questions = await store_generated_passage(user_id, passage_data)
+            update_user_activity(user_id)
+            yield sse_event("passage", reading_sample_response(passage_id, session_id, passage_data, questions, plan["total_read"]))
+            
+        except Exception as e:
+            log.error("Error streaming passage: %s", e)
+            yield sse_event("error", {"detail": f"Failed to generate passage: {str(e)}"})
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+def record_reading_feedback(user_id: int, session_id: int, completion_status: str, time_spent: int, feedback: str):
+    """Close out the session log and update the reader's stats and level"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        execute_statement(cursor, "feedback_session_upd", (completion_status, time_spent, feedback, session_id))
+        execute_statement(cursor, "feedback_user_upd", (session_id, feedback, user_id))
+    invalidate_analytics_cache()
+
 @app.post("/api/read/feedback")
 async def submit_reading_feedback(request: Request):
     """Submit feedback on passage difficulty"""
@@ -1247,106 +2221,22 @@ async def submit_reading_feedback(request: Request):
     time_spent = data.get("time_spent", 0)
     completed = data.get("completed", True)
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Update session log
+    # Update session log and user stats off the event loop
     completion_status = 'completed' if completed else 'partial'
-    
-    if USE_POSTGRES:
-        cursor.execute(
-            """UPDATE session_logs 
-               SET completed_at = NOW(), completion_status = %s, time_spent_seconds = %s, feedback = %s
-               WHERE id = %s""",
-            (completion_status, time_spent, feedback, session_id)
-        )
-        
-        # Get passage to update user stats
-        cursor.execute(
-            """SELECT p.word_count FROM session_logs sl
-               JOIN passages p ON sl.passage_id = p.id
-               WHERE sl.id = %s""",
-            (session_id,)
-        )
-    else:
-        cursor.execute(
-            """UPDATE session_logs 
-               SET completed_at = CURRENT_TIMESTAMP, completion_status = ?, time_spent_seconds = ?, feedback = ?
-               WHERE id = ?""",
-            (completion_status, time_spent, feedback, session_id)
-        )
-        
-        cursor.execute(
-            """SELECT p.word_count FROM session_logs sl
-               JOIN passages p ON sl.passage_id = p.id
-               WHERE sl.id = ?""",
-            (session_id,)
-        )
-    
-    result = cursor.fetchone()
-    word_count = result['word_count'] if USE_POSTGRES else result[0]
-    
-    # Update user stats
-    if USE_POSTGRES:
-        cursor.execute(
-            """UPDATE users 
-               SET total_passages_read = total_passages_read + 1,
-                   words_per_session = (words_per_session + %s) / 2,
-                   last_active = NOW()
-               WHERE id = %s""",
-            (word_count, user_id)
-        )
-        
-        # Adjust level estimate based on feedback
-        if feedback == 'too_easy':
-            cursor.execute(
-                """UPDATE users 
-                   SET level_estimate = CASE 
-                       WHEN level_estimate = 'beginner' THEN 'intermediate'
-                       WHEN level_estimate = 'intermediate' THEN 'advanced'
-                       ELSE level_estimate
-                   END
-                   WHERE id = %s""",
-                (user_id,)
-            )
-        elif feedback == 'too_hard':
-            cursor.execute(
-                """UPDATE users 
-                   SET level_estimate = CASE 
-                       WHEN level_estimate = 'advanced' THEN 'intermediate'
-                       WHEN level_estimate = 'intermediate' THEN 'beginner'
-                       ELSE level_estimate
-                   END
-                   WHERE id = %s""",
-                (user_id,)
-            )
-    else:
-        cursor.execute(
-            """UPDATE users 
-               SET total_passages_read = total_passages_read + 1,
-                   words_per_session = (words_per_session + ?) / 2,
-                   last_active = CURRENT_TIMESTAMP
-               WHERE id = ?""",
-            (word_count, user_id)
-        )
-        
-        # Adjust level based on feedback (SQLite version)
-        if feedback == 'too_easy':
-            cursor.execute("SELECT level_estimate FROM users WHERE id = ?", (user_id,))
-            current_level = cursor.fetchone()[0]
-            new_level = 'intermediate' if current_level == 'beginner' else 'advanced' if current_level == 'intermediate' else current_level
-            cursor.execute("UPDATE users SET level_estimate = ? WHERE id = ?", (new_level, user_id))
-        elif feedback == 'too_hard':
-            cursor.execute("SELECT level_estimate FROM users WHERE id = ?", (user_id,))
-            current_level = cursor.fetchone()[0]
-            new_level = 'beginner' if current_level == 'intermediate' else 'intermediate' if current_level == 'advanced' else current_level
-            cursor.execute("UPDATE users SET level_estimate = ? WHERE id = ?", (new_level, user_id))
-    
-    conn.commit()
-    conn.close()
+    await run_in_threadpool(
+        record_reading_feedback, user_id, session_id, completion_status, time_spent, feedback
+    )
     
     return {"success": True, "message": "Feedback recorded"}
 
+def record_comprehension_score(user_id: int, session_id: int, answers: list, score: float):
+    """Store the answers on the session log and roll the score into the user's average"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        execute_statement(cursor, "comprehension_session_upd", (json.dumps(answers), score, session_id))
+        execute_statement(cursor, "comprehension_user_upd", (score, user_id))
+    invalidate_analytics_cache()
+
 @app.post("/api/read/comprehension")
 async def submit_comprehension_answers(request: Request):
     """Submit answers to comprehension questions"""
@@ -1362,47 +2252,12 @@ async def submit_comprehension_answers(request: Request):
     session_id = data.get("session_id")
     answers = data.get("answers", [])
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
     # Calculate score
-    correct_count = sum(1 for ans in answers if ans.get('is_correct', False))
+    correct_count = sum(bool(ans.get('is_correct')) for ans in answers)
     total_questions = len(answers)
     score = (correct_count / total_questions * 100) if total_questions > 0 else 0
     
-    # Update session log
-    if USE_POSTGRES:
-        cursor.execute(
-            """UPDATE session_logs 
-               SET answers = %s, comprehension_score = %s
-               WHERE id = %s""",
-            (json.dumps(answers), score, session_id)
-        )
-        
-        # Update user comprehension score (rolling average)
-        cursor.execute(
-            """UPDATE users 
-               SET comprehension_score = (comprehension_score + %s) / 2
-               WHERE id = %s""",
-            (score, user_id)
-        )
-    else:
-        cursor.execute(
-            """UPDATE session_logs 
-               SET answers = ?, comprehension_score = ?
-               WHERE id = ?""",
-            (json.dumps(answers), score, session_id)
-        )
-        
-        cursor.execute(
-            """UPDATE users 
-               SET comprehension_score = (comprehension_score + ?) / 2
-               WHERE id = ?""",
-            (score, user_id)
-        )
-    
-    conn.commit()
-    conn.close()
+    await run_in_threadpool(record_comprehension_score, user_id, session_id, answers, score)
     
     # Generate encouraging feedback
     if score >= 80:
@@ -1424,8 +2279,22 @@ async def submit_comprehension_answers(request: Request):
 # PHASE 2: DISCUSSION ENDPOINTS
 # ============================================
 
+def fetch_passage_content(passage_id: int) -> Optional[str]:
+    """Return a passage's text, or None if it doesn't exist"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        execute_statement(cursor, "passage_content_sel", (passage_id,))
+        passage = cursor.fetchone()
+    return passage['content'] if passage else None
+
+def save_discussion_messages(user_id: int, passage_id: int, user_message: str, ai_response: str):
+    """Store one user/assistant exchange about a passage"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        execute_statement(cursor, "discussion_ins", (user_id, passage_id, user_message, ai_response))
+
 @app.post("/api/discuss")
-async def discuss_passage(request: Request):
+async def discuss_passage(request: Request, background_tasks: BackgroundTasks):
     """Have a discussion about a passage with AI"""
     data = await request.json()
     token = data.get("token")
@@ -1442,52 +2311,21 @@ async def discuss_passage(request: Request):
     if not content_generator:
         raise HTTPException(status_code=503, detail="Discussion feature requires OpenAI API key")
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
     # Get passage content
-    if USE_POSTGRES:
-        cursor.execute("SELECT content FROM passages WHERE id = %s", (passage_id,))
-    else:
-        cursor.execute("SELECT content FROM passages WHERE id = ?", (passage_id,))
-    
-    passage = cursor.fetchone()
+    passage_text = await run_in_threadpool(fetch_passage_content, passage_id)
     
-    if not passage:
+    if passage_text is None:
         raise HTTPException(status_code=404, detail="Passage not found")
     
-    passage_text = passage['content'] if USE_POSTGRES else passage[0]
-    
-    # Generate AI response
+    # Generate AI response - the generator and the DB driver both block, so
+    # run them in the threadpool rather than on the event loop
     try:
-        ai_response = content_generator.generate_discussion_prompt(passage_text, user_message)
-        
-        # Save conversation
-        if USE_POSTGRES:
-            cursor.execute(
-                """INSERT INTO discussions (user_id, passage_id, message_role, message_content)
-                   VALUES (%s, %s, %s, %s)""",
-                (user_id, passage_id, 'user', user_message)
-            )
-            cursor.execute(
-                """INSERT INTO discussions (user_id, passage_id, message_role, message_content)
-                   VALUES (%s, %s, %s, %s)""",
-                (user_id, passage_id, 'assistant', ai_response)
-            )
-        else:
-            cursor.execute(
-                """INSERT INTO discussions (user_id, passage_id, message_role, message_content)
-                   VALUES (?, ?, ?, ?)""",
-                (user_id, passage_id, 'user', user_message)
-            )
-            cursor.execute(
-                """INSERT INTO discussions (user_id, passage_id, message_role, message_content)
-                   VALUES (?, ?, ?, ?)""",
-                (user_id, passage_id, 'assistant', ai_response)
-            )
+        ai_response = await run_in_threadpool(
+            content_generator.generate_discussion_prompt, passage_text, user_message
+        )
         
-        conn.commit()
-        conn.close()
+        # Save conversation after the response goes out - nothing in it depends on the write
+        background_tasks.add_task(save_discussion_messages, user_id, passage_id, user_message, ai_response)
         
         update_user_activity(user_id)
         
@@ -1497,45 +2335,76 @@ async def discuss_passage(request: Request):
         }
         
     except Exception as e:
-        conn.close()
-        print(f"Discussion error: {e}")
+        log.error("Discussion error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to generate response")
 
+# Upper bound on one page of discussion history
+DISCUSSION_PAGE_MAX = 200
+
+def fetch_discussion_page(user_id: int, passage_id: int, after_id: int, limit: int):
+    """One page of discussion history - JSON text on Postgres, a dict on SQLite"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        # Keyset on id (insertion order) - served by idx_discussion_user_passage_id
+        if USE_POSTGRES:
+            # Let Postgres build the JSON page and pass the text straight through
+            cursor.execute(
+                """SELECT json_build_object(
+                              'messages', COALESCE(json_agg(d ORDER BY d.id), '[]'),
+                              'last_id', MAX(d.id)
+                          )::text AS page
+                   FROM (SELECT id, message_role, message_content, created_at 
+                         FROM discussions 
+                         WHERE user_id = %s AND passage_id = %s AND id > %s
+                         ORDER BY id
+                         LIMIT %s) d""",
+                (user_id, passage_id, after_id, limit)
+            )
+            return cursor.fetchone()['page']
+        else:
+            cursor.execute(
+                """SELECT id, message_role, message_content, created_at 
+                   FROM discussions 
+                   WHERE user_id = ? AND passage_id = ? AND id > ?
+                   ORDER BY id
+                   LIMIT ?""",
+                (user_id, passage_id, after_id, limit)
+            )
+        
+        messages = [dict(row) for row in cursor.fetchall()]
+    
+    return {"messages": messages, "last_id": messages[-1]["id"] if messages else None}
+
 @app.get("/api/discuss/history")
-async def get_discussion_history(token: str, passage_id: int):
-    """Get discussion history for a passage"""
+async def get_discussion_history(token: str, passage_id: int, after_id: int = 0, limit: int = 50):
+    """Get a page of discussion history for a passage, oldest first.
+    
+    Pass the returned last_id back as after_id to fetch the next page.
+    """
     user_data = verify_token(token)
     user_id = user_data["user_id"]
+    limit = max(1, min(limit, DISCUSSION_PAGE_MAX))
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    if USE_POSTGRES:
-        cursor.execute(
-            """SELECT message_role, message_content, created_at 
-               FROM discussions 
-               WHERE user_id = %s AND passage_id = %s 
-               ORDER BY created_at ASC""",
-            (user_id, passage_id)
-        )
-    else:
-        cursor.execute(
-            """SELECT message_role, message_content, created_at 
-               FROM discussions 
-               WHERE user_id = ? AND passage_id = ? 
-               ORDER BY created_at ASC""",
-            (user_id, passage_id)
-        )
-    
-    messages = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    
-    return {"messages": messages}
+    page = await run_in_threadpool(fetch_discussion_page, user_id, passage_id, after_id, limit)
+    if isinstance(page, str):
+        return Response(content=page, media_type="application/json")
+    return page
 
 # ============================================
 # PHASE 2: WRITING ENDPOINTS
 # ============================================
 
+def save_writing_exercise(user_id: int, passage_id: Optional[int], prompt: str, user_response: str, feedback: dict) -> int:
+    """Store a writing response with its AI feedback, returning the new exercise id"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        execute_statement(
+            cursor, "writing_ins",
+            (user_id, passage_id, prompt, user_response, json.dumps(feedback), feedback.get('score'))
+        )
+        return cursor.fetchone()['id']
+
 @app.post("/api/write/submit")
 async def submit_writing(request: Request):
     """Submit a writing response for AI feedback"""
@@ -1565,49 +2434,24 @@ async def submit_writing(request: Request):
             "exercise_id": None
         }
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
     # Get passage context if provided
     passage_context = None
     if passage_id:
-        if USE_POSTGRES:
-            cursor.execute("SELECT content FROM passages WHERE id = %s", (passage_id,))
-        else:
-            cursor.execute("SELECT content FROM passages WHERE id = ?", (passage_id,))
-        
-        passage = cursor.fetchone()
-        passage_context = passage['content'] if passage else None
+        passage_context = await run_in_threadpool(fetch_passage_content, passage_id)
     
     # Generate feedback
     try:
-        feedback = content_generator.provide_writing_feedback(
+        feedback = await run_in_threadpool(
+            content_generator.provide_writing_feedback,
             prompt=prompt,
             user_response=user_response,
             passage_context=passage_context
         )
         
         # Save exercise
-        if USE_POSTGRES:
-            cursor.execute(
-                """INSERT INTO writing_exercises 
-                   (user_id, passage_id, prompt, user_response, ai_feedback, score)
-                   VALUES (%s, %s, %s, %s, %s, %s) RETURNING id""",
-                (user_id, passage_id, prompt, user_response, json.dumps(feedback), feedback.get('score'))
-            )
-            result = cursor.fetchone()
-            exercise_id = result['id']
-        else:
-            cursor.execute(
-                """INSERT INTO writing_exercises 
-                   (user_id, passage_id, prompt, user_response, ai_feedback, score)
-                   VALUES (?, ?, ?, ?, ?, ?)""",
-                (user_id, passage_id, prompt, user_response, json.dumps(feedback), feedback.get('score'))
-            )
-            exercise_id = cursor.lastrowid
-        
-        conn.commit()
-        conn.close()
+        exercise_id = await run_in_threadpool(
+            save_writing_exercise, user_id, passage_id, prompt, user_response, feedback
+        )
         
         update_user_activity(user_id)
         
@@ -1618,13 +2462,72 @@ async def submit_writing(request: Request):
         }
         
     except Exception as e:
-        conn.close()
-        print(f"Writing feedback error: {e}")
+        log.error("Writing feedback error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to generate feedback")
 
-@app.post("/api/write/revise")
-async def submit_revision(request: Request):
-    """Submit a revised writing response"""
+def fetch_passage_contents(passage_ids: list) -> dict:
+    """Texts for several passages in one query, keyed by id (missing ids are left out)"""
+    if not passage_ids:
+        return {}
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if USE_POSTGRES:
+            cursor.execute("SELECT id, content FROM passages WHERE id = ANY(%s)", (list(passage_ids),))
+        else:
+            placeholders = ", ".join("?" * len(passage_ids))
+            cursor.execute(f"SELECT id, content FROM passages WHERE id IN ({placeholders})", tuple(passage_ids))
+        return {row['id']: row['content'] for row in cursor.fetchall()}
+
+def create_pending_writing_exercises(user_id: int, submissions: list) -> list:
+    """Store submissions whose feedback will arrive later, returning their exercise ids"""
+    exercise_ids = []
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for item in submissions:
+            execute_statement(
+                cursor, "writing_ins",
+                (user_id, item.get("passage_id"), item.get("prompt"), item.get("response"), None, None)
+            )
+            exercise_ids.append(cursor.fetchone()['id'])
+    return exercise_ids
+
+def delete_pending_writing_exercises(user_id: int, exercise_ids: list):
+    """Remove pending exercises whose batch never got queued (ones with feedback are kept)"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if USE_POSTGRES:
+            cursor.execute(
+                "DELETE FROM writing_exercises WHERE user_id = %s AND id = ANY(%s) AND ai_feedback IS NULL",
+                (user_id, list(exercise_ids))
+            )
+        else:
+            placeholders = ", ".join("?" * len(exercise_ids))
+            cursor.execute(
+                f"DELETE FROM writing_exercises WHERE user_id = ? AND id IN ({placeholders}) AND ai_feedback IS NULL",
+                (user_id, *exercise_ids)
+            )
+
+def save_batch_writing_feedback(user_id: int, feedback_by_id: dict) -> dict:
+    """Attach batch feedback to the user's exercises; returns what was stored, by exercise id"""
+    saved = {}
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for exercise_id, feedback in feedback_by_id.items():
+            execute_statement(
+                cursor, "writing_feedback_upd",
+                (json.dumps(feedback), feedback.get('score'), int(exercise_id), user_id)
+            )
+            if cursor.fetchone():
+                saved[int(exercise_id)] = feedback
+    return saved
+
+@app.post("/api/write/submit_batch")
+async def submit_writing_batch(request: Request):
+    """Queue feedback for many writing responses at once (e.g. an assignment upload).
+    
+    Feedback goes through the OpenAI Batch API, which is half the price of the
+    interactive path but can take up to 24h; poll /api/write/batch/{batch_id}.
+    """
     data = await request.json()
     token = data.get("token")
     
@@ -1634,67 +2537,129 @@ async def submit_revision(request: Request):
     user_data = verify_token(token)
     user_id = user_data["user_id"]
     
-    exercise_id = data.get("exercise_id")
-    revised_response = data.get("revised_response")
+    submissions = data.get("submissions") or []
+    if not submissions:
+        raise HTTPException(status_code=400, detail="No submissions provided")
     
-    conn = get_db()
-    cursor = conn.cursor()
+    if not content_generator:
+        raise HTTPException(status_code=503, detail="Writing feedback requires OpenAI API key")
     
-    # Update exercise
-    if USE_POSTGRES:
-        cursor.execute(
-            """UPDATE writing_exercises 
-               SET revised_response = %s, revision_submitted_at = NOW()
-               WHERE id = %s AND user_id = %s""",
-            (revised_response, exercise_id, user_id)
-        )
-    else:
-        cursor.execute(
-            """UPDATE writing_exercises 
-               SET revised_response = ?, revision_submitted_at = CURRENT_TIMESTAMP
-               WHERE id = ? AND user_id = ?""",
-            (revised_response, exercise_id, user_id)
-        )
+    passage_ids = {item.get("passage_id") for item in submissions if item.get("passage_id")}
+    passages = await run_in_threadpool(fetch_passage_contents, list(passage_ids))
+    exercise_ids = await run_in_threadpool(create_pending_writing_exercises, user_id, submissions)
     
-    conn.commit()
-    conn.close()
+    try:
+        batch_id = await content_generator.submit_writing_feedback_batch([
+            (exercise_id, item.get("prompt"), item.get("response"), passages.get(item.get("passage_id")))
+            for exercise_id, item in zip(exercise_ids, submissions)
+        ])
+    except Exception as e:
+        log.error("Writing batch submission error: %s", e)
+        # Nothing will ever fill these in, so don't leave them in the history
+        await run_in_threadpool(delete_pending_writing_exercises, user_id, exercise_ids)
+        raise HTTPException(status_code=502, detail="Failed to queue writing feedback")
+    
+    update_user_activity(user_id)
     
     return {
         "success": True,
-        "message": "Excellent! Your revision shows real improvement!"
+        "batch_id": batch_id,
+        "exercise_ids": exercise_ids
     }
 
-@app.get("/api/write/history")
-async def get_writing_history(token: str, limit: int = 10):
-    """Get user's writing exercise history"""
+@app.get("/api/write/batch/{batch_id}")
+async def get_writing_batch(batch_id: str, token: str):
+    """Check a feedback batch; once it has completed, its feedback is saved and returned"""
     user_data = verify_token(token)
     user_id = user_data["user_id"]
     
-    conn = get_db()
-    cursor = conn.cursor()
+    if not content_generator:
+        raise HTTPException(status_code=503, detail="Writing feedback requires OpenAI API key")
     
-    if USE_POSTGRES:
-        cursor.execute(
-            """SELECT id, prompt, user_response, score, submitted_at, revised_response
-               FROM writing_exercises 
-               WHERE user_id = %s 
-               ORDER BY submitted_at DESC 
-               LIMIT %s""",
-            (user_id, limit)
-        )
-    else:
-        cursor.execute(
-            """SELECT id, prompt, user_response, score, submitted_at, revised_response
-               FROM writing_exercises 
-               WHERE user_id = ? 
-               ORDER BY submitted_at DESC 
-               LIMIT ?""",
-            (user_id, limit)
-        )
+    try:
+        status, results = await content_generator.fetch_writing_feedback_batch(batch_id)
+    except Exception as e:
+        log.error("Writing batch lookup error: %s", e)
+        raise HTTPException(status_code=502, detail="Failed to check writing feedback batch")
     
-    exercises = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    # Only exercises belonging to this user are updated (and reported)
+    saved = await run_in_threadpool(save_batch_writing_feedback, user_id, results) if results else {}
+    
+    return {
+        "success": True,
+        "status": status,
+        "exercises": [
+            {"exercise_id": exercise_id, "feedback": feedback}
+            for exercise_id, feedback in saved.items()
+        ]
+    }
+
+def save_writing_revision(user_id: int, exercise_id: int, revised_response: str):
+    """Store a revised response on one of the user's exercises"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        execute_statement(cursor, "revision_upd", (revised_response, exercise_id, user_id))
+
+@app.post("/api/write/revise")
+async def submit_revision(request: Request):
+    """Submit a revised writing response"""
+    data = await request.json()
+    token = data.get("token")
+    
+    if not token:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    user_data = verify_token(token)
+    user_id = user_data["user_id"]
+    
+    exercise_id = data.get("exercise_id")
+    revised_response = data.get("revised_response")
+    
+    await run_in_threadpool(save_writing_revision, user_id, exercise_id, revised_response)
+    
+    return {
+        "success": True,
+        "message": "Excellent! Your revision shows real improvement!"
+    }
+
+def fetch_writing_history(user_id: int, limit: int):
+    """The user's latest writing exercises - JSON array text on Postgres, a list on SQLite"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        if USE_POSTGRES:
+            # Let Postgres build the JSON array and pass the text straight through
+            cursor.execute(
+                """SELECT COALESCE(json_agg(w ORDER BY w.submitted_at DESC), '[]')::text AS exercises
+                   FROM (SELECT id, prompt, user_response, score, submitted_at, revised_response
+                         FROM writing_exercises 
+                         WHERE user_id = %s 
+                         ORDER BY submitted_at DESC 
+                         LIMIT %s) w""",
+                (user_id, limit)
+            )
+            return cursor.fetchone()['exercises']
+        else:
+            cursor.execute(
+                """SELECT id, prompt, user_response, score, submitted_at, revised_response
+                   FROM writing_exercises 
+                   WHERE user_id = ? 
+                   ORDER BY submitted_at DESC 
+                   LIMIT ?""",
+                (user_id, limit)
+            )
+        
+        return [dict(row) for row in cursor.fetchall()]
+
+@app.get("/api/write/history")
+async def get_writing_history(token: str, limit: int = 10):
+    """Get user's writing exercise history"""
+    user_data = verify_token(token)
+    user_id = user_data["user_id"]
     
+    exercises = await run_in_threadpool(fetch_writing_history, user_id, limit)
+    if isinstance(exercises, str):
+        return Response(content=f'{{"exercises":{exercises}}}', media_type="application/json")
     return {"exercises": exercises}
 
 # ============================================================
@@ -1759,24 +2724,16 @@ def award_points(user_id, points, reason, activity_type='general'):
                 )
         
         # Record in history
-        if USE_POSTGRES:
-            cursor.execute(
-                "INSERT INTO points_history (user_id, points, reason, activity_type) VALUES (%s, %s, %s, %s)",
-                (user_id, points, reason, activity_type)
-            )
-        else:
-            cursor.execute(
-                "INSERT INTO points_history (user_id, points, reason, activity_type) VALUES (?, ?, ?, ?)",
-                (user_id, points, reason, activity_type)
-            )
+        execute_sql(
+            cursor,
+            "INSERT INTO points_history (user_id, points, reason, activity_type) VALUES (%s, %s, %s, %s)",
+            (user_id, points, reason, activity_type)
+        )
         
         conn.commit()
         
         # Check for level up
-        if USE_POSTGRES:
-            cursor.execute("SELECT total_earned, level FROM user_points WHERE user_id = %s", (user_id,))
-        else:
-            cursor.execute("SELECT total_earned, level FROM user_points WHERE user_id = ?", (user_id,))
+        execute_sql(cursor, "SELECT total_earned, level FROM user_points WHERE user_id = %s", (user_id,))
         
         result = cursor.fetchone()
         total = result['total_earned'] if hasattr(result, 'keys') else result[0]
@@ -1785,10 +2742,7 @@ def award_points(user_id, points, reason, activity_type='general'):
         new_level = (total // 500) + 1
         
         if new_level > current_level:
-            if USE_POSTGRES:
-                cursor.execute("UPDATE user_points SET level = %s WHERE user_id = %s", (new_level, user_id))
-            else:
-                cursor.execute("UPDATE user_points SET level = ? WHERE user_id = ?", (new_level, user_id))
+            execute_sql(cursor, "UPDATE user_points SET level = %s WHERE user_id = %s", (new_level, user_id))
             conn.commit()
             conn.close()
             return {'points_awarded': points, 'level_up': True, 'new_level': new_level}
@@ -1807,10 +2761,7 @@ def has_badge(user_id, badge_type):
     conn = get_db()
     cursor = conn.cursor()
     
-    if USE_POSTGRES:
-        cursor.execute("SELECT id FROM user_badges WHERE user_id = %s AND badge_type = %s", (user_id, badge_type))
-    else:
-        cursor.execute("SELECT id FROM user_badges WHERE user_id = ? AND badge_type = ?", (user_id, badge_type))
+    execute_sql(cursor, "SELECT id FROM user_badges WHERE user_id = %s AND badge_type = %s", (user_id, badge_type))
     
     result = cursor.fetchone()
     conn.close()
@@ -1822,16 +2773,11 @@ def award_badge(user_id, badge_type, badge_name, description, icon):
     cursor = conn.cursor()
     
     try:
-        if USE_POSTGRES:
-            cursor.execute(
-                "INSERT INTO user_badges (user_id, badge_type, badge_name, description, icon) VALUES (%s, %s, %s, %s, %s)",
-                (user_id, badge_type, badge_name, description, icon)
-            )
-        else:
-            cursor.execute(
-                "INSERT INTO user_badges (user_id, badge_type, badge_name, description, icon) VALUES (?, ?, ?, ?, ?)",
-                (user_id, badge_type, badge_name, description, icon)
-            )
+        execute_sql(
+            cursor,
+            "INSERT INTO user_badges (user_id, badge_type, badge_name, description, icon) VALUES (%s, %s, %s, %s, %s)",
+            (user_id, badge_type, badge_name, description, icon)
+        )
         
         conn.commit()
         conn.close()
@@ -1852,16 +2798,11 @@ def check_and_award_badges(user_id):
     
     try:
         # Get lesson count
-        if USE_POSTGRES:
-            cursor.execute(
-                "SELECT COUNT(*) FROM session_logs WHERE user_id = %s AND completion_status = 'completed'",
-                (user_id,)
-            )
-        else:
-            cursor.execute(
-                "SELECT COUNT(*) FROM session_logs WHERE user_id = ? AND completion_status = 'completed'",
-                (user_id,)
-            )
+        execute_sql(
+            cursor,
+            "SELECT COUNT(*) FROM session_logs WHERE user_id = %s AND completion_status = 'completed'",
+            (user_id,)
+        )
         
         lesson_count = cursor.fetchone()[0]
         
@@ -1878,22 +2819,15 @@ def check_and_award_badges(user_id):
             new_badges.append(badge)
         
         # Perfect streak check
-        if USE_POSTGRES:
-            cursor.execute(
-                """SELECT comprehension_score FROM session_logs 
-                   WHERE user_id = %s AND completion_status = 'completed'
-                   ORDER BY completed_at DESC LIMIT 3""",
-                (user_id,)
-            )
-        else:
-            cursor.execute(
-                """SELECT comprehension_score FROM session_logs 
-                   WHERE user_id = ? AND completion_status = 'completed'
-                   ORDER BY completed_at DESC LIMIT 3""",
-                (user_id,)
-            )
+        execute_sql(
+            cursor,
+            """SELECT comprehension_score FROM session_logs 
+               WHERE user_id = %s AND completion_status = 'completed'
+               ORDER BY completed_at DESC LIMIT 3""",
+            (user_id,)
+        )
         
-        recent_scores = [row[0] if isinstance(row, tuple) else row['comprehension_score'] for row in cursor.fetchall()]
+        recent_scores = [row['comprehension_score'] for row in cursor.fetchall()]
         
         if len(recent_scores) >= 3 and all(score == 100 for score in recent_scores):
             if not has_badge(user_id, 'perfect_streak_3'):
@@ -1934,31 +2868,21 @@ def update_weekly_goals(user_id):
         week_start = week_start.date()
         
         # Get current week's goal
-        if USE_POSTGRES:
-            cursor.execute(
-                "SELECT * FROM weekly_goals WHERE user_id = %s AND week_start = %s AND goal_type = 'lessons_completed'",
-                (user_id, week_start)
-            )
-        else:
-            cursor.execute(
-                "SELECT * FROM weekly_goals WHERE user_id = ? AND week_start = ? AND goal_type = 'lessons_completed'",
-                (user_id, week_start)
-            )
+        execute_sql(
+            cursor,
+            "SELECT * FROM weekly_goals WHERE user_id = %s AND week_start = %s AND goal_type = 'lessons_completed'",
+            (user_id, week_start)
+        )
         
         goal = cursor.fetchone()
         
         if not goal:
             # Create new weekly goal
-            if USE_POSTGRES:
-                cursor.execute(
-                    "INSERT INTO weekly_goals (user_id, week_start, goal_type, target_value, points_reward) VALUES (%s, %s, %s, %s, %s)",
-                    (user_id, week_start, 'lessons_completed', 5, 100)
-                )
-            else:
-                cursor.execute(
-                    "INSERT INTO weekly_goals (user_id, week_start, goal_type, target_value, points_reward) VALUES (?, ?, ?, ?, ?)",
-                    (user_id, week_start, 'lessons_completed', 5, 100)
-                )
+            execute_sql(
+                cursor,
+                "INSERT INTO weekly_goals (user_id, week_start, goal_type, target_value, points_reward) VALUES (%s, %s, %s, %s, %s)",
+                (user_id, week_start, 'lessons_completed', 5, 100)
+            )
             conn.commit()
         else:
             # Update progress
@@ -1988,10 +2912,7 @@ def update_weekly_goals(user_id):
                 award_points(user_id, points_reward, 'Weekly goal completed', 'goal')
             else:
                 # Update progress
-                if USE_POSTGRES:
-                    cursor.execute("UPDATE weekly_goals SET current_value = %s WHERE id = %s", (new_value, goal_id))
-                else:
-                    cursor.execute("UPDATE weekly_goals SET current_value = ? WHERE id = ?", (new_value, goal_id))
+                execute_sql(cursor, "UPDATE weekly_goals SET current_value = %s WHERE id = %s", (new_value, goal_id))
                 conn.commit()
         
         conn.close()
@@ -2047,22 +2968,14 @@ async def save_lesson_progress(request: Request):
             session_id = cursor.lastrowid
         
         # Update user stats
-        if USE_POSTGRES:
-            cursor.execute(
-                """UPDATE users 
-                   SET total_passages_read = COALESCE(total_passages_read, 0) + 1,
-                       last_active = NOW()
-                   WHERE id = %s""",
-                (user_id,)
-            )
-        else:
-            cursor.execute(
-                """UPDATE users 
-                   SET total_passages_read = COALESCE(total_passages_read, 0) + 1,
-                       last_active = datetime('now')
-                   WHERE id = ?""",
-                (user_id,)
-            )
+        execute_sql(
+            cursor,
+            """UPDATE users 
+               SET total_passages_read = COALESCE(total_passages_read, 0) + 1,
+                   last_active = NOW()
+               WHERE id = %s""",
+            (user_id,)
+        )
         
         conn.commit()
         conn.close()
@@ -2115,10 +3028,7 @@ async def get_gamification_data(token: str):
         cursor = conn.cursor()
         
         # Get points
-        if USE_POSTGRES:
-            cursor.execute("SELECT * FROM user_points WHERE user_id = %s", (user_id,))
-        else:
-            cursor.execute("SELECT * FROM user_points WHERE user_id = ?", (user_id,))
+        execute_sql(cursor, "SELECT * FROM user_points WHERE user_id = %s", (user_id,))
         
         points_row = cursor.fetchone()
         
@@ -2132,10 +3042,7 @@ async def get_gamification_data(token: str):
             points_data = {'current_points': 0, 'total_earned': 0, 'level': 1}
         
         # Get badges
-        if USE_POSTGRES:
-            cursor.execute("SELECT * FROM user_badges WHERE user_id = %s ORDER BY earned_at DESC", (user_id,))
-        else:
-            cursor.execute("SELECT * FROM user_badges WHERE user_id = ? ORDER BY earned_at DESC", (user_id,))
+        execute_sql(cursor, "SELECT * FROM user_badges WHERE user_id = %s ORDER BY earned_at DESC", (user_id,))
         
         badges = []
         for row in cursor.fetchall():
@@ -2152,10 +3059,7 @@ async def get_gamification_data(token: str):
         week_start = datetime.now() - timedelta(days=datetime.now().weekday())
         week_start = week_start.date()
         
-        if USE_POSTGRES:
-            cursor.execute("SELECT * FROM weekly_goals WHERE user_id = %s AND week_start = %s", (user_id, week_start))
-        else:
-            cursor.execute("SELECT * FROM weekly_goals WHERE user_id = ? AND week_start = ?", (user_id, week_start))
+        execute_sql(cursor, "SELECT * FROM weekly_goals WHERE user_id = %s AND week_start = %s", (user_id, week_start))
         
         goals = []
         for row in cursor.fetchall():
@@ -2185,65 +3089,144 @@ async def get_gamification_data(token: str):
 # PHASE 2: ENHANCED ANALYTICS
 # ============================================
 
+def fetch_dashboard_stats(user_id: int) -> Optional[dict]:
+    """Name, level and completed-session totals for the student dashboard"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        # User info and session_logs stats in one round trip; the
+        # ungrouped aggregate always yields exactly one row to join.
+        execute_sql(
+            cursor,
+            """SELECT u.full_name, u.level_estimate, u.reading_level, u.total_passages_read,
+               s.lessons_completed, s.average_score, s.total_time
+               FROM users u,
+               (SELECT 
+                  COUNT(*) as lessons_completed,
+                  AVG(comprehension_score) as average_score,
+                  SUM(time_spent_seconds) as total_time
+                  FROM session_logs 
+                  WHERE user_id = %s AND completion_status = 'completed') s
+               WHERE u.id = %s""",
+            (user_id, user_id)
+        )
+        row = cursor.fetchone()
+    return dict(row) if row else None
+
 @app.get("/api/student/dashboard")
 async def get_student_dashboard(token: str):
     """Get student dashboard stats"""
+    user_data = verify_token(token)
+    user_id = user_data["user_id"]
+    
     try:
-        user_data = verify_token(token)
-        user_id = user_data["user_id"]
-        
-        conn = get_db()
+        dashboard = await run_in_threadpool(fetch_dashboard_stats, user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if not dashboard:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return {
+        "user": {
+            "name": dashboard['full_name'],
+            "reading_level": dashboard['level_estimate'] or dashboard['reading_level'],
+            "total_passages_read": dashboard['total_passages_read']
+        },
+        "stats": {
+            "lessons_completed": dashboard['lessons_completed'],
+            "average_score": round(dashboard['average_score'], 1) if dashboard['average_score'] else 0,
+            "total_time_minutes": round((dashboard['total_time'] or 0) / 60, 1)
+        }
+    }
+
+def fetch_total_students() -> int:
+    """Number of student accounts"""
+    with db_connection() as conn:
         cursor = conn.cursor()
-        
-        # Get user info
+        cursor.execute("SELECT COUNT(*) as total_students FROM users WHERE role = 'student'")
+        return cursor.fetchone()['total_students']
+
+def fetch_day1_counts() -> tuple:
+    """(students active today, students who met the 3-passage goal today)"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        # One row per user per day
         if USE_POSTGRES:
-            cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
+            cursor.execute(
+                f"""SELECT 
+                    COUNT(*) as total,
+                    COUNT(*) FILTER (WHERE passages >= 3) as met_goal
+                   FROM {analytics_source(cursor, 'mv_daily_stats')}
+                   WHERE day = CURRENT_DATE"""
+            )
         else:
-            cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-        
-        user = cursor.fetchone()
-        
-        # Get stats from session_logs
+            cursor.execute(
+                """SELECT 
+                    COUNT(*) as total,
+                    COUNT(*) FILTER (WHERE passages >= 3) as met_goal
+                   FROM (
+                       SELECT user_id, COUNT(*) as passages
+                       FROM session_logs
+                       WHERE completion_status = 'completed'
+                       AND DATE(started_at) = DATE('now')
+                       GROUP BY user_id
+                   )"""
+            )
+        result = cursor.fetchone()
+        return result['total'], result['met_goal']
+
+def fetch_comprehension_by_type() -> list:
+    """Average comprehension score per question type"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
         if USE_POSTGRES:
+            cursor.execute(
+                f"""SELECT question_type, total_questions, avg_score
+                    FROM {analytics_source(cursor, 'mv_comprehension_by_type')}"""
+            )
+        else:
             cursor.execute(
                 """SELECT 
-                   COUNT(*) as lessons_completed,
-                   AVG(comprehension_score) as average_score,
-                   SUM(time_spent_seconds) as total_time
-                   FROM session_logs 
-                   WHERE user_id = %s AND completion_status = 'completed'""",
-                (user_id,)
+                    pq.question_type,
+                    COUNT(*) as total_questions,
+                    AVG(sl.comprehension_score) as avg_score
+                   FROM session_logs sl
+                   JOIN passage_questions pq ON sl.passage_id = pq.passage_id
+                   WHERE sl.comprehension_score IS NOT NULL
+                   GROUP BY pq.question_type"""
+            )
+        return [dict(row) for row in cursor.fetchall()]
+
+def fetch_stamina_trend() -> list:
+    """Average words read and sessions per day over the last 7 days"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if USE_POSTGRES:
+            cursor.execute(
+                f"""SELECT 
+                    day as date,
+                    SUM(words)::numeric / SUM(read_sessions) as avg_words,
+                    SUM(read_sessions) as sessions
+                   FROM {analytics_source(cursor, 'mv_daily_stats')}
+                   WHERE day >= CURRENT_DATE - 7
+                   GROUP BY day
+                   HAVING SUM(read_sessions) > 0
+                   ORDER BY date"""
             )
         else:
             cursor.execute(
                 """SELECT 
-                   COUNT(*) as lessons_completed,
-                   AVG(comprehension_score) as average_score,
-                   SUM(time_spent_seconds) as total_time
-                   FROM session_logs 
-                   WHERE user_id = ? AND completion_status = 'completed'""",
-                (user_id,)
+                    DATE(started_at) as date,
+                    AVG(p.word_count) as avg_words,
+                    COUNT(*) as sessions
+                   FROM session_logs sl
+                   JOIN passages p ON sl.passage_id = p.id
+                   WHERE DATE(started_at) >= DATE('now', '-7 days')
+                   AND completion_status = 'completed'
+                   GROUP BY DATE(started_at)
+                   ORDER BY date"""
             )
-        
-        stats = cursor.fetchone()
-        
-        conn.close()
-        
-        return {
-            "user": {
-                "name": user.get('full_name'),
-                "reading_level": user.get('level_estimate') or user.get('reading_level'),
-                "total_passages_read": user.get('total_passages_read', 0)
-            },
-            "stats": {
-                "lessons_completed": stats.get('lessons_completed', 0),
-                "average_score": round(stats.get('average_score', 0), 1) if stats.get('average_score') else 0,
-                "total_time_minutes": round((stats.get('total_time', 0) or 0) / 60, 1)
-            }
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return [dict(row) for row in cursor.fetchall()]
 
 @app.get("/api/admin/analytics-v2")
 async def get_enhanced_analytics(token: str):
@@ -2252,108 +3235,17 @@ async def get_enhanced_analytics(token: str):
     if user_data["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Basic stats
-    cursor.execute("SELECT COUNT(*) FROM users WHERE role = 'student'")
-    result = cursor.fetchone()
-    total_students = result['count'] if USE_POSTGRES else result[0]
-    
-    # Day-1 Success Rate
-    if USE_POSTGRES:
-        cursor.execute(
-            """SELECT 
-                COUNT(DISTINCT user_id) as total,
-                COUNT(DISTINCT CASE WHEN passages >= 3 THEN user_id END) as met_goal
-               FROM (
-                   SELECT user_id, COUNT(*) as passages
-                   FROM session_logs
-                   WHERE completion_status = 'completed'
-                   AND started_at >= CURRENT_DATE
-                   GROUP BY user_id
-               ) daily_stats"""
-        )
-        result = cursor.fetchone()
-        day1_total = result['total']
-        day1_met = result['met_goal']
-    else:
-        cursor.execute(
-            """SELECT 
-                COUNT(DISTINCT user_id) as total,
-                SUM(CASE WHEN passages >= 3 THEN 1 ELSE 0 END) as met_goal
-               FROM (
-                   SELECT user_id, COUNT(*) as passages
-                   FROM session_logs
-                   WHERE completion_status = 'completed'
-                   AND DATE(started_at) = DATE('now')
-                   GROUP BY user_id
-               )"""
-        )
-        result = cursor.fetchone()
-        day1_total = result[0]
-        day1_met = result[1]
+    # The four aggregates are independent, so run them side by side on
+    # separate connections instead of back to back on one
+    total_students, (day1_total, day1_met), comprehension_by_type, stamina_trend = await asyncio.gather(
+        run_in_threadpool(fetch_total_students),
+        run_in_threadpool(fetch_day1_counts),
+        run_in_threadpool(fetch_comprehension_by_type),
+        run_in_threadpool(fetch_stamina_trend),
+    )
     
     day1_success_rate = (day1_met / day1_total * 100) if day1_total > 0 else 0
     
-    # Average comprehension by question type
-    if USE_POSTGRES:
-        cursor.execute(
-            """SELECT 
-                pq.question_type,
-                COUNT(*) as total_questions,
-                AVG(sl.comprehension_score) as avg_score
-               FROM session_logs sl
-               JOIN passage_questions pq ON sl.passage_id = pq.passage_id
-               WHERE sl.comprehension_score IS NOT NULL
-               GROUP BY pq.question_type"""
-        )
-    else:
-        cursor.execute(
-            """SELECT 
-                pq.question_type,
-                COUNT(*) as total_questions,
-                AVG(sl.comprehension_score) as avg_score
-               FROM session_logs sl
-               JOIN passage_questions pq ON sl.passage_id = pq.passage_id
-               WHERE sl.comprehension_score IS NOT NULL
-               GROUP BY pq.question_type"""
-        )
-    
-    comprehension_by_type = [dict(row) for row in cursor.fetchall()]
-    
-    # Stamina trend (last 7 days)
-    if USE_POSTGRES:
-        cursor.execute(
-            """SELECT 
-                DATE(started_at) as date,
-                AVG(p.word_count) as avg_words,
-                COUNT(*) as sessions
-               FROM session_logs sl
-               JOIN passages p ON sl.passage_id = p.id
-               WHERE started_at >= CURRENT_DATE - INTERVAL '7 days'
-               AND completion_status = 'completed'
-               GROUP BY DATE(started_at)
-               ORDER BY date"""
-        )
-    else:
-        cursor.execute(
-            """SELECT 
-                DATE(started_at) as date,
-                AVG(p.word_count) as avg_words,
-                COUNT(*) as sessions
-               FROM session_logs sl
-               JOIN passages p ON sl.passage_id = p.id
-               WHERE DATE(started_at) >= DATE('now', '-7 days')
-               AND completion_status = 'completed'
-               GROUP BY DATE(started_at)
-               ORDER BY date"""
-        )
-    
-    stamina_trend = [dict(row) for row in cursor.fetchall()]
-    
-    conn.close()
-    
     return {
         "total_students": total_students,
         "day1_success_rate": round(day1_success_rate, 1),
@@ -2366,79 +3258,59 @@ async def get_enhanced_analytics(token: str):
 # PROGRESS DATA (Phase 2 - AI Generated)
 # ============================================
     
-@app.get("/api/student/progress")
-async def get_student_progress(token: str):
-    """Get detailed student progress with recent sessions"""
-    try:
-        user_data = verify_token(token)
-        user_id = user_data["user_id"]
-        
-        conn = get_db()
+def fetch_progress_summary(user_id: int) -> Optional[dict]:
+    """Profile, stored streak and completed-session totals for the progress page"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        execute_sql(
+            cursor,
+            """SELECT u.id, u.full_name, u.email, u.reading_level, 
+                      COALESCE(us.current_streak, 0) as current_streak,
+                      s.total_lessons, s.avg_score, s.total_time, s.last_activity
+               FROM users u
+               LEFT JOIN user_streaks us ON u.id = us.user_id
+               CROSS JOIN (
+                   SELECT COUNT(*) as total_lessons,
+                          AVG(comprehension_score) as avg_score,
+                          SUM(time_spent_seconds) as total_time,
+                          MAX(completed_at) as last_activity
+                   FROM session_logs 
+                   WHERE user_id = %s AND completion_status = 'completed'
+               ) s
+               WHERE u.id = %s""",
+            (user_id, user_id)
+        )
+        row = cursor.fetchone()
+    return dict(row) if row else None
+
+def fetch_recent_sessions(user_id: int) -> list:
+    """Last 10 completed sessions with passage details"""
+    with db_connection() as conn:
         cursor = conn.cursor()
         
-        # ========== GET USER INFO WITH STREAK ==========
-        if USE_POSTGRES:
-            cursor.execute(
-                """SELECT u.id, u.full_name, u.email, u.reading_level, 
-                          COALESCE(us.current_streak, 0) as current_streak
-                   FROM users u
-                   LEFT JOIN user_streaks us ON u.id = us.user_id
-                   WHERE u.id = %s""",
-                (user_id,)
-            )
-        else:
-            cursor.execute(
-                """SELECT u.id, u.full_name, u.email, u.reading_level, 
-                          COALESCE(us.current_streak, 0) as current_streak
-                   FROM users u
-                   LEFT JOIN user_streaks us ON u.id = us.user_id
-                   WHERE u.id = ?""",
-                (user_id,)
-            )
-        
-        user_row = cursor.fetchone()
-        
-        if not user_row:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Parse user data
-        if hasattr(user_row, 'keys'):
-            user_info = {
-                'id': user_row['id'],
-                'full_name': user_row['full_name'],
-                'email': user_row['email'],
-                'reading_level': user_row['reading_level'],
-                'current_streak': user_row['current_streak']
-            }
-        else:
-            user_info = {
-                'id': user_row[0],
-                'full_name': user_row[1],
-                'email': user_row[2],
-                'reading_level': user_row[3],
-                'current_streak': user_row[4]
-            }
-        # ============================================
-        
-        # Get recent sessions with passage details
         if USE_POSTGRES:
+            # Built as JSON in the response shape; psycopg2 hands back the decoded list
             cursor.execute(
-                """SELECT 
-                   sl.id,
-                   sl.completed_at,
-                   sl.comprehension_score,
-                   sl.time_spent_seconds,
-                   p.title as passage_title,
-                   p.difficulty_level,
-                   p.word_count
-                   FROM session_logs sl
-                   JOIN passages p ON sl.passage_id = p.id
-                   WHERE sl.user_id = %s
-                   AND sl.completion_status = 'completed'
-                   ORDER BY sl.completed_at DESC
-                   LIMIT 10""",
+                """SELECT COALESCE(json_agg(json_build_object(
+                       'id', r.id,
+                       'completed_at', r.completed_at,
+                       'score', r.comprehension_score,
+                       'time_spent', r.time_spent_seconds,
+                       'passage_title', r.title,
+                       'difficulty', r.difficulty_level,
+                       'word_count', r.word_count
+                   ) ORDER BY r.completed_at DESC), '[]') AS sessions
+                   FROM (SELECT sl.id, sl.completed_at, sl.comprehension_score, sl.time_spent_seconds,
+                                p.title, p.difficulty_level, p.word_count
+                         FROM session_logs sl
+                         JOIN passages p ON sl.passage_id = p.id
+                         WHERE sl.user_id = %s
+                         AND sl.completion_status = 'completed'
+                         ORDER BY sl.completed_at DESC
+                         LIMIT 10) r""",
                 (user_id,)
             )
+            sessions = cursor.fetchone()['sessions']
         else:
             cursor.execute(
                 """SELECT 
@@ -2448,75 +3320,69 @@ async def get_student_progress(token: str):
                    sl.time_spent_seconds,
                    p.title as passage_title,
                    p.difficulty_level,
-                   p.word_count
-                   FROM session_logs sl
-                   JOIN passages p ON sl.passage_id = p.id
-                   WHERE sl.user_id = ?
-                   AND sl.completion_status = 'completed'
-                   ORDER BY sl.completed_at DESC
-                   LIMIT 10""",
-                (user_id,)
-            )
-        
-        sessions = []
-        for row in cursor.fetchall():
-            sessions.append({
-                'id': row['id'] if hasattr(row, 'keys') else row[0],
-                'completed_at': row['completed_at'] if hasattr(row, 'keys') else row[1],
-                'score': row['comprehension_score'] if hasattr(row, 'keys') else row[2],
-                'time_spent': row['time_spent_seconds'] if hasattr(row, 'keys') else row[3],
-                'passage_title': row['passage_title'] if hasattr(row, 'keys') else row[4],
-                'difficulty': row['difficulty_level'] if hasattr(row, 'keys') else row[5],
-                'word_count': row['word_count'] if hasattr(row, 'keys') else row[6]
-            })
-            
-        # Calculate streak
-        streak = calculate_streak(user_id, conn)
-        
-        # Get overall stats
-        if USE_POSTGRES:
-            cursor.execute(
-                """SELECT 
-                   COUNT(*) as total_lessons,
-                   AVG(comprehension_score) as avg_score,
-                   SUM(time_spent_seconds) as total_time,
-                   MAX(completed_at) as last_activity
-                   FROM session_logs 
-                   WHERE user_id = %s AND completion_status = 'completed'""",
-                (user_id,)
-            )
-        else:
-            cursor.execute(
-                """SELECT 
-                   COUNT(*) as total_lessons,
-                   AVG(comprehension_score) as avg_score,
-                   SUM(time_spent_seconds) as total_time,
-                   MAX(completed_at) as last_activity
-                   FROM session_logs 
-                   WHERE user_id = ? AND completion_status = 'completed'""",
+                   p.word_count
+                   FROM session_logs sl
+                   JOIN passages p ON sl.passage_id = p.id
+                   WHERE sl.user_id = ?
+                   AND sl.completion_status = 'completed'
+                   ORDER BY sl.completed_at DESC
+                   LIMIT 10""",
                 (user_id,)
             )
+            
+            sessions = []
+            for row in cursor.fetchall():
+                sessions.append({
+                    'id': row['id'] if hasattr(row, 'keys') else row[0],
+                    'completed_at': row['completed_at'] if hasattr(row, 'keys') else row[1],
+                    'score': row['comprehension_score'] if hasattr(row, 'keys') else row[2],
+                    'time_spent': row['time_spent_seconds'] if hasattr(row, 'keys') else row[3],
+                    'passage_title': row['passage_title'] if hasattr(row, 'keys') else row[4],
+                    'difficulty': row['difficulty_level'] if hasattr(row, 'keys') else row[5],
+                    'word_count': row['word_count'] if hasattr(row, 'keys') else row[6]
+                })
+    
+    return sessions
+
+def fetch_streak(user_id: int) -> int:
+    """calculate_streak on a connection of its own"""
+    with db_connection() as conn:
+        return calculate_streak(user_id, conn)
+
+@app.get("/api/student/progress")
+async def get_student_progress(token: str):
+    """Get detailed student progress with recent sessions"""
+    try:
+        user_data = verify_token(token)
+        user_id = user_data["user_id"]
+        
+        # The three reads are independent, so run them side by side on
+        # separate connections instead of back to back on one
+        summary, sessions, streak = await asyncio.gather(
+            run_in_threadpool(fetch_progress_summary, user_id),
+            run_in_threadpool(fetch_recent_sessions, user_id),
+            run_in_threadpool(fetch_streak, user_id),
+        )
         
-        stats = cursor.fetchone()
+        if not summary:
+            raise HTTPException(status_code=404, detail="User not found")
         
-        # Handle both dict-like and tuple
-        if hasattr(stats, 'keys'):
-            total_lessons = stats['total_lessons'] or 0
-            avg_score = stats['avg_score']
-            total_time = stats['total_time'] or 0
-            last_activity = stats['last_activity']
-        else:
-            total_lessons = stats[0] or 0
-            avg_score = stats[1]
-            total_time = stats[2] or 0
-            last_activity = stats[3]
+        user_info = {
+            'id': summary['id'],
+            'full_name': summary['full_name'],
+            'email': summary['email'],
+            'reading_level': summary['reading_level'],
+            'current_streak': summary['current_streak']
+        }
+        total_lessons = summary['total_lessons'] or 0
+        avg_score = summary['avg_score']
+        total_time = summary['total_time'] or 0
+        last_activity = summary['last_activity']
         
         # Round average score
         avg_score_rounded = round(avg_score, 1) if avg_score else 0
         total_time_minutes = round(total_time / 60, 1)
         
-        conn.close()
-        
         # ========== UPDATE RETURN TO INCLUDE USER ==========
         return {
             "success": True,
@@ -2664,28 +3530,18 @@ def calculate_streak(user_id, conn):
     
     try:
         # Get distinct dates when user completed lessons
-        if USE_POSTGRES:
-            cursor.execute(
-                """SELECT DISTINCT DATE(completed_at) as lesson_date
-                   FROM session_logs
-                   WHERE user_id = %s 
-                   AND completion_status = 'completed'
-                   ORDER BY lesson_date DESC
-                   LIMIT 30""",
-                (user_id,)
-            )
-        else:
-            cursor.execute(
-                """SELECT DISTINCT DATE(completed_at) as lesson_date
-                   FROM session_logs
-                   WHERE user_id = ? 
-                   AND completion_status = 'completed'
-                   ORDER BY lesson_date DESC
-                   LIMIT 30""",
-                (user_id,)
-            )
+        execute_sql(
+            cursor,
+            """SELECT DISTINCT DATE(completed_at) as lesson_date
+               FROM session_logs
+               WHERE user_id = %s 
+               AND completion_status = 'completed'
+               ORDER BY lesson_date DESC
+               LIMIT 30""",
+            (user_id,)
+        )
         
-        dates = [row[0] if isinstance(row, tuple) else row['lesson_date'] for row in cursor.fetchall()]
+        dates = [row['lesson_date'] for row in cursor.fetchall()]
         
         if not dates:
             return 0
@@ -2747,10 +3603,13 @@ async def get_next_lesson(token: str, exclude_topics: str = None):
         conn = get_db()
         cursor = conn.cursor()
         
-        if USE_POSTGRES:
-            cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-        else:
-            cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+        execute_sql(
+            cursor,
+            """SELECT email, full_name, interest_tags, interests, level_estimate, reading_level,
+                      total_passages_read, word_count_min, word_count_max
+               FROM users WHERE id = %s""",
+            (user_id,)
+        )
         
         user = cursor.fetchone()
         
@@ -2786,27 +3645,18 @@ async def get_next_lesson(token: str, exclude_topics: str = None):
         recent_topics = []
         
         try:
-            if USE_POSTGRES:
-                cursor.execute(
-                    """SELECT topic_tags 
-                       FROM passages 
-                       WHERE created_by = %s 
-                       ORDER BY created_at DESC 
-                       LIMIT 5""",
-                    (user_id,)
-                )
-            else:
-                cursor.execute(
-                    """SELECT topic_tags 
-                       FROM passages 
-                       WHERE created_by = ? 
-                       ORDER BY created_at DESC 
-                       LIMIT 5""",
-                    (user_id,)
-                )
+            execute_sql(
+                cursor,
+                """SELECT topic_tags 
+                   FROM passages 
+                   WHERE created_by = %s 
+                   ORDER BY created_at DESC 
+                   LIMIT 5""",
+                (user_id,)
+            )
             
             for row in cursor.fetchall():
-                topic_tags = row[0] if isinstance(row, tuple) else row['topic_tags']
+                topic_tags = row['topic_tags']
                 if topic_tags:
                     try:
                         tags = json.loads(topic_tags) if isinstance(topic_tags, str) else topic_tags
@@ -2910,7 +3760,7 @@ async def get_next_lesson(token: str, exclude_topics: str = None):
                         difficulty_level, estimated_minutes, approved, created_by)
                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id""",
                     (passage_data['title'], passage_data['content'], passage_data['source'],
-                     json.dumps(passage_data['topic_tags']), passage_data['word_count'],
+                     json_param(passage_data['topic_tags']), passage_data['word_count'],
                      passage_data.get('readability_score'), passage_data.get('flesch_ease'),
                      passage_data['difficulty_level'], passage_data.get('estimated_minutes'),
                      True, user_id)
@@ -2924,7 +3774,7 @@ async def get_next_lesson(token: str, exclude_topics: str = None):
                         difficulty_level, estimated_minutes, approved, created_by)
                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
                     (passage_data['title'], passage_data['content'], passage_data['source'],
-                     json.dumps(passage_data['topic_tags']), passage_data['word_count'],
+                     json_param(passage_data['topic_tags']), passage_data['word_count'],
                      passage_data.get('readability_score'), passage_data.get('flesch_ease'),
                      passage_data['difficulty_level'], passage_data.get('estimated_minutes'),
                      True, user_id)
@@ -2970,23 +3820,7 @@ async def get_next_lesson(token: str, exclude_topics: str = None):
         # Step 10: Save questions
         print("Step 10: Saving questions to database...")
         try:
-            for q in questions:
-                if USE_POSTGRES:
-                    cursor.execute(
-                        """INSERT INTO passage_questions 
-                           (passage_id, question_text, question_type, correct_answer, options, explanation, difficulty)
-                           VALUES (%s, %s, %s, %s, %s, %s, %s)""",
-                        (lesson_id, q['question'], q.get('type'), q['correct_answer'],
-                         json.dumps(q.get('options', [])), q.get('explanation'), q.get('difficulty', 1))
-                    )
-                else:
-                    cursor.execute(
-                        """INSERT INTO passage_questions 
-                           (passage_id, question_text, question_type, correct_answer, options, explanation, difficulty)
-                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                        (lesson_id, q['question'], q.get('type'), q['correct_answer'],
-                         json.dumps(q.get('options', [])), q.get('explanation'), q.get('difficulty', 1))
-                    )
+            insert_passage_questions(cursor, lesson_id, questions)
             
             conn.commit()
             print(f"✓ Saved {len(questions)} questions")
@@ -3096,10 +3930,7 @@ async def debug_lesson_generation(token: str):
         conn = get_db()
         cursor = conn.cursor()
         
-        if USE_POSTGRES:
-            cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-        else:
-            cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+        execute_sql(cursor, "SELECT interest_tags, interests, level_estimate, reading_level FROM users WHERE id = %s", (user_id,))
         
         user = cursor.fetchone()
         
@@ -3180,18 +4011,86 @@ async def get_all_students(token: str):
     if user_data["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        """SELECT id, email, full_name, level_estimate, total_passages_read, 
-           comprehension_score, last_active, created_at 
-           FROM users WHERE role = 'student'
-           ORDER BY created_at DESC"""
+    if USE_POSTGRES:
+        # Sync generator, so StreamingResponse drives it from the threadpool
+        return StreamingResponse(stream_students(), media_type="application/json")
+    
+    # SQLite connections are per thread, and the generator's steps can land
+    # on different ones, so read everything in one go instead
+    students = await run_in_threadpool(fetch_students)
+    return Response(
+        content=orjson.dumps({"students": students}, default=_orjson_default),
+        media_type="application/json"
     )
-    students = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+
+# Rows fetched (and encoded) per round-trip when streaming the student list
+STUDENT_STREAM_CHUNK = 1000
+
+STUDENT_LIST_SQL = """SELECT id, email, full_name, level_estimate, total_passages_read, 
+                      comprehension_score, last_active, created_at 
+                      FROM users WHERE role = 'student'
+                      ORDER BY created_at DESC"""
+
+def fetch_students() -> list:
+    """Every student, newest first"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(STUDENT_LIST_SQL)
+        return [dict(row) for row in cursor.fetchall()]
+
+def stream_students():
+    """Yield {"students": [...]} as JSON, STUDENT_STREAM_CHUNK rows at a time (Postgres only)"""
+    # Borrowed on the first step (in the threadpool) and given back however
+    # the stream ends - finished, failed, or closed after a client disconnect
+    conn = get_db()
+    try:
+        # Named cursor = server-side, so rows arrive per fetchmany
+        cursor = conn.cursor(name="students_stream")
+        cursor.execute(STUDENT_LIST_SQL)
+        
+        yield b'{"students":['
+        separator = b''
+        while True:
+            rows = cursor.fetchmany(STUDENT_STREAM_CHUNK)
+            if not rows:
+                break
+            yield separator + b','.join(orjson.dumps(dict(row), default=_orjson_default) for row in rows)
+            separator = b','
+        yield b']}'
+    finally:
+        # Rolls back the read transaction (dropping the server-side cursor)
+        # and returns the connection to the pool
+        conn.close()
+
+def fetch_student_details(student_id: int):
+    """Profile, last 20 sessions and last 10 writing pieces for one student, or None.
+    
+    On Postgres this is the finished JSON text, built server-side in one round-trip.
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        if USE_POSTGRES:
+            execute_statement(cursor, "student_details_json", (student_id,))
+            row = cursor.fetchone()
+            return row['payload'] if row else None
+        
+        execute_statement(cursor, "student_profile_sel", (student_id,))
+        student = cursor.fetchone()
+        if not student:
+            return None
+        
+        execute_statement(cursor, "student_sessions_sel", (student_id,))
+        sessions = [dict(row) for row in cursor.fetchall()]
+        
+        execute_statement(cursor, "student_writing_sel", (student_id,))
+        writing = [dict(row) for row in cursor.fetchall()]
     
-    return {"students": students}
+    return {
+        "student": dict(student),
+        "sessions": sessions,
+        "writing": writing
+    }
 
 @app.get("/api/admin/student/{student_id}/details")
 async def get_student_details(student_id: int, token: str):
@@ -3200,127 +4099,75 @@ async def get_student_details(student_id: int, token: str):
     if user_data["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Get student info
-    if USE_POSTGRES:
-        cursor.execute("SELECT * FROM users WHERE id = %s", (student_id,))
-    else:
-        cursor.execute("SELECT * FROM users WHERE id = ?", (student_id,))
-    
-    student = dict(cursor.fetchone())
-    
-    # Get session history
-    if USE_POSTGRES:
-        cursor.execute(
-            """SELECT sl.*, p.title, p.word_count, p.difficulty_level
-               FROM session_logs sl
-               JOIN passages p ON sl.passage_id = p.id
-               WHERE sl.user_id = %s
-               ORDER BY sl.started_at DESC
-               LIMIT 20""",
-            (student_id,)
-        )
-    else:
-        cursor.execute(
-            """SELECT sl.*, p.title, p.word_count, p.difficulty_level
-               FROM session_logs sl
-               JOIN passages p ON sl.passage_id = p.id
-               WHERE sl.user_id = ?
-               ORDER BY sl.started_at DESC
-               LIMIT 20""",
-            (student_id,)
-        )
-    
-    sessions = [dict(row) for row in cursor.fetchall()]
-    
-    # Get writing exercises
-    if USE_POSTGRES:
-        cursor.execute(
-            """SELECT prompt, score, submitted_at, revised_response IS NOT NULL as has_revision
-               FROM writing_exercises
-               WHERE user_id = %s
-               ORDER BY submitted_at DESC
-               LIMIT 10""",
-            (student_id,)
-        )
-    else:
-        cursor.execute(
-            """SELECT prompt, score, submitted_at, 
-                      CASE WHEN revised_response IS NOT NULL THEN 1 ELSE 0 END as has_revision
-               FROM writing_exercises
-               WHERE user_id = ?
-               ORDER BY submitted_at DESC
-               LIMIT 10""",
-            (student_id,)
-        )
-    
-    writing = [dict(row) for row in cursor.fetchall()]
-    
-    conn.close()
-    
-    return {
-        "student": student,
-        "sessions": sessions,
-        "writing": writing
-    }
+    details = await run_in_threadpool(fetch_student_details, student_id)
+    if details is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    if isinstance(details, str):
+        return Response(content=details, media_type="application/json")
+    return ORJSONResponse(content=details)
+
+# The dashboard polls /api/admin/analytics; a few seconds of staleness is fine,
+# so the rendered body is reused until it expires. On Postgres the figures come
+# from mv_basic_stats, which is itself up to ANALYTICS_REFRESH_SECONDS old, so
+# they can trail a write by both intervals combined.
+ANALYTICS_CACHE_TTL = 30
+_analytics_cache = {"body": None, "expires": 0.0}
+
+def invalidate_analytics_cache():
+    """Drop the cached body after a session is completed/scored (SQLite only).
+    
+    The SQLite dev database reads live aggregates in a single process, so this
+    shows the write at once. On Postgres a re-read would only return the same
+    rollup, and the cache is per worker anyway, so there is nothing to gain.
+    """
+    if not USE_POSTGRES:
+        _analytics_cache["expires"] = 0.0
+
+def fetch_basic_stats() -> dict:
+    """Student count, completed sessions, average comprehension and 7-day active students"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if USE_POSTGRES:
+            cursor.execute(
+                f"""SELECT total_students, total_completed, avg_score, active_students
+                    FROM {analytics_source(cursor, 'mv_basic_stats')}"""
+            )
+        else:
+            # All four figures in one round-trip
+            cursor.execute(
+                """SELECT
+                       (SELECT COUNT(*) FROM users WHERE role = 'student') AS total_students,
+                       (SELECT COUNT(*) FROM session_logs WHERE completion_status = 'completed') AS total_completed,
+                       (SELECT AVG(comprehension_score) FROM session_logs
+                        WHERE comprehension_score IS NOT NULL) AS avg_score,
+                       (SELECT COUNT(DISTINCT user_id) FROM session_logs
+                        WHERE DATE(started_at) >= DATE('now', '-7 days')) AS active_students"""
+            )
+        return dict(cursor.fetchone())
 
 @app.get("/api/admin/analytics")
 async def get_analytics(token: str):
-    """Get basic analytics (Phase 1 compatibility)"""
+    """Get basic analytics (Phase 1 compatibility), cached for ANALYTICS_CACHE_TTL"""
     user_data = verify_token(token)
     if user_data["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Total students
-    cursor.execute("SELECT COUNT(*) as count FROM users WHERE role = 'student'")
-    result = cursor.fetchone()
-    total_students = result['count'] if USE_POSTGRES else result[0]
-    
-    # Total lessons completed
-    if USE_POSTGRES:
-        cursor.execute("SELECT COUNT(*) as count FROM session_logs WHERE completion_status = 'completed'")
-        result = cursor.fetchone()
-        total_completed = result['count']
-    else:
-        cursor.execute("SELECT COUNT(*) as count FROM session_logs WHERE completion_status = 'completed'")
-        result = cursor.fetchone()
-        total_completed = result[0] if result else 0
-    
-    # Average score
-    cursor.execute("SELECT AVG(comprehension_score) as avg_score FROM session_logs WHERE comprehension_score IS NOT NULL")
-    result = cursor.fetchone()
-    if USE_POSTGRES:
-        avg_score = result['avg_score'] if result['avg_score'] is not None else 0
-    else:
-        avg_score = result[0] if result and result[0] is not None else 0
+    if time.monotonic() < _analytics_cache["expires"]:
+        return Response(content=_analytics_cache["body"], media_type="application/json")
     
-    # Active students (completed in last 7 days)
-    if USE_POSTGRES:
-        cursor.execute(
-            "SELECT COUNT(DISTINCT user_id) as count FROM session_logs WHERE started_at >= NOW() - INTERVAL '7 days'"
-        )
-        result = cursor.fetchone()
-        active_students = result['count']
-    else:
-        cursor.execute(
-            "SELECT COUNT(DISTINCT user_id) as count FROM session_logs WHERE DATE(started_at) >= DATE('now', '-7 days')"
-        )
-        result = cursor.fetchone()
-        active_students = result[0] if result else 0
+    stats = await run_in_threadpool(fetch_basic_stats)
     
-    conn.close()
+    avg_score = stats['avg_score']
     
-    return {
-        "total_students": total_students,
-        "total_lessons_completed": total_completed,
+    response = ORJSONResponse(content={
+        "total_students": stats['total_students'],
+        "total_lessons_completed": stats['total_completed'],
         "average_score": round(float(avg_score), 2) if avg_score else 0,
-        "active_students": active_students
-    }
+        "active_students": stats['active_students']
+    })
+    _analytics_cache["body"] = response.body
+    _analytics_cache["expires"] = time.monotonic() + ANALYTICS_CACHE_TTL
+    return response
     
 # ============================================================
 # GAMIFICATION SYSTEM
@@ -3393,10 +4240,7 @@ def award_points(user_id, points, reason, activity_type='general'):
         conn.commit()
         
         # Check for level up
-        if USE_POSTGRES:
-            cursor.execute("SELECT total_earned, level FROM user_points WHERE user_id = %s", (user_id,))
-        else:
-            cursor.execute("SELECT total_earned, level FROM user_points WHERE user_id = ?", (user_id,))
+        execute_sql(cursor, "SELECT total_earned, level FROM user_points WHERE user_id = %s", (user_id,))
         
         result = cursor.fetchone()
         total = result['total_earned'] if hasattr(result, 'keys') else result[0]
@@ -3405,10 +4249,7 @@ def award_points(user_id, points, reason, activity_type='general'):
         new_level = (total // 500) + 1
         
         if new_level > current_level:
-            if USE_POSTGRES:
-                cursor.execute("UPDATE user_points SET level = %s WHERE user_id = %s", (new_level, user_id))
-            else:
-                cursor.execute("UPDATE user_points SET level = ? WHERE user_id = ?", (new_level, user_id))
+            execute_sql(cursor, "UPDATE user_points SET level = %s WHERE user_id = %s", (new_level, user_id))
             conn.commit()
             conn.close()
             return {'points_awarded': points, 'level_up': True, 'new_level': new_level}
@@ -3427,10 +4268,7 @@ def has_badge(user_id, badge_type):
     conn = get_db()
     cursor = conn.cursor()
     
-    if USE_POSTGRES:
-        cursor.execute("SELECT id FROM user_badges WHERE user_id = %s AND badge_type = %s", (user_id, badge_type))
-    else:
-        cursor.execute("SELECT id FROM user_badges WHERE user_id = ? AND badge_type = ?", (user_id, badge_type))
+    execute_sql(cursor, "SELECT id FROM user_badges WHERE user_id = %s AND badge_type = %s", (user_id, badge_type))
     
     result = cursor.fetchone()
     conn.close()
@@ -3442,16 +4280,11 @@ def award_badge(user_id, badge_type, badge_name, description, icon):
     cursor = conn.cursor()
     
     try:
-        if USE_POSTGRES:
-            cursor.execute(
-                "INSERT INTO user_badges (user_id, badge_type, badge_name, description, icon) VALUES (%s, %s, %s, %s, %s)",
-                (user_id, badge_type, badge_name, description, icon)
-            )
-        else:
-            cursor.execute(
-                "INSERT INTO user_badges (user_id, badge_type, badge_name, description, icon) VALUES (?, ?, ?, ?, ?)",
-                (user_id, badge_type, badge_name, description, icon)
-            )
+        execute_sql(
+            cursor,
+            "INSERT INTO user_badges (user_id, badge_type, badge_name, description, icon) VALUES (%s, %s, %s, %s, %s)",
+            (user_id, badge_type, badge_name, description, icon)
+        )
         
         conn.commit()
         conn.close()
@@ -3471,16 +4304,11 @@ def check_and_award_badges(user_id):
     new_badges = []
     
     try:
-        if USE_POSTGRES:
-            cursor.execute(
-                "SELECT COUNT(*) FROM session_logs WHERE user_id = %s AND completion_status = 'completed'",
-                (user_id,)
-            )
-        else:
-            cursor.execute(
-                "SELECT COUNT(*) FROM session_logs WHERE user_id = ? AND completion_status = 'completed'",
-                (user_id,)
-            )
+        execute_sql(
+            cursor,
+            "SELECT COUNT(*) FROM session_logs WHERE user_id = %s AND completion_status = 'completed'",
+            (user_id,)
+        )
         
         lesson_count = cursor.fetchone()[0]
         
@@ -3497,22 +4325,15 @@ def check_and_award_badges(user_id):
             new_badges.append(badge)
         
         # Perfect streak check
-        if USE_POSTGRES:
-            cursor.execute(
-                """SELECT comprehension_score FROM session_logs 
-                   WHERE user_id = %s AND completion_status = 'completed'
-                   ORDER BY completed_at DESC LIMIT 3""",
-                (user_id,)
-            )
-        else:
-            cursor.execute(
-                """SELECT comprehension_score FROM session_logs 
-                   WHERE user_id = ? AND completion_status = 'completed'
-                   ORDER BY completed_at DESC LIMIT 3""",
-                (user_id,)
-            )
+        execute_sql(
+            cursor,
+            """SELECT comprehension_score FROM session_logs 
+               WHERE user_id = %s AND completion_status = 'completed'
+               ORDER BY completed_at DESC LIMIT 3""",
+            (user_id,)
+        )
         
-        recent_scores = [row[0] if isinstance(row, tuple) else row['comprehension_score'] for row in cursor.fetchall()]
+        recent_scores = [row['comprehension_score'] for row in cursor.fetchall()]
         
         if len(recent_scores) >= 3 and all(score == 100 for score in recent_scores):
             if not has_badge(user_id, 'perfect_streak_3'):
@@ -3552,30 +4373,20 @@ def update_weekly_goals(user_id):
         week_start = datetime.now() - timedelta(days=datetime.now().weekday())
         week_start = week_start.date()
         
-        if USE_POSTGRES:
-            cursor.execute(
-                "SELECT * FROM weekly_goals WHERE user_id = %s AND week_start = %s AND goal_type = 'lessons_completed'",
-                (user_id, week_start)
-            )
-        else:
-            cursor.execute(
-                "SELECT * FROM weekly_goals WHERE user_id = ? AND week_start = ? AND goal_type = 'lessons_completed'",
-                (user_id, week_start)
-            )
+        execute_sql(
+            cursor,
+            "SELECT * FROM weekly_goals WHERE user_id = %s AND week_start = %s AND goal_type = 'lessons_completed'",
+            (user_id, week_start)
+        )
         
         goal = cursor.fetchone()
         
         if not goal:
-            if USE_POSTGRES:
-                cursor.execute(
-                    "INSERT INTO weekly_goals (user_id, week_start, goal_type, target_value, points_reward) VALUES (%s, %s, %s, %s, %s)",
-                    (user_id, week_start, 'lessons_completed', 5, 100)
-                )
-            else:
-                cursor.execute(
-                    "INSERT INTO weekly_goals (user_id, week_start, goal_type, target_value, points_reward) VALUES (?, ?, ?, ?, ?)",
-                    (user_id, week_start, 'lessons_completed', 5, 100)
-                )
+            execute_sql(
+                cursor,
+                "INSERT INTO weekly_goals (user_id, week_start, goal_type, target_value, points_reward) VALUES (%s, %s, %s, %s, %s)",
+                (user_id, week_start, 'lessons_completed', 5, 100)
+            )
             conn.commit()
         else:
             goal_id = goal['id'] if hasattr(goal, 'keys') else goal[0]
@@ -3601,10 +4412,7 @@ def update_weekly_goals(user_id):
                 points_reward = goal['points_reward'] if hasattr(goal, 'keys') else goal[7]
                 award_points(user_id, points_reward, 'Weekly goal completed', 'goal')
             else:
-                if USE_POSTGRES:
-                    cursor.execute("UPDATE weekly_goals SET current_value = %s WHERE id = %s", (new_value, goal_id))
-                else:
-                    cursor.execute("UPDATE weekly_goals SET current_value = ? WHERE id = ?", (new_value, goal_id))
+                execute_sql(cursor, "UPDATE weekly_goals SET current_value = %s WHERE id = %s", (new_value, goal_id))
                 conn.commit()
         
         conn.close()
@@ -3625,10 +4433,7 @@ async def get_gamification_data(token: str):
         cursor = conn.cursor()
         
         # Get points
-        if USE_POSTGRES:
-            cursor.execute("SELECT * FROM user_points WHERE user_id = %s", (user_id,))
-        else:
-            cursor.execute("SELECT * FROM user_points WHERE user_id = ?", (user_id,))
+        execute_sql(cursor, "SELECT * FROM user_points WHERE user_id = %s", (user_id,))
         
         points_row = cursor.fetchone()
         
@@ -3642,10 +4447,7 @@ async def get_gamification_data(token: str):
             points_data = {'current_points': 0, 'total_earned': 0, 'level': 1}
         
         # Get badges
-        if USE_POSTGRES:
-            cursor.execute("SELECT * FROM user_badges WHERE user_id = %s ORDER BY earned_at DESC", (user_id,))
-        else:
-            cursor.execute("SELECT * FROM user_badges WHERE user_id = ? ORDER BY earned_at DESC", (user_id,))
+        execute_sql(cursor, "SELECT * FROM user_badges WHERE user_id = %s ORDER BY earned_at DESC", (user_id,))
         
         badges = []
         for row in cursor.fetchall():
@@ -3662,10 +4464,7 @@ async def get_gamification_data(token: str):
         week_start = datetime.now() - timedelta(days=datetime.now().weekday())
         week_start = week_start.date()
         
-        if USE_POSTGRES:
-            cursor.execute("SELECT * FROM weekly_goals WHERE user_id = %s AND week_start = %s", (user_id, week_start))
-        else:
-            cursor.execute("SELECT * FROM weekly_goals WHERE user_id = ? AND week_start = ?", (user_id, week_start))
+        execute_sql(cursor, "SELECT * FROM weekly_goals WHERE user_id = %s AND week_start = %s", (user_id, week_start))
         
         goals = []
         for row in cursor.fetchall():
@@ -3695,61 +4494,32 @@ async def get_gamification_data(token: str):
 #        ESSAY SUBMISSION & EVALUATION 
 # ============================================================
 
-@app.post("/api/essay/submit")
-async def submit_essay(request: Request):
-    """Submit and evaluate comprehension essay"""
-    data = await request.json()
-    token = data.get("token")
-    essay_text = data.get("essay_text")
-    lesson_count = data.get("lesson_count")
-    recent_lessons = data.get("recent_lessons", [])
-    
-    try:
-        user_data = verify_token(token)
-        user_id = user_data["user_id"]
-        
-        conn = get_db()
+def fetch_essay_context(user_id: int):
+    """(full_name, reading_level, next essay number) for an essay submission"""
+    with db_connection() as conn:
         cursor = conn.cursor()
-        
-        # Get user info - USING full_name
-        if USE_POSTGRES:
-            cursor.execute("SELECT full_name, reading_level FROM users WHERE id = %s", (user_id,))
-        else:
-            cursor.execute("SELECT full_name, reading_level FROM users WHERE id = ?", (user_id,))
-        
-        user_row = cursor.fetchone()
-        user_name = user_row['full_name'] if hasattr(user_row, 'keys') else user_row[0]
-        current_level = user_row['reading_level'] if hasattr(user_row, 'keys') else user_row[1]
-        
-        # Count existing essays
-        if USE_POSTGRES:
-            cursor.execute("SELECT COUNT(*) FROM user_essays WHERE user_id = %s", (user_id,))
-        else:
-            cursor.execute("SELECT COUNT(*) FROM user_essays WHERE user_id = ?", (user_id,))
-        
-        result = cursor.fetchone()
-        essay_number = (result['count'] if hasattr(result, 'keys') else result[0]) + 1
-        
-        # Calculate word count
-        word_count = len(essay_text.split())
-        
-        # Prepare lesson context for AI
-        lesson_topics = [lesson.get('title', '') for lesson in recent_lessons]
-        lesson_ids = [lesson.get('id', 0) for lesson in recent_lessons]
-        
-        # Evaluate essay with AI
-        evaluation = await evaluate_essay_with_ai(
-            essay_text=essay_text,
-            user_name=user_name,
-            current_level=current_level,
-            lesson_topics=lesson_topics,
-            recent_lessons=recent_lessons
+        execute_sql(
+            cursor,
+            """SELECT u.full_name, u.reading_level,
+                      (SELECT COUNT(*) FROM user_essays e WHERE e.user_id = u.id) AS essay_count
+               FROM users u WHERE u.id = %s""",
+            (user_id,)
         )
-        
-        # Determine points based on comprehension score
-        points_awarded = calculate_essay_points(evaluation['comprehension_score'])
-        
-        # Save essay to database
+        row = cursor.fetchone()
+    if not row:
+        return None
+    return row['full_name'], row['reading_level'], row['essay_count'] + 1
+
+def record_essay_result(user_id: int, user_name: str, current_level: str, essay_number: int,
+                        lesson_count, essay_text: str, word_count: int, lesson_ids: list,
+                        lesson_topics: list, evaluation: dict, points_awarded: int):
+    """Save a graded essay, then award its points and apply the level change or admin alert.
+    
+    Returns (essay_id, new_level). The essay is committed before the follow-ups run,
+    since each of those borrows a connection of its own.
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
         if USE_POSTGRES:
             cursor.execute(
                 """INSERT INTO user_essays 
@@ -3780,35 +4550,81 @@ async def submit_essay(request: Request):
                  evaluation['needs_admin_review'], points_awarded)
             )
             essay_id = cursor.lastrowid
+    
+    # Award points
+    if points_awarded > 0:
+        award_points(user_id, points_awarded, f'Comprehension essay #{essay_number}', 'essay')
+    
+    # Handle difficulty adjustment
+    new_level = current_level
+    if evaluation['difficulty_recommendation'] == 'advance':
+        new_level = get_next_difficulty_level(current_level)
+        update_user_difficulty(user_id, new_level, essay_id, 'Strong comprehension - advancing')
+    elif evaluation['difficulty_recommendation'] == 'support_needed':
+        # Stay at current level but create admin alert
+        create_admin_alert(
+            user_id=user_id,
+            essay_id=essay_id,
+            alert_type='student_needs_help',
+            priority='high',
+            message=f"{user_name} needs additional support - low comprehension on essay #{essay_number}",
+            details=json.dumps({
+                'comprehension_score': evaluation['comprehension_score'],
+                'comprehension_level': evaluation['comprehension_level'],
+                'lesson_count': lesson_count,
+                'current_level': current_level
+            })
+        )
+    
+    return essay_id, new_level
+
+@app.post("/api/essay/submit")
+async def submit_essay(request: Request):
+    """Submit and evaluate comprehension essay"""
+    data = await request.json()
+    token = data.get("token")
+    essay_text = data.get("essay_text")
+    lesson_count = data.get("lesson_count")
+    recent_lessons = data.get("recent_lessons", [])
+    
+    user_data = verify_token(token)
+    user_id = user_data["user_id"]
+    
+    try:
+        # No connection is held across the grading call below
+        context = await run_in_threadpool(fetch_essay_context, user_id)
+    except Exception as e:
+        log.error("Error loading essay context: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    if not context:
+        raise HTTPException(status_code=404, detail="User not found")
+    user_name, current_level, essay_number = context
+    
+    try:
+        # Calculate word count
+        word_count = len(essay_text.split())
         
-        conn.commit()
+        # Prepare lesson context for AI
+        lesson_topics = [lesson.get('title', '') for lesson in recent_lessons]
+        lesson_ids = [lesson.get('id', 0) for lesson in recent_lessons]
         
-        # Award points
-        if points_awarded > 0:
-            award_points(user_id, points_awarded, f'Comprehension essay #{essay_number}', 'essay')
-        
-        # Handle difficulty adjustment
-        new_level = current_level
-        if evaluation['difficulty_recommendation'] == 'advance':
-            new_level = get_next_difficulty_level(current_level)
-            update_user_difficulty(user_id, new_level, essay_id, 'Strong comprehension - advancing')
-        elif evaluation['difficulty_recommendation'] == 'support_needed':
-            # Stay at current level but create admin alert
-            create_admin_alert(
-                user_id=user_id,
-                essay_id=essay_id,
-                alert_type='student_needs_help',
-                priority='high',
-                message=f"{user_name} needs additional support - low comprehension on essay #{essay_number}",
-                details=json.dumps({
-                    'comprehension_score': evaluation['comprehension_score'],
-                    'comprehension_level': evaluation['comprehension_level'],
-                    'lesson_count': lesson_count,
-                    'current_level': current_level
-                })
-            )
+        # Evaluate essay with AI
+        evaluation = await evaluate_essay_with_ai(
+            essay_text=essay_text,
+            user_name=user_name,
+            current_level=current_level,
+            lesson_topics=lesson_topics,
+            recent_lessons=recent_lessons
+        )
         
-        conn.close()
+        # Determine points based on comprehension score
+        points_awarded = calculate_essay_points(evaluation['comprehension_score'])
+        
+        essay_id, new_level = await run_in_threadpool(
+            record_essay_result, user_id, user_name, current_level, essay_number,
+            lesson_count, essay_text, word_count, lesson_ids, lesson_topics,
+            evaluation, points_awarded
+        )
         
         return {
             "success": True,
@@ -3837,7 +4653,8 @@ async def evaluate_essay_with_ai(essay_text, user_name, current_level, lesson_to
     """Use OpenAI to evaluate comprehension essay"""
     
     try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        if not openai_client:
+            raise RuntimeError("OpenAI API key not configured")
         
         # Prepare lesson context
         lesson_context = "\n".join([
@@ -3885,7 +4702,7 @@ SCORING GUIDE:
 
 Be encouraging but honest. Focus on what they DID understand, not just what they missed."""
 
-        response = client.chat.completions.create(
+        response = await openai_client.chat.completions.create(
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are an expert literacy educator evaluating student comprehension. Always respond with valid JSON only."},
@@ -3956,20 +4773,13 @@ def update_user_difficulty(user_id, new_level, essay_id, reason):
     
     try:
         # Get current level and word counts
-        if USE_POSTGRES:
-            cursor.execute(
-                """SELECT reading_level, essay_word_count_requirement, 
-                   word_count_min, word_count_max 
-                   FROM users WHERE id = %s""", 
-                (user_id,)
-            )
-        else:
-            cursor.execute(
-                """SELECT reading_level, essay_word_count_requirement, 
-                   word_count_min, word_count_max 
-                   FROM users WHERE id = ?""", 
-                (user_id,)
-            )
+        execute_sql(
+            cursor,
+            """SELECT reading_level, essay_word_count_requirement, 
+               word_count_min, word_count_max 
+               FROM users WHERE id = %s""", 
+            (user_id,)
+        )
         
         result = cursor.fetchone()
         old_level = result['reading_level'] if hasattr(result, 'keys') else result[0]
@@ -3994,26 +4804,16 @@ def update_user_difficulty(user_id, new_level, essay_id, reason):
         new_essay_words = current_essay_words + 25
         
         # Update user level and word counts
-        if USE_POSTGRES:
-            cursor.execute(
-                """UPDATE users 
-                   SET reading_level = %s, 
-                       essay_word_count_requirement = %s,
-                       word_count_min = %s,
-                       word_count_max = %s
-                   WHERE id = %s""",
-                (new_level, new_essay_words, new_min, new_max, user_id)
-            )
-        else:
-            cursor.execute(
-                """UPDATE users 
-                   SET reading_level = ?, 
-                       essay_word_count_requirement = ?,
-                       word_count_min = ?,
-                       word_count_max = ?
-                   WHERE id = ?""",
-                (new_level, new_essay_words, new_min, new_max, user_id)
-            )
+        execute_sql(
+            cursor,
+            """UPDATE users 
+               SET reading_level = %s, 
+                   essay_word_count_requirement = %s,
+                   word_count_min = %s,
+                   word_count_max = %s
+               WHERE id = %s""",
+            (new_level, new_essay_words, new_min, new_max, user_id)
+        )
         
         # Log adjustment
         adjustment_log = (
@@ -4022,20 +4822,13 @@ def update_user_difficulty(user_id, new_level, essay_id, reason):
             f"Essay words: {current_essay_words} → {new_essay_words}"
         )
         
-        if USE_POSTGRES:
-            cursor.execute(
-                """INSERT INTO difficulty_adjustments 
-                   (user_id, essay_id, previous_level, new_level, reason)
-                   VALUES (%s, %s, %s, %s, %s)""",
-                (user_id, essay_id, old_level, new_level, adjustment_log)
-            )
-        else:
-            cursor.execute(
-                """INSERT INTO difficulty_adjustments 
-                   (user_id, essay_id, previous_level, new_level, reason)
-                   VALUES (?, ?, ?, ?, ?)""",
-                (user_id, essay_id, old_level, new_level, adjustment_log)
-            )
+        execute_sql(
+            cursor,
+            """INSERT INTO difficulty_adjustments 
+               (user_id, essay_id, previous_level, new_level, reason)
+               VALUES (%s, %s, %s, %s, %s)""",
+            (user_id, essay_id, old_level, new_level, adjustment_log)
+        )
         
         conn.commit()
         conn.close()
@@ -4057,20 +4850,13 @@ def create_admin_alert(user_id, essay_id, alert_type, priority, message, details
     cursor = conn.cursor()
     
     try:
-        if USE_POSTGRES:
-            cursor.execute(
-                """INSERT INTO admin_alerts 
-                   (alert_type, user_id, essay_id, priority, message, details)
-                   VALUES (%s, %s, %s, %s, %s, %s)""",
-                (alert_type, user_id, essay_id, priority, message, details)
-            )
-        else:
-            cursor.execute(
-                """INSERT INTO admin_alerts 
-                   (alert_type, user_id, essay_id, priority, message, details)
-                   VALUES (?, ?, ?, ?, ?, ?)""",
-                (alert_type, user_id, essay_id, priority, message, details)
-            )
+        execute_sql(
+            cursor,
+            """INSERT INTO admin_alerts 
+               (alert_type, user_id, essay_id, priority, message, details)
+               VALUES (%s, %s, %s, %s, %s, %s)""",
+            (alert_type, user_id, essay_id, priority, message, details)
+        )
         
         conn.commit()
         conn.close()
@@ -4095,18 +4881,12 @@ async def check_essay_due(token: str):
         cursor = conn.cursor()
         
         # Count completed lessons
-        if USE_POSTGRES:
-            cursor.execute(
-                """SELECT COUNT(*) as count FROM session_logs 
-                   WHERE user_id = %s AND completion_status = 'completed'""",
-                (user_id,)
-            )
-        else:
-            cursor.execute(
-                """SELECT COUNT(*) as count FROM session_logs 
-                   WHERE user_id = ? AND completion_status = 'completed'""",
-                (user_id,)
-            )
+        execute_sql(
+            cursor,
+            """SELECT COUNT(*) as count FROM session_logs 
+               WHERE user_id = %s AND completion_status = 'completed'""",
+            (user_id,)
+        )
         
         result = cursor.fetchone()
         total_lessons = result['count'] if hasattr(result, 'keys') else result[0] if result else 0
@@ -4114,10 +4894,7 @@ async def check_essay_due(token: str):
         print(f"✓ User {user_id} has completed {total_lessons} lessons")
         
         # Count completed essays
-        if USE_POSTGRES:
-            cursor.execute("SELECT COUNT(*) as count FROM user_essays WHERE user_id = %s", (user_id,))
-        else:
-            cursor.execute("SELECT COUNT(*) as count FROM user_essays WHERE user_id = ?", (user_id,))
+        execute_sql(cursor, "SELECT COUNT(*) as count FROM user_essays WHERE user_id = %s", (user_id,))
         
         result = cursor.fetchone()
         total_essays = result['count'] if hasattr(result, 'keys') else result[0] if result else 0
@@ -4136,28 +4913,17 @@ async def check_essay_due(token: str):
         recent_lessons = []
         if essay_due:
             try:
-                if USE_POSTGRES:
-                    cursor.execute(
-                        """SELECT p.id, p.title, p.content
-                           FROM session_logs sl
-                           JOIN passages p ON sl.passage_id = p.id
-                           WHERE sl.user_id = %s 
-                           AND sl.completion_status = 'completed'
-                           ORDER BY sl.completed_at DESC
-                           LIMIT 3""",
-                        (user_id,)
-                    )
-                else:
-                    cursor.execute(
-                        """SELECT p.id, p.title, p.content
-                           FROM session_logs sl
-                           JOIN passages p ON sl.passage_id = p.id
-                           WHERE sl.user_id = ? 
-                           AND sl.completion_status = 'completed'
-                           ORDER BY sl.completed_at DESC
-                           LIMIT 3""",
-                        (user_id,)
-                    )
+                execute_sql(
+                    cursor,
+                    """SELECT p.id, p.title, p.content
+                       FROM session_logs sl
+                       JOIN passages p ON sl.passage_id = p.id
+                       WHERE sl.user_id = %s 
+                       AND sl.completion_status = 'completed'
+                       ORDER BY sl.completed_at DESC
+                       LIMIT 3""",
+                    (user_id,)
+                )
                 
                 rows = cursor.fetchall()
                 
@@ -4217,16 +4983,11 @@ async def get_word_count_requirement(token: str):
         conn = get_db()
         cursor = conn.cursor()
         
-        if USE_POSTGRES:
-            cursor.execute(
-                "SELECT essay_word_count_requirement, reading_level FROM users WHERE id = %s",
-                (user_id,)
-            )
-        else:
-            cursor.execute(
-                "SELECT essay_word_count_requirement, reading_level FROM users WHERE id = ?",
-                (user_id,)
-            )
+        execute_sql(
+            cursor,
+            "SELECT essay_word_count_requirement, reading_level FROM users WHERE id = %s",
+            (user_id,)
+        )
         
         result = cursor.fetchone()
         word_count = result['essay_word_count_requirement'] if hasattr(result, 'keys') else result[0]
@@ -4271,20 +5032,13 @@ async def start_session(request: Request):
         cursor = conn.cursor()
         
         # Close any existing active sessions
-        if USE_POSTGRES:
-            cursor.execute(
-                """UPDATE user_sessions 
-                   SET session_end = NOW(), status = 'logged_out'
-                   WHERE user_id = %s AND status = 'active'""",
-                (user_id,)
-            )
-        else:
-            cursor.execute(
-                """UPDATE user_sessions 
-                   SET session_end = datetime('now'), status = 'logged_out'
-                   WHERE user_id = ? AND status = 'active'""",
-                (user_id,)
-            )
+        execute_sql(
+            cursor,
+            """UPDATE user_sessions 
+               SET session_end = NOW(), status = 'logged_out'
+               WHERE user_id = %s AND status = 'active'""",
+            (user_id,)
+        )
         
         # Create new session
         if USE_POSTGRES:
@@ -4304,17 +5058,12 @@ async def start_session(request: Request):
             session_id = cursor.lastrowid
         
         # Log activity
-        if USE_POSTGRES:
-            cursor.execute(
-                """INSERT INTO activity_log (user_id, session_id, activity_type)
-                   VALUES (%s, %s, 'login')""",
-                (user_id, session_id)
-            )
-        else:
-            cursor.execute(
-                "INSERT INTO activity_log (user_id, session_id, activity_type) VALUES (?, ?, 'login')",
-                (user_id, session_id)
-            )
+        execute_sql(
+            cursor,
+            """INSERT INTO activity_log (user_id, session_id, activity_type)
+               VALUES (%s, %s, 'login')""",
+            (user_id, session_id)
+        )
         
         conn.commit()
         conn.close()
@@ -4346,34 +5095,21 @@ async def update_activity(request: Request):
         cursor = conn.cursor()
         
         # Update last activity
-        if USE_POSTGRES:
-            cursor.execute(
-                """UPDATE user_sessions 
-                   SET last_activity = NOW()
-                   WHERE id = %s AND user_id = %s""",
-                (session_id, user_id)
-            )
-        else:
-            cursor.execute(
-                """UPDATE user_sessions 
-                   SET last_activity = datetime('now')
-                   WHERE id = ? AND user_id = ?""",
-                (session_id, user_id)
-            )
+        execute_sql(
+            cursor,
+            """UPDATE user_sessions 
+               SET last_activity = NOW()
+               WHERE id = %s AND user_id = %s""",
+            (session_id, user_id)
+        )
         
         # Log activity
-        if USE_POSTGRES:
-            cursor.execute(
-                """INSERT INTO activity_log (user_id, session_id, activity_type, activity_details)
-                   VALUES (%s, %s, %s, %s)""",
-                (user_id, session_id, activity_type, activity_details)
-            )
-        else:
-            cursor.execute(
-                """INSERT INTO activity_log (user_id, session_id, activity_type, activity_details)
-                   VALUES (?, ?, ?, ?)""",
-                (user_id, session_id, activity_type, activity_details)
-            )
+        execute_sql(
+            cursor,
+            """INSERT INTO activity_log (user_id, session_id, activity_type, activity_details)
+               VALUES (%s, %s, %s, %s)""",
+            (user_id, session_id, activity_type, activity_details)
+        )
         
         conn.commit()
         conn.close()
@@ -4399,30 +5135,19 @@ async def start_break(request: Request):
         cursor = conn.cursor()
         
         # Update session to break status
-        if USE_POSTGRES:
-            cursor.execute(
-                """UPDATE user_sessions 
-                   SET status = 'on_break', break_start = NOW()
-                   WHERE id = %s AND user_id = %s""",
-                (session_id, user_id)
-            )
-            cursor.execute(
-                """INSERT INTO activity_log (user_id, session_id, activity_type)
-                   VALUES (%s, %s, 'break_start')""",
-                (user_id, session_id)
-            )
-        else:
-            cursor.execute(
-                """UPDATE user_sessions 
-                   SET status = 'on_break', break_start = datetime('now')
-                   WHERE id = ? AND user_id = ?""",
-                (session_id, user_id)
-            )
-            cursor.execute(
-                """INSERT INTO activity_log (user_id, session_id, activity_type)
-                   VALUES (?, ?, 'break_start')""",
-                (user_id, session_id)
-            )
+        execute_sql(
+            cursor,
+            """UPDATE user_sessions 
+               SET status = 'on_break', break_start = NOW()
+               WHERE id = %s AND user_id = %s""",
+            (session_id, user_id)
+        )
+        execute_sql(
+            cursor,
+            """INSERT INTO activity_log (user_id, session_id, activity_type)
+               VALUES (%s, %s, 'break_start')""",
+            (user_id, session_id)
+        )
         
         conn.commit()
         conn.close()
@@ -4452,16 +5177,11 @@ async def end_break(request: Request):
         cursor = conn.cursor()
         
         # Get break start time
-        if USE_POSTGRES:
-            cursor.execute(
-                "SELECT break_start FROM user_sessions WHERE id = %s AND user_id = %s",
-                (session_id, user_id)
-            )
-        else:
-            cursor.execute(
-                "SELECT break_start FROM user_sessions WHERE id = ? AND user_id = ?",
-                (session_id, user_id)
-            )
+        execute_sql(
+            cursor,
+            "SELECT break_start FROM user_sessions WHERE id = %s AND user_id = %s",
+            (session_id, user_id)
+        )
         
         result = cursor.fetchone()
         if result:
@@ -4474,36 +5194,22 @@ async def end_break(request: Request):
                 break_duration = 0
             
             # Update session
-            if USE_POSTGRES:
-                cursor.execute(
-                    """UPDATE user_sessions 
-                       SET status = 'active', 
-                           break_end = NOW(),
-                           total_break_time = total_break_time + %s,
-                           last_activity = NOW()
-                       WHERE id = %s AND user_id = %s""",
-                    (break_duration, session_id, user_id)
-                )
-                cursor.execute(
-                    """INSERT INTO activity_log (user_id, session_id, activity_type, activity_details)
-                       VALUES (%s, %s, 'break_end', %s)""",
-                    (user_id, session_id, f"Break duration: {break_duration}s")
-                )
-            else:
-                cursor.execute(
-                    """UPDATE user_sessions 
-                       SET status = 'active', 
-                           break_end = datetime('now'),
-                           total_break_time = total_break_time + ?,
-                           last_activity = datetime('now')
-                       WHERE id = ? AND user_id = ?""",
-                    (break_duration, session_id, user_id)
-                )
-                cursor.execute(
-                    """INSERT INTO activity_log (user_id, session_id, activity_type, activity_details)
-                       VALUES (?, ?, 'break_end', ?)""",
-                    (user_id, session_id, f"Break duration: {break_duration}s")
-                )
+            execute_sql(
+                cursor,
+                """UPDATE user_sessions 
+                   SET status = 'active', 
+                       break_end = NOW(),
+                       total_break_time = total_break_time + %s,
+                       last_activity = NOW()
+                   WHERE id = %s AND user_id = %s""",
+                (break_duration, session_id, user_id)
+            )
+            execute_sql(
+                cursor,
+                """INSERT INTO activity_log (user_id, session_id, activity_type, activity_details)
+                   VALUES (%s, %s, 'break_end', %s)""",
+                (user_id, session_id, f"Break duration: {break_duration}s")
+            )
         
         conn.commit()
         conn.close()
@@ -4646,51 +5352,31 @@ async def log_timeout(request: Request):
         cursor = conn.cursor()
         
         # Update timeout event
-        if USE_POSTGRES:
-            cursor.execute(
-                """UPDATE timeout_events 
-                   SET timed_out_at = NOW()
-                   WHERE id = %s AND user_id = %s""",
-                (timeout_event_id, user_id)
-            )
-            
-            # Update session
-            cursor.execute(
-                """UPDATE user_sessions 
-                   SET status = 'timed_out', 
-                       session_end = NOW(),
-                       timeout_count = timeout_count + 1
-                   WHERE id = %s AND user_id = %s""",
-                (session_id, user_id)
-            )
-            
-            cursor.execute(
-                """INSERT INTO activity_log (user_id, session_id, activity_type)
-                   VALUES (%s, %s, 'timeout')""",
-                (user_id, session_id)
-            )
-        else:
-            cursor.execute(
-                """UPDATE timeout_events 
-                   SET timed_out_at = datetime('now')
-                   WHERE id = ? AND user_id = ?""",
-                (timeout_event_id, user_id)
-            )
-            
-            cursor.execute(
-                """UPDATE user_sessions 
-                   SET status = 'timed_out', 
-                       session_end = datetime('now'),
-                       timeout_count = timeout_count + 1
-                   WHERE id = ? AND user_id = ?""",
-                (session_id, user_id)
-            )
-            
-            cursor.execute(
-                """INSERT INTO activity_log (user_id, session_id, activity_type)
-                   VALUES (?, ?, 'timeout')""",
-                (user_id, session_id)
-            )
+        execute_sql(
+            cursor,
+            """UPDATE timeout_events 
+               SET timed_out_at = NOW()
+               WHERE id = %s AND user_id = %s""",
+            (timeout_event_id, user_id)
+        )
+        
+        # Update session
+        execute_sql(
+            cursor,
+            """UPDATE user_sessions 
+               SET status = 'timed_out', 
+                   session_end = NOW(),
+                   timeout_count = timeout_count + 1
+               WHERE id = %s AND user_id = %s""",
+            (session_id, user_id)
+        )
+        
+        execute_sql(
+            cursor,
+            """INSERT INTO activity_log (user_id, session_id, activity_type)
+               VALUES (%s, %s, 'timeout')""",
+            (user_id, session_id)
+        )
         
         conn.commit()
         conn.close()
@@ -4716,32 +5402,20 @@ async def end_session(request: Request):
         cursor = conn.cursor()
         
         # Update session
-        if USE_POSTGRES:
-            cursor.execute(
-                """UPDATE user_sessions 
-                   SET status = 'logged_out', session_end = NOW()
-                   WHERE id = %s AND user_id = %s""",
-                (session_id, user_id)
-            )
-            
-            cursor.execute(
-                """INSERT INTO activity_log (user_id, session_id, activity_type)
-                   VALUES (%s, %s, 'logout')""",
-                (user_id, session_id)
-            )
-        else:
-            cursor.execute(
-                """UPDATE user_sessions 
-                   SET status = 'logged_out', session_end = datetime('now')
-                   WHERE id = ? AND user_id = ?""",
-                (session_id, user_id)
-            )
-            
-            cursor.execute(
-                """INSERT INTO activity_log (user_id, session_id, activity_type)
-                   VALUES (?, ?, 'logout')""",
-                (user_id, session_id)
-            )
+        execute_sql(
+            cursor,
+            """UPDATE user_sessions 
+               SET status = 'logged_out', session_end = NOW()
+               WHERE id = %s AND user_id = %s""",
+            (session_id, user_id)
+        )
+        
+        execute_sql(
+            cursor,
+            """INSERT INTO activity_log (user_id, session_id, activity_type)
+               VALUES (%s, %s, 'logout')""",
+            (user_id, session_id)
+        )
         
         conn.commit()
         conn.close()
@@ -4765,16 +5439,7 @@ async def get_active_sessions(token: str):
         conn = get_db()
         cursor = conn.cursor()
         
-        if USE_POSTGRES:
-            cursor.execute("""
-                SELECT s.*, u.name, u.email 
-                FROM user_sessions s
-                JOIN users u ON s.user_id = u.id
-                WHERE s.status IN ('active', 'on_break')
-                ORDER BY s.last_activity DESC
-            """)
-        else:
-            cursor.execute("""
+        execute_sql(cursor, """
                 SELECT s.*, u.name, u.email 
                 FROM user_sessions s
                 JOIN users u ON s.user_id = u.id
@@ -4869,4 +5534,13 @@ except:
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    # Several worker processes so bcrypt and other CPU-bound work doesn't
+    # serialize. Each one has its own DB pool and analytics loop, so the
+    # default stays small; raise WEB_CONCURRENCY (and DB_POOL_TOTAL) deliberately.
+    # uvloop and httptools come with uvicorn[standard]; uvloop has no Windows build
+    uvicorn.run(
+        "app:app", host="0.0.0.0", port=port,
+        workers=WEB_CONCURRENCY,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+    )
\ No newline at end of file
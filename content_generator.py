@@ -1,12 +1,96 @@
 # AI Content Generation Pipeline
 # Generates reading passages and comprehension questions using OpenAI
 
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+import asyncio
 import json
+import logging
 import os
 from typing import List, Dict, Optional
 from readability import analyze_readability
 
+log = logging.getLogger(__name__)
+
+# Prompt text that doesn't depend on the request is built once at import.
+# It goes first (as the system message) so calls share an identical prefix,
+# which is what OpenAI's automatic prompt caching keys on.
+PASSAGE_SYSTEM_TEMPLATE = """You are an expert educational content creator. Focus on ONE topic at a time. Do not blend multiple topics together. Generate passages within the specified word count range.
+
+You will be given a topic and a word count range. Create an educational reading passage about that topic.
+Difficulty Level: {difficulty_level}
+
+IMPORTANT: 
+- Focus ONLY on the given topic
+- Do NOT try to combine with other topics
+- Make it engaging and age-appropriate
+- Use clear, accessible language
+
+Generate a passage that explores the topic in an interesting way.
+
+Return your response as a JSON object with this exact structure:
+{{
+    "title": "Specific title about the topic",
+    "content": "The full passage text (within the word count range, focused on the topic)",
+    "key_concepts": ["concept1", "concept2", "concept3"],
+    "vocabulary_words": [
+        {{"word": "word1", "definition": "simple definition"}},
+        {{"word": "word2", "definition": "simple definition"}}
+    ]
+}}"""
+
+PASSAGE_SYSTEM_PROMPTS = {
+    level: PASSAGE_SYSTEM_TEMPLATE.format(difficulty_level=level)
+    for level in ("beginner", "intermediate", "advanced")
+}
+
+def passage_system_prompt(difficulty_level):
+    """Prebuilt system prompt for a difficulty level (built on the fly for unusual levels)"""
+    prompt = PASSAGE_SYSTEM_PROMPTS.get(difficulty_level)
+    if prompt is None:
+        prompt = PASSAGE_SYSTEM_TEMPLATE.format(difficulty_level=difficulty_level)
+    return prompt
+
+WRITING_FEEDBACK_SYSTEM_PROMPT = """You are a supportive writing tutor for young readers.
+
+You will be given a writing prompt, the student's response and sometimes the passage it refers to.
+Give warm, specific feedback that helps the student improve.
+
+Return your response as a JSON object with this exact structure:
+{
+    "positive_feedback": "What the student did well",
+    "suggestions": ["One concrete improvement", "Another concrete improvement"],
+    "revised_example": "The student's response, lightly revised to show the suggestions",
+    "encouragement": "A short encouraging sentence",
+    "score": 0-100
+}"""
+
+QUESTIONS_SYSTEM_PROMPT = """You are an expert at creating educational assessment questions.
+
+You will be given a reading passage and the number of comprehension questions to create.
+Generate questions that test understanding at different levels (recall, inference, analysis).
+
+Return your response as a JSON object with this exact structure:
+{
+    "questions": [
+        {
+            "question": "Question text here?",
+            "type": "main_idea|detail|inference|vocabulary",
+            "options": ["Option A", "Option B", "Option C", "Option D"],
+            "correct_answer": "The correct option text",
+            "explanation": "Why this is correct",
+            "difficulty": 1-3
+        }
+    ]
+}"""
+
+# JSON mode: the API guarantees a single bare JSON object (the prompts above
+# describe its shape), so responses parse with one json.loads
+JSON_RESPONSE = {"type": "json_object"}
+
+# Cap on chat completions in flight at once from the async methods, so a burst
+# of readers queues here instead of tripping OpenAI's rate limits
+MAX_CONCURRENT_COMPLETIONS = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+
 
 class ContentGenerator:
     def __init__(self, api_key=None):
@@ -17,161 +101,311 @@ class ContentGenerator:
         
         # NEW API - Create client
         self.client = OpenAI(api_key=self.api_key)
+        # Async client for callers running on the event loop (see the *_async methods)
+        self.async_client = AsyncOpenAI(api_key=self.api_key)
+        self.completion_slots = asyncio.Semaphore(MAX_CONCURRENT_COMPLETIONS)
     
     def generate_passage(self, topic, difficulty_level, word_count_min, word_count_max, user_interests):
         """Generate educational passage using GPT-4 with dynamic word count"""
         
+        request = self._passage_request(topic, difficulty_level, word_count_min, word_count_max)
+        try:
+            # NEW API SYNTAX
+            response = self.client.chat.completions.create(**request)
+            return self._parse_passage(
+                response.choices[0].message.content, topic, difficulty_level, word_count_min, word_count_max
+            )
+            
+        except Exception:
+            log.exception("Error generating passage")
+            return self._get_fallback_passage(topic, difficulty_level)
+    
+    async def generate_passage_async(self, topic, difficulty_level, word_count_min, word_count_max, user_interests):
+        """Async version of generate_passage - doesn't block the event loop while waiting on OpenAI"""
+        
+        request = self._passage_request(topic, difficulty_level, word_count_min, word_count_max)
+        try:
+            async with self.completion_slots:
+                response = await self.async_client.chat.completions.create(**request)
+            return self._parse_passage(
+                response.choices[0].message.content, topic, difficulty_level, word_count_min, word_count_max
+            )
+            
+        except Exception:
+            log.exception("Error generating passage")
+            return self._get_fallback_passage(topic, difficulty_level)
+    
+    async def stream_passage(self, topic, difficulty_level, word_count_min, word_count_max, user_interests):
+        """Streaming version of generate_passage_async.
+        
+        Yields ("text", chunk) as the passage body arrives, then ("passage", passage_data)
+        once the completion is finished (the fallback passage if generation fails).
+        """
+        
+        request = self._passage_request(topic, difficulty_level, word_count_min, word_count_max)
+        raw = ""
+        sent = 0
+        try:
+            # The slot is held until the stream finishes (or the client goes away)
+            async with self.completion_slots:
+                stream = await self.async_client.chat.completions.create(**request, stream=True)
+                async for chunk in stream:
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    raw += chunk.choices[0].delta.content
+                    # The model answers in JSON, so only forward the "content" field
+                    text = self._partial_json_string(raw, "content")
+                    if len(text) > sent:
+                        yield "text", text[sent:]
+                        sent = len(text)
+            passage_data = self._parse_passage(raw, topic, difficulty_level, word_count_min, word_count_max)
+            
+        except Exception:
+            log.exception("Error streaming passage")
+            passage_data = self._get_fallback_passage(topic, difficulty_level)
+        
+        yield "passage", passage_data
+    
+    @staticmethod
+    def _partial_json_string(raw, key):
+        """Decoded value of a JSON string field in possibly-incomplete JSON text, so far"""
+        
+        marker = raw.find(f'"{key}"')
+        if marker == -1:
+            return ""
+        colon = raw.find(":", marker)
+        start = raw.find('"', colon + 1) if colon != -1 else -1
+        if start == -1:
+            return ""
+        
+        # Walk to the closing quote, or the end of what has arrived, stopping
+        # short of an escape sequence that was cut off mid-chunk
+        end = start + 1
+        while end < len(raw) and raw[end] != '"':
+            if raw[end] == "\\":
+                step = 6 if raw[end + 1:end + 2] == "u" else 2
+                if end + step > len(raw):
+                    break
+                end += step
+            else:
+                end += 1
+        body = raw[start + 1:end]
+        try:
+            return json.loads(f'"{body}"')
+        except ValueError:
+            return ""
+    
+    def _passage_request(self, topic, difficulty_level, word_count_min, word_count_max):
+        """Build the chat completion arguments for a passage"""
+        
         # Calculate target from range
         import random
         target_words = random.randint(word_count_min, word_count_max)
         
-        # ========== UPDATED PROMPT ==========
-        # Build focused prompt - ONE TOPIC PER LESSON
-        prompt = f"""Create an educational reading passage about {topic}.
-    Difficulty Level: {difficulty_level}
-    Word Count: Between {word_count_min} and {word_count_max} words (aim for approximately {target_words} words)
-
-    IMPORTANT: 
-    - Focus ONLY on {topic}
-    - Do NOT try to combine with other topics
-    - Make it engaging and age-appropriate
-    - Use clear, accessible language
-
-    Generate a passage that explores {topic} in an interesting way.
-
-    Return your response as a JSON object with this exact structure:
-    {{
-        "title": "Specific title about {topic}",
-        "content": "The full passage text (approximately {target_words} words, focused on {topic})",
-        "key_concepts": ["concept1", "concept2", "concept3"],
-        "vocabulary_words": [
-            {{"word": "word1", "definition": "simple definition"}},
-            {{"word": "word2", "definition": "simple definition"}}
-        ]
-    }}"""
-        # ===================================
+        # Only the topic and length vary per call; the instructions come from
+        # the prebuilt system prompt so every request shares the same prefix
+        prompt = f"""Topic: {topic}
+Word Count: Between {word_count_min} and {word_count_max} words (aim for approximately {target_words} words)"""
+        
+        return {
+            "model": "gpt-4-turbo-preview",
+            "messages": [
+                {"role": "system", "content": passage_system_prompt(difficulty_level)},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.8,
+            "max_tokens": 2000,  # Increased to accommodate longer passages
+            "response_format": JSON_RESPONSE,
+            "timeout": 60
+        }
+    
+    def _parse_passage(self, content, topic, difficulty_level, word_count_min, word_count_max):
+        """Turn a passage completion's text into passage_data with readability metadata"""
+        
+        # JSON mode (see JSON_RESPONSE) returns a bare object - no fences to strip
+        passage_data = json.loads(content)
+        
+        # Analyze readability
+        readability = analyze_readability(passage_data['content'])
+        
+        # Add metadata - TAG WITH SINGLE TOPIC
+        passage_data.update({
+            "source": "AI",
+            "topic_tags": [topic],  # ← ONLY the main topic, not all interests
+            "word_count": readability['word_count'],
+            "readability_score": readability['flesch_kincaid_grade'],
+            "flesch_ease": readability['flesch_reading_ease'],
+            "difficulty_level": difficulty_level,
+            "estimated_minutes": readability['estimated_minutes'],
+            "actual_difficulty": readability['difficulty_level'],
+            "grade_band": readability['grade_band'],
+            "target_word_range": f"{word_count_min}-{word_count_max}"  # Track the range used
+        })
+        
+        log.debug("Generated passage %r: %s words (target %s-%s)",
+                  passage_data['title'], readability['word_count'], word_count_min, word_count_max)
+        
+        return passage_data
+    
+    def generate_comprehension_questions(self, passage_text, passage_title, num_questions=3):
+        """Generate comprehension questions using GPT-4"""
+        
         try:
             # NEW API SYNTAX
             response = self.client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert educational content creator. Focus on ONE topic at a time. Do not blend multiple topics together. Generate passages within the specified word count range."
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.8,
-                max_tokens=2000,  # Increased to accommodate longer passages
-                timeout=60
+                **self._questions_request(passage_text, passage_title, num_questions)
             )
+            return self._parse_questions(response)
             
-            content = response.choices[0].message.content
-            
-            # Extract JSON
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-            
-            passage_data = json.loads(content)
-            
-            # Analyze readability
-            from readability import analyze_readability
-            readability = analyze_readability(passage_data['content'])
-            
-            # Add metadata - TAG WITH SINGLE TOPIC
-            passage_data.update({
-                "source": "AI",
-                "topic_tags": [topic],  # ← ONLY the main topic, not all interests
-                "word_count": readability['word_count'],
-                "readability_score": readability['flesch_kincaid_grade'],
-                "flesch_ease": readability['flesch_reading_ease'],
-                "difficulty_level": difficulty_level,
-                "estimated_minutes": readability['estimated_minutes'],
-                "actual_difficulty": readability['difficulty_level'],
-                "grade_band": readability['grade_band'],
-                "target_word_range": f"{word_count_min}-{word_count_max}"  # Track the range used
-            })
-            
-            print(f"✓ Generated passage: '{passage_data['title']}'")
-            print(f"✓ Word count: {readability['word_count']} (target: {word_count_min}-{word_count_max})")
-            
-            return passage_data
-            
-        except Exception as e:
-            print(f"Error generating passage: {e}")
-            import traceback
-            traceback.print_exc()
-            return self._get_fallback_passage(topic, difficulty_level)
+        except Exception:
+            log.exception("Error generating questions")
+            return self._get_fallback_questions()
+    
+    async def generate_comprehension_questions_async(self, passage_text, passage_title, num_questions=3):
+        """Async version of generate_comprehension_questions"""
+        
+        try:
+            async with self.completion_slots:
+                response = await self.async_client.chat.completions.create(
+                    **self._questions_request(passage_text, passage_title, num_questions)
+                )
+            return self._parse_questions(response)
             
-       
+        except Exception:
+            log.exception("Error generating questions")
+            return self._get_fallback_questions()
     
-    def generate_comprehension_questions(self, passage_text, passage_title, num_questions=3):
-        """Generate comprehension questions using GPT-4"""
+    def _questions_request(self, passage_text, passage_title, num_questions):
+        """Build the chat completion arguments for comprehension questions"""
         
-        prompt = f"""Based on the following passage, create {num_questions} comprehension questions.
+        prompt = f"""Create {num_questions} comprehension questions for this passage.
 
 Passage Title: {passage_title}
 
 Passage:
-{passage_text}
-
-Generate questions that test understanding at different levels (recall, inference, analysis).
-
-Return your response as a JSON array with this exact structure:
-[
-    {{
-        "question": "Question text here?",
-        "type": "main_idea|detail|inference|vocabulary",
-        "options": ["Option A", "Option B", "Option C", "Option D"],
-        "correct_answer": "The correct option text",
-        "explanation": "Why this is correct",
-        "difficulty": 1-3
-    }}
-]"""
+{passage_text}"""
 
+        return {
+            "model": "gpt-4-turbo-preview",
+            "messages": [
+                {"role": "system", "content": QUESTIONS_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 1000,
+            "response_format": JSON_RESPONSE,
+            "timeout": 60
+        }
+    
+    def _parse_questions(self, response):
+        """Turn a questions completion into a list with shuffled options"""
+        
+        content = response.choices[0].message.content
+        
+        questions = json.loads(content)["questions"]
+        # ========== ADD THIS SECTION ==========
+        # Shuffle options for each question to randomize correct answer position
+        import random
+        for q in questions:
+            if 'options' in q and isinstance(q['options'], list):
+                # Shuffle the options
+                random.shuffle(q['options'])
+        # =====================================
+        
+        return questions
+    
+    def provide_writing_feedback(self, prompt, user_response, passage_context=None):
+        """Score a writing response and suggest improvements"""
+        
         try:
-            # NEW API SYNTAX
             response = self.client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert at creating educational assessment questions."
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=1000,
-                timeout=60
+                **self._writing_feedback_request(prompt, user_response, passage_context)
             )
+            return self._parse_writing_feedback(response.choices[0].message.content)
             
-            content = response.choices[0].message.content
-            
-            # Extract JSON
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-            
-            questions = json.loads(content)
-            # ========== ADD THIS SECTION ==========
-            # Shuffle options for each question to randomize correct answer position
-            import random
-            for q in questions:
-                if 'options' in q and isinstance(q['options'], list):
-                    # Shuffle the options
-                    random.shuffle(q['options'])
-            # =====================================
-            
-            return questions
-            
-        except Exception as e:
-            print(f"Error generating questions: {e}")
-            import traceback
-            traceback.print_exc()
-            return self._get_fallback_questions()
+        except Exception:
+            log.exception("Error generating writing feedback")
+            return self._get_fallback_writing_feedback(user_response)
+    
+    async def submit_writing_feedback_batch(self, submissions):
+        """Queue writing feedback through the OpenAI Batch API (half price, separate rate limits).
+        
+        submissions is a list of (custom_id, prompt, user_response, passage_context).
+        Returns the batch id to pass to fetch_writing_feedback_batch later.
+        """
+        
+        lines = [
+            json.dumps({
+                "custom_id": str(custom_id),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._writing_feedback_request(prompt, user_response, passage_context, for_batch=True)
+            })
+            for custom_id, prompt, user_response, passage_context in submissions
+        ]
+        batch_file = await self.async_client.files.create(
+            file=("writing_feedback.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = await self.async_client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        return batch.id
+    
+    async def fetch_writing_feedback_batch(self, batch_id):
+        """Check a feedback batch. Returns (status, {custom_id: feedback}) - results only once it has completed"""
+        
+        batch = await self.async_client.batches.retrieve(batch_id)
+        if batch.status != "completed" or not batch.output_file_id:
+            return batch.status, {}
+        
+        output = await self.async_client.files.content(batch.output_file_id)
+        results = {}
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            try:
+                content = item["response"]["body"]["choices"][0]["message"]["content"]
+                results[item["custom_id"]] = self._parse_writing_feedback(content)
+            except (KeyError, IndexError, TypeError, ValueError):
+                log.warning("No usable feedback for batch item %s", item.get("custom_id"))
+        return batch.status, results
+    
+    def _writing_feedback_request(self, prompt, user_response, passage_context, for_batch=False):
+        """Build the chat completion arguments for writing feedback"""
+        
+        message = f"""Writing Prompt: {prompt}
+
+Student Response:
+{user_response}"""
+        if passage_context:
+            message += f"""
+
+Passage:
+{passage_context}"""
+        
+        request = {
+            "model": "gpt-4-turbo-preview",
+            "messages": [
+                {"role": "system", "content": WRITING_FEEDBACK_SYSTEM_PROMPT},
+                {"role": "user", "content": message}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 1000,
+            "response_format": JSON_RESPONSE
+        }
+        # timeout is a client option, not part of the request body a batch line carries
+        if not for_batch:
+            request["timeout"] = 60
+        return request
+    
+    def _parse_writing_feedback(self, content):
+        """Turn a writing feedback completion's text into the feedback dict"""
+        
+        return json.loads(content)
     
     def _extract_topics(self, main_topic, interests):
         """Extract relevant topic tags"""
@@ -195,6 +429,16 @@ Return your response as a JSON array with this exact structure:
             "vocabulary_words": []
         }
     
+    def _get_fallback_writing_feedback(self, user_response):
+        """Return generic feedback if AI generation fails"""
+        return {
+            "positive_feedback": "Great job getting your ideas down!",
+            "suggestions": ["Try adding more details to support your main point."],
+            "revised_example": user_response,
+            "encouragement": "Keep writing - you're doing well!",
+            "score": 75
+        }
+    
     def _get_fallback_questions(self):
         """Return basic fallback questions"""
         return [
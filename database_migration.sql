@@ -23,7 +23,7 @@ CREATE TABLE IF NOT EXISTS passages (
     title VARCHAR(255) NOT NULL,
     content TEXT NOT NULL,
     source VARCHAR(50) NOT NULL,
-    topic_tags TEXT,
+    topic_tags JSONB,
     word_count INTEGER NOT NULL,
     readability_score REAL,
     flesch_ease REAL,
@@ -41,6 +41,7 @@ CREATE INDEX IF NOT EXISTS idx_passages_difficulty ON passages(difficulty_level)
 CREATE INDEX IF NOT EXISTS idx_passages_word_count ON passages(word_count);
 CREATE INDEX IF NOT EXISTS idx_passages_approved ON passages(approved);
 CREATE INDEX IF NOT EXISTS idx_passages_source ON passages(source);
+CREATE INDEX IF NOT EXISTS idx_passages_topic_tags_gin ON passages USING GIN (topic_tags);
 
 -- ============================================
 -- STEP 3: Create Session Logs Table
@@ -66,6 +67,8 @@ CREATE INDEX IF NOT EXISTS idx_session_user ON session_logs(user_id);
 CREATE INDEX IF NOT EXISTS idx_session_passage ON session_logs(passage_id);
 CREATE INDEX IF NOT EXISTS idx_session_completed ON session_logs(completed_at);
 CREATE INDEX IF NOT EXISTS idx_session_status ON session_logs(completion_status);
+CREATE INDEX IF NOT EXISTS idx_session_user_started ON session_logs(user_id, started_at DESC);
+CREATE INDEX IF NOT EXISTS idx_session_started ON session_logs(started_at) INCLUDE (user_id);
 
 -- ============================================
 -- STEP 4: Create Comprehension Questions Table
@@ -108,6 +111,7 @@ CREATE TABLE IF NOT EXISTS writing_exercises (
 
 CREATE INDEX IF NOT EXISTS idx_writing_user ON writing_exercises(user_id);
 CREATE INDEX IF NOT EXISTS idx_writing_submitted ON writing_exercises(submitted_at);
+CREATE INDEX IF NOT EXISTS idx_writing_user_submitted ON writing_exercises(user_id, submitted_at DESC);
 
 -- ============================================
 -- STEP 6: Create Vocabulary Tracker Table
@@ -150,6 +154,24 @@ CREATE TABLE IF NOT EXISTS discussions (
 CREATE INDEX IF NOT EXISTS idx_discussion_user ON discussions(user_id);
 CREATE INDEX IF NOT EXISTS idx_discussion_passage ON discussions(passage_id);
 CREATE INDEX IF NOT EXISTS idx_discussion_created ON discussions(created_at);
+-- Paged history for one user and passage
+CREATE INDEX IF NOT EXISTS idx_discussion_user_passage_id ON discussions(user_id, passage_id, id);
+
+-- ============================================
+-- STEP 7b: Create Assessment Answers Table
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS assessment_answers (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    question_id INTEGER,
+    category VARCHAR(50),
+    answer TEXT,
+    submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_assessment_answers_user ON assessment_answers(user_id, submitted_at DESC);
 
 -- ============================================
 -- STEP 8: Insert Sample Passages (Optional)
@@ -210,7 +232,9 @@ SELECT 'writing_exercises', COUNT(*) FROM writing_exercises
 UNION ALL
 SELECT 'vocabulary_tracker', COUNT(*) FROM vocabulary_tracker
 UNION ALL
-SELECT 'discussions', COUNT(*) FROM discussions;
+SELECT 'discussions', COUNT(*) FROM discussions
+UNION ALL
+SELECT 'assessment_answers', COUNT(*) FROM assessment_answers;
 
 -- ============================================
 -- MIGRATION COMPLETE!
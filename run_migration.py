@@ -31,7 +31,7 @@ def run_migration():
                 title VARCHAR(255) NOT NULL,
                 content TEXT NOT NULL,
                 source VARCHAR(50) NOT NULL,
-                topic_tags TEXT,
+                topic_tags JSONB,
                 word_count INTEGER NOT NULL,
                 readability_score REAL,
                 flesch_ease REAL,
@@ -52,6 +52,12 @@ def run_migration():
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_passages_difficulty ON passages(difficulty_level)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_passages_word_count ON passages(word_count)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_passages_approved ON passages(approved)")
+        # Reuse lookup for generated passages in /api/read/sample
+        cursor.execute(
+            """CREATE INDEX IF NOT EXISTS idx_passages_cache_lookup
+               ON passages (difficulty_level, word_count) WHERE approved"""
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_passages_topic_tags_gin ON passages USING GIN (topic_tags)")
         conn.commit()
         print("✓ passages indexes created")
         
@@ -75,6 +81,7 @@ def run_migration():
         print("✓ passage_questions table created")
         
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_questions_passage ON passage_questions(passage_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_questions_passage_type ON passage_questions(passage_id, question_type)")
         conn.commit()
         print("✓ passage_questions index created")
         
@@ -102,6 +109,15 @@ def run_migration():
         
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_session_user ON session_logs(user_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_session_passage ON session_logs(passage_id)")
+        # Completed sessions by date for the admin analytics
+        cursor.execute(
+            """CREATE INDEX IF NOT EXISTS idx_session_completed_started
+               ON session_logs (started_at) INCLUDE (user_id, passage_id)
+               WHERE completion_status = 'completed'"""
+        )
+        # A student's recent sessions, and who was active in the last 7 days
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_session_user_started ON session_logs(user_id, started_at DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_session_started ON session_logs(started_at) INCLUDE (user_id)")
         conn.commit()
         print("✓ session_logs indexes created")
         
@@ -123,6 +139,9 @@ def run_migration():
                 FOREIGN KEY (passage_id) REFERENCES passages(id)
             )
         """)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_writing_user_submitted ON writing_exercises(user_id, submitted_at DESC)"
+        )
         conn.commit()
         print("✓ writing_exercises table created")
         
@@ -160,9 +179,32 @@ def run_migration():
                 FOREIGN KEY (passage_id) REFERENCES passages(id)
             )
         """)
+        cursor.execute(
+            """CREATE INDEX IF NOT EXISTS idx_discussion_user_passage_id
+               ON discussions (user_id, passage_id, id)"""
+        )
         conn.commit()
         print("✓ discussions table created")
         
+        # Create assessment_answers table
+        print("\nCreating assessment_answers table...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS assessment_answers (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                question_id INTEGER,
+                category VARCHAR(50),
+                answer TEXT,
+                submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        """)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_assessment_answers_user ON assessment_answers(user_id, submitted_at DESC)"
+        )
+        conn.commit()
+        print("✓ assessment_answers table created")
+        
         # Verify all tables
         print("\nVerifying tables...")
         cursor.execute("""
@@ -170,7 +212,8 @@ def run_migration():
             FROM information_schema.tables 
             WHERE table_schema = 'public' 
             AND table_name IN ('passages', 'passage_questions', 'session_logs', 
-                               'writing_exercises', 'vocabulary_tracker', 'discussions')
+                               'writing_exercises', 'vocabulary_tracker', 'discussions',
+                               'assessment_answers')
             ORDER BY table_name
         """)
         
@@ -183,10 +226,10 @@ def run_migration():
         for table in tables:
             print(f"  ✓ {table}")
         
-        if len(tables) == 6:
+        if len(tables) == 7:
             print("\n✓ All Phase 2 tables successfully created!")
         else:
-            print(f"\n⚠ Warning: Expected 6 tables, but only created {len(tables)}")
+            print(f"\n⚠ Warning: Expected 7 tables, but only created {len(tables)}")
         
         conn.close()
         return True